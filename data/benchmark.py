@@ -0,0 +1,253 @@
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import convert_to_json
+from synthetic_mjlog import write_corpus
+from narrator import MahjongNarrator
+
+# ⏱️ 数据流水线基准测试
+#
+# 用 synthetic_mjlog 生成固定种子的合成牌谱，对每个阶段分别计时:
+#   read        读文件 (字节)
+#   decompress  gzip 解压 (仅压缩文件)
+#   parse       流式解析出事件 (iter_mjlog_events，内存中的明文 XML)
+#   parse_tree  旧的整体 fromstring 解析，用于对比
+#   encode      事件 -> 紧凑 JSON 字符串
+#   write       JSON 写入磁盘
+#   convert     单文件端到端转换 (convert_file)
+#   narrate     中文解说渲染
+#   features    特征张量生成 (需要 numpy)
+#   binary      二进制事件记录编码 (需要 numpy)
+# 以及每局的解析峰值内存 (tracemalloc)。
+#
+# 结果输出为 JSON；指定 --baseline 时与之前的结果对比，吞吐下降超过阈值即视为回归 (退出码 1)。
+#
+# 用法:
+#   python data/benchmark.py --games 200 --output bench.json
+#   python data/benchmark.py --games 200 --baseline bench.json
+
+NUM_GAMES = 100
+SEED = 0
+REPEAT = 3                 # 每个阶段重复次数，取最快一次
+REGRESSION_THRESHOLD = 0.10  # 吞吐下降超过 10% 视为回归
+
+
+def _timed(fn, repeat):
+    """重复执行 fn，返回最快一次的耗时 (秒) 与最后一次的返回值"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _record(results, name, seconds, games, nbytes=None, items=None, unit=None):
+    entry = {"seconds": round(seconds, 6), "games_per_s": round(games / seconds, 2) if seconds else None}
+    if nbytes is not None:
+        entry["mb_per_s"] = round(nbytes / 1e6 / seconds, 2) if seconds else None
+    if items is not None:
+        entry[f"{unit}_per_s"] = round(items / seconds, 2) if seconds else None
+    results[name] = entry
+    print(f"  {name:<11} {seconds * 1000:9.1f} ms  " + "  ".join(
+        f"{k}={v}" for k, v in entry.items() if k != "seconds"))
+
+
+def run_benchmarks(num_games=NUM_GAMES, seed=SEED, repeat=REPEAT, work_dir=None):
+    """生成语料并运行全部阶段，返回结果字典"""
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="ron_bench_")
+    raw_dir = os.path.join(work_dir, "raw")
+    out_dir = os.path.join(work_dir, "json")
+    os.makedirs(out_dir, exist_ok=True)
+    results = {}
+
+    try:
+        print(f"生成 {num_games} 局合成牌谱 (seed={seed}) ...")
+        paths = write_corpus(raw_dir, num_games, seed=seed, compress="mixed")
+
+        # --- read ---
+        def read_all():
+            blobs = []
+            for p in paths:
+                with open(p, "rb") as f:
+                    blobs.append(f.read())
+            return blobs
+        seconds, blobs = _timed(read_all, repeat)
+        raw_bytes = sum(len(b) for b in blobs)
+        _record(results, "read", seconds, num_games, raw_bytes)
+
+        # --- decompress ---
+        compressed = [b for b in blobs if b[:2] == b"\x1f\x8b"]
+        seconds, _ = _timed(lambda: [gzip.decompress(b) for b in compressed], repeat)
+        _record(results, "decompress", seconds, len(compressed), sum(len(b) for b in compressed))
+        xmls = [gzip.decompress(b) if b[:2] == b"\x1f\x8b" else b for b in blobs]
+        xml_bytes = sum(len(x) for x in xmls)
+
+        # --- parse (流式) ---
+        parse = convert_to_json.iter_mjlog_events
+        seconds, games = _timed(lambda: [list(parse(io.BytesIO(x))) for x in xmls], repeat)
+        n_events = sum(len(g) for g in games)
+        _record(results, "parse", seconds, num_games, xml_bytes, n_events, "events")
+
+        # --- parse_tree (整体解析，对比用) ---
+        def parse_tree():
+            for x in xmls:
+                root = ET.fromstring(x.decode("utf-8"))
+                [convert_to_json._element_to_event(c.tag, c.attrib) for c in root]
+        seconds, _ = _timed(parse_tree, repeat)
+        _record(results, "parse_tree", seconds, num_games, xml_bytes, n_events, "events")
+
+        # --- encode ---
+        def encode_all():
+            out = []
+            for g in games:
+                buf = io.StringIO()
+                convert_to_json.write_events_json(g, buf)
+                out.append(buf.getvalue())
+            return out
+        seconds, encoded = _timed(encode_all, repeat)
+        json_bytes = sum(len(s) for s in encoded)
+        _record(results, "encode", seconds, num_games, json_bytes)
+
+        # --- write ---
+        def write_all():
+            for i, s in enumerate(encoded):
+                with open(os.path.join(out_dir, f"{i}.json"), "w", encoding="utf-8") as f:
+                    f.write(s)
+        seconds, _ = _timed(write_all, repeat)
+        _record(results, "write", seconds, num_games, json_bytes)
+
+        # --- convert (端到端，单进程) ---
+        saved_json_dir = convert_to_json.JSON_DIR
+        convert_to_json.JSON_DIR = out_dir
+        try:
+            seconds, _ = _timed(lambda: [convert_to_json.convert_file((p, None, "json")) for p in paths], repeat)
+        finally:
+            convert_to_json.JSON_DIR = saved_json_dir
+        _record(results, "convert", seconds, num_games, raw_bytes)
+
+        # --- narrate ---
+        narrator = MahjongNarrator()
+        def narrate_all():
+            sink = io.StringIO()
+            for g in games:
+                narrator.narrate(g, sink)
+            return sink.tell()
+        seconds, text_len = _timed(narrate_all, repeat)
+        _record(results, "narrate", seconds, num_games, None, n_events, "events")
+
+        # --- features / binary (需要 numpy) ---
+        try:
+            from features import FeatureTracker
+            import event_store
+        except ImportError:
+            print("  (未安装 numpy，跳过 features / binary)")
+        else:
+            tracker = FeatureTracker()
+            seconds, n_samples = _timed(lambda: sum(len(tracker.encode_game(g)[2]) for g in games), repeat)
+            _record(results, "features", seconds, num_games, None, n_samples, "samples")
+            seconds, _ = _timed(lambda: [event_store.encode_events(g) for g in games], repeat)
+            _record(results, "binary", seconds, num_games, None, n_events, "events")
+
+        # --- 每局解析峰值内存 ---
+        sample = paths[:min(len(paths), 20)]
+        peaks = {}
+        for name, fn in (("stream", lambda p: list(convert_to_json.iter_mjlog_events(p))),
+                         ("tree", _parse_whole_file)):
+            worst = 0
+            for p in sample:
+                tracemalloc.start()
+                fn(p)
+                worst = max(worst, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            peaks[name] = worst
+        results["peak_memory_per_game"] = {"stream_bytes": peaks["stream"], "tree_bytes": peaks["tree"]}
+        print(f"  peak/game   stream={peaks['stream'] / 1e6:.2f} MB  tree={peaks['tree'] / 1e6:.2f} MB")
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "games": num_games,
+            "seed": seed,
+            "repeat": repeat,
+            "events": n_events,
+            "raw_bytes": raw_bytes,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def _parse_whole_file(path):
+    """旧实现: 整体读入 + 解压 + 解码 + fromstring，用于内存对比"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw.startswith(b"\x1f\x8b"):
+        raw = gzip.decompress(raw)
+    root = ET.fromstring(raw.decode("utf-8"))
+    return [convert_to_json._element_to_event(c.tag, c.attrib) for c in root]
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    对比两次结果的吞吐 (games_per_s)，返回回归的阶段列表 [(阶段, 基线, 当前, 变化比例)]
+    """
+    regressions = []
+    print(f"\n与基线对比 (阈值 {threshold:.0%}):")
+    for name, entry in current["results"].items():
+        base = baseline.get("results", {}).get(name, {})
+        cur_rate, base_rate = entry.get("games_per_s"), base.get("games_per_s")
+        if not cur_rate or not base_rate:
+            continue
+        change = cur_rate / base_rate - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  <-- 回归"
+            regressions.append((name, base_rate, cur_rate, change))
+        print(f"  {name:<11} {base_rate:10.1f} -> {cur_rate:10.1f} games/s ({change:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="数据流水线基准测试")
+    parser.add_argument("--games", type=int, default=NUM_GAMES, help="合成牌谱数量")
+    parser.add_argument("--seed", type=int, default=SEED, help="随机种子")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="每个阶段的重复次数")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--baseline", help="基线结果 JSON，用于回归对比")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="回归阈值 (比例)")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.games, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("games") != args.games:
+            print("[提示] 基线的语料规模不同，对比结果仅供参考")
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,18 +2,59 @@ import os
 import glob
 import gzip
 import json
+import time
+import hashlib
+import multiprocessing
 import xml.etree.ElementTree as ET
+from tile_codec import ID_CODES
+from meld_codec import decode_meld, NAKI_TYPE_NAMES
+
+try:
+    import event_store  # 二进制输出模式依赖 numpy，缺失时仍可使用 JSON 模式
+except ImportError:
+    event_store = None
 
 # 📂 路径配置
 # RAW_DIR: 存放从天凤下载的 .mjlog 文件的目录
 RAW_DIR = "./data/raw_mjlog"
 # JSON_DIR: 转换后的 .json 文件存放目录
 JSON_DIR = "./data/json_logs"
+# MANIFEST_PATH: 转换清单，记录每个源文件的 size/mtime/sha1，重跑时只处理新增或变化的文件
+MANIFEST_PATH = "./data/convert_manifest.json"
+# BIN_DIR: 二进制分片输出目录 (OUTPUT_FORMAT = "binary" 时使用，格式见 event_store.py)
+BIN_DIR = "./data/bin_logs"
+BIN_MANIFEST_PATH = os.path.join(BIN_DIR, "manifest.json")
+
+# 📤 输出格式
+# "json":   每局一个紧凑 JSON 文件 (写入 JSON_DIR)
+# "binary": 定长二进制事件记录，按分片写入 BIN_DIR，可内存映射随机读取 (需要 numpy)
+OUTPUT_FORMAT = "json"
+
+# ⚙️ 并行配置
+# NUM_WORKERS: 转换进程数 (设为 1 则在当前进程串行转换)
+NUM_WORKERS = os.cpu_count() or 1
+# CHUNK_SIZE: 每次派发给一个进程的文件数，过小会增加进程间通信开销
+CHUNK_SIZE = 64
+# PROGRESS_EVERY: 每处理多少个文件汇总输出一次进度并保存清单
+PROGRESS_EVERY = 1000
+# READ_SIZE: 流式解析时每次喂给 XML 解析器的字节数
+READ_SIZE = 1 << 16
+
+# 摸牌/切牌标签首字母到玩家ID的映射关系
+PLAYER_MAP = {
+    'T':0, 'D':0,  # 玩家0 (东家)
+    'U':1, 'E':1,  # 玩家1 (南家)
+    'V':2, 'F':2,  # 玩家2 (西家)
+    'W':3, 'G':3   # 玩家3 (北家)
+}
 
-def setup_dir():
+# 紧凑 JSON 编码器：去除空格和换行，减小文件体积
+_COMPACT_ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+def setup_dir(out_dir=JSON_DIR):
     """如果输出目录不存在，创建一个"""
-    if not os.path.exists(JSON_DIR):
-        os.makedirs(JSON_DIR)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
 
 def tenhou_tile_to_mjai(tile_id):
     """
@@ -27,19 +68,11 @@ def tenhou_tile_to_mjai(tile_id):
     - 108-135: 字牌 (Zi) -> 东南西北白发中 (1z-7z)
     
     举例: tile_id=0 是 1万(1m), tile_id=4 是 2万(2m)
-    注意：这里暂未处理"赤宝牌"(Red Dora, 通常是 id 为 16, 52, 88 的牌)，
-    如果需要区分赤牌，需要额外逻辑。
+    注意：输出不区分"赤宝牌"(Red Dora, id 为 16, 52, 88 的牌)，
+    需要区分时使用 tile_codec.id_to_code(tile_id, red=True)。
+    实际转换是对 tile_codec 预计算表的查表。
     """
-    tm = tile_id // 4  # 除以4，算出它是哪一种牌(0-33)
-    
-    if tm < 9:
-        return f"{tm + 1}m"  # 万子
-    elif tm < 18:
-        return f"{tm - 9 + 1}p" # 筒子
-    elif tm < 27:
-        return f"{tm - 18 + 1}s" # 条子
-    else:
-        return f"{tm - 27 + 1}z" # 字牌
+    return ID_CODES[tile_id]
 
 def parse_xml_to_json(file_path):
     """解析天凤 XML 格式的麻将牌谱文件，转换为 JSON 格式
@@ -51,229 +84,457 @@ def parse_xml_to_json(file_path):
         包含游戏事件列表的 JSON 数据，解析失败返回 None
     """
     try:
-        # --- 阶段1: 读取文件内容 ---
-        content = None
-        try:
-            # 以二进制模式读取，因为文件可能是 gzip 压缩格式
-            # 天凤服务器传输时会压缩文件以减小体积
-            with open(file_path, 'rb') as f:
-                raw_data = f.read()
-                
-                # 检查文件头魔数 (Magic Number) 来判断文件类型
-                # gzip 格式的标准魔数为 0x1f 0x8b
-                if raw_data.startswith(b'\x1f\x8b'):
-                    # 如果是压缩文件，先解压再解码为 UTF-8 文本
-                    content = gzip.decompress(raw_data).decode('utf-8')
-                else:
-                    # 如果不是压缩文件，直接将字节数据解码为 UTF-8 文本
-                    content = raw_data.decode('utf-8')
-        except Exception as e:
-            # 文件读取失败，打印错误信息并返回 None
-            print(f"读取文件失败: {file_path}, {e}")
-            return None
-
-        # --- 阶段2: 解析 XML 结构 ---
-        try:
-            # 将 XML 字符串解析为 ElementTree 树结构
-            # 便于后续遍历和提取数据
-            root = ET.fromstring(content)
-        except ET.ParseError:
-            # XML 格式错误，返回 None
-            return None
-
-        # 初始化游戏日志列表，用于存储所有解析出的游戏事件
-        game_log = []
-        
-        # --- 阶段3: 遍历 XML 节点，解析事件流 ---
-        # 天凤的 XML 采用扁平化结构，每个子节点代表一个游戏动作
-        # 例如: <INIT>, <T12>, <D30>, <N>, <REACH> 等
-        for child in root:
-            # 提取节点的标签名和属性
-            tag = child.tag      # 标签名 (如 INIT, T12, D30, N, REACH)
-            attrs = child.attrib # 属性字典 (如 seed="...", hai0="...")
-            
-            # 初始化当前事件字典
-            event = {}
-            
-            # ==========================================
-            # 事件类型1: 一局开始 (INIT)
-            # ==========================================
-            if tag == 'INIT':
-                # seed 属性格式: "局数,本场,供托,骰子1,骰子2,宝牌指示牌ID"
-                # 例如: "4,0,0,2,4,16" 表示南一局，0本场，0供托，骰子2和4，宝牌指示牌ID为16
-                seed = [int(x) for x in attrs['seed'].split(',')]
-                
-                # 计算场风 (Prevalent Wind)
-                # 天凤用数字表示局数，每4局换一次场风：
-                # 局数 0-3: 东场 (East)
-                # 局数 4-7: 南场 (South)
-                # 局数 8-11: 西场 (West)
-                # 局数 12-15: 北场 (North)
-                round_idx = seed[0] // 4
-                winds = ['E', 'S', 'W', 'N']  # 东, 南, 西, 北
-                bakaze = winds[round_idx % 4]
-                
-                # 构造一局开始事件
-                event = {
-                    "type": "start_kyoku",      # 事件类型
-                    "bakaze": bakaze,             # 场风 (E/S/W/N)
-                    "kyoku": (seed[0] % 4) + 1,   # 第几局 (1-4)
-                    "honba": seed[1],             # 本场数 (连庄次数)
-                    "kyotaku": seed[2],           # 供托/立直棒数量
-                    "dora_marker": tenhou_tile_to_mjai(seed[5]), # 宝牌指示牌
-                    "tehais": []                  # 四位玩家的初始手牌
-                }
-                
-                # 解析四位玩家的初始手牌
-                # 属性名格式: hai0, hai1, hai2, hai3 (分别对应东、南、西、北家)
-                # 值格式: "11,22,33,44..." 的逗号分隔字符串
-                for i in range(4):
-                    hai_str = attrs.get(f'hai{i}')
-                    if hai_str:
-                        # 将牌ID字符串转换为牌的代码列表
-                        # tenhou_tile_to_mjai 函数将天凤的牌ID转换为标准麻将牌码
-                        tiles = [tenhou_tile_to_mjai(int(t)) for t in hai_str.split(',')]
-                        event['tehais'].append(tiles)
-                    else:
-                        # 如果该位置没有手牌数据（可能是三人对局或断线），添加空列表
-                        event['tehais'].append([])
-                
-            # ==========================================
-            # 事件类型2: 鸣牌 (N) - 吃、碰、大明杠
-            # ==========================================
-            elif tag == 'N':
-                # N 标签表示玩家进行副露（鸣牌）操作
-                # 属性说明:
-                #   who: 进行鸣牌的玩家ID (0-3，分别代表东、南、西、北家)
-                #   m: 位掩码，编码了详细的鸣牌信息
-                #      包含: 吃了哪张牌、从谁那里吃的、吃的方式（左/中/右碰）等
-                #      由于位运算逻辑复杂，这里暂不详细解码，保留原始值
-                event = {
-                    "type": "naki",               # 事件类型
-                    "who": int(attrs.get('who')), # 鸣牌玩家ID
-                    "raw_m": attrs.get('m')       # 原始位掩码值
-                }
-                
-            # ==========================================
-            # 事件类型3: 立直 (REACH)
-            # ==========================================
-            elif tag == 'REACH':
-                # 立直操作分为两个步骤，对应两个事件:
-                # step="1": 玩家宣言立直（喊"立直"），紧接着会切出一张牌
-                # step="2": 玩家放上1000点立直棒，立直正式成立
-                event = {
-                    "type": "reach",               # 事件类型
-                    "who": int(attrs.get('who')),  # 立直玩家ID
-                    "step": attrs.get('step')      # 立直步骤 ("1" 或 "2")
-                }
-                
-            # ==========================================
-            # 事件类型4: 和牌/游戏结束 (AGARI)
-            # ==========================================
-            elif tag == 'AGARI':
-                # AGARI 表示玩家和牌，包含详细和牌信息:
-                #   who: 和牌玩家ID
-                #   fromWho: 放铳玩家ID (-1 表示自摸)
-                #   ten: 和牌点数
-                #   yaku: 役种列表
-                #   doraHai: 宝牌列表
-                #   machi: 待牌形状（边张、嵌张、双碰等）
-                # 当前版本只标记为和牌事件，暂不解析详细信息
-                event = {"type": "hora"} 
-
-            # ==========================================
-            # 事件类型5: 流局 (RYUUKYOKU)
-            # ==========================================
-            elif tag == 'RYUUKYOKU':
-                # RYUUKYOKU 表示流局（无人和牌）
-                # 可能包含原因，如: "nm" (荒牌流局), "k" (九种九牌), "r" (四风连打) 等
-                event = {"type": "ryukyoku"}
-                
-            # ==========================================
-            # 事件类型6: 摸牌/切牌 (T/D/U/E/V/F/W/G)
-            # ==========================================
-            # 天凤使用单字母编码来表示玩家的摸牌和切牌动作:
-            #   玩家0 (东家): T(摸牌), D(切牌)
-            #   玩家1 (南家): U(摸牌), E(切牌)
-            #   玩家2 (西家): V(摸牌), F(切牌)
-            #   玩家3 (北家): W(摸牌), G(切牌)
-            # 字母后的数字表示牌的ID (天凤内部编码)
-            # 例如: T12 表示东家摸到ID为12的牌
-            elif len(tag) > 1 and tag[0] in ['T', 'D', 'U', 'E', 'V', 'F', 'W', 'G'] and tag[1:].isdigit():
-                # 判断动作类型: 首字母在 T/U/V/W 中表示摸牌，否则为切牌
-                action_type = "tsumo" if tag[0] in ['T','U','V','W'] else "dahai"
-                
-                # 建立字母到玩家ID的映射关系
-                player_map = {
-                    'T':0, 'D':0,  # 玩家0 (东家)
-                    'U':1, 'E':1,  # 玩家1 (南家)
-                    'V':2, 'F':2,  # 玩家2 (西家)
-                    'W':3, 'G':3   # 玩家3 (北家)
-                }
-                # 提取玩家ID和牌ID
-                player_id = player_map[tag[0]]
-                tile_id = int(tag[1:])
-                
-                # 构造摸牌或切牌事件
-                event = {
-                    "type": action_type,                 # "tsumo" 或 "dahai"
-                    "actor": player_id,                  # 执行动作的玩家ID
-                    "pai": tenhou_tile_to_mjai(tile_id)  # 转换后的牌码
-                }
-            
-            # 如果成功解析出事件，将其添加到游戏日志列表中
-            if event:
-                game_log.append(event)
-                
-        # 返回完整的游戏事件日志
-        return game_log
-
+        return _parse_mjlog(file_path)
+    except ET.ParseError:
+        # XML 格式错误，返回 None
+        return None
     except Exception as e:
         # 捕获解析过程中的任何异常，打印错误信息并返回 None
         print(f"解析异常 {file_path}: {e}")
         return None
 
-def main():
+def _open_mjlog(file_path):
+    """以流的方式打开牌谱文件，自动识别 gzip 压缩
+
+    Returns:
+        可按需读取的二进制文件对象 (gzip 文件返回 GzipFile，按块解压)
+    """
+    # 以二进制模式读取，因为文件可能是 gzip 压缩格式
+    # 天凤服务器传输时会压缩文件以减小体积
+    f = open(file_path, 'rb')
+    # 检查文件头魔数 (Magic Number) 来判断文件类型
+    # gzip 格式的标准魔数为 0x1f 0x8b，这里只偷看前两个字节，不读入整个文件
+    if f.peek(2)[:2] == b'\x1f\x8b':
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    return f
+
+class _EventTarget:
+    """XMLParser 的回调目标：节点开始时直接转换成事件，不构建元素树
+
+    天凤的 XML 是扁平结构 (<mjloggm> 下每个子节点代表一个游戏动作，
+    所有信息都在属性里)，所以只需要 start 回调；不定义 end / data，
+    expat 也就不会为它们回调 Python。
+    """
+    def __init__(self):
+        self.seen_root = False
+        self.events = []
+
+    def start(self, tag, attrs):
+        if not self.seen_root:
+            self.seen_root = True
+            return
+        event = _element_to_event(tag, attrs)
+        if event:
+            self.events.append(event)
+
+    def close(self):
+        return None
+
+def iter_mjlog_events(source):
+    """流式解析天凤牌谱，逐个 yield 事件字典
+
+    与一次性 read + decompress + fromstring 不同，这里每次读入 READ_SIZE 字节喂给解析器，
+    回调里直接生成事件，不构建元素树，峰值内存只与单块数据大小有关，也比 fromstring 更快。
+
+    Args:
+        source: .mjlog 文件路径，或已打开的二进制流 (明文 XML 或解压后的数据)
+
+    Yields:
+        与 parse_xml_to_json 相同格式的事件字典
+
+    Raises:
+        ET.ParseError: XML 格式错误 (已 yield 的事件不受影响)
+    """
+    stream = _open_mjlog(source) if isinstance(source, (str, os.PathLike)) else source
+    try:
+        # 天凤的 XML 采用扁平化结构，每个子节点代表一个游戏动作
+        # 例如: <INIT>, <T12>, <D30>, <N>, <REACH> 等
+        target = _EventTarget()
+        parser = ET.XMLParser(target=target)
+        while True:
+            chunk = stream.read(READ_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            # 把这一块数据解析出的事件交给调用方
+            yield from target.events
+            target.events.clear()
+        parser.close()
+        yield from target.events
+    finally:
+        if stream is not source:
+            stream.close()
+
+def _parse_mjlog(file_path):
+    """parse_xml_to_json 的内部实现：出错时直接抛出异常，不打印
+
+    批量转换 (convert_file) 需要拿到具体的错误信息做汇总统计，
+    因此把异常处理留给调用方。
+    """
+    return list(iter_mjlog_events(file_path))
+
+def _element_to_event(tag, attrs):
+    """把一个 XML 节点转换为事件字典，不关心的节点返回空字典
+
+    Args:
+        tag: 标签名 (如 INIT, T12, D30, N, REACH)
+        attrs: 属性字典 (如 seed="...", hai0="...")
+    """
+    # 初始化当前事件字典
+    event = {}
+    
+    # ==========================================
+    # 事件类型1: 一局开始 (INIT)
+    # ==========================================
+    if tag == 'INIT':
+        # seed 属性格式: "局数,本场,供托,骰子1,骰子2,宝牌指示牌ID"
+        # 例如: "4,0,0,2,4,16" 表示南一局，0本场，0供托，骰子2和4，宝牌指示牌ID为16
+        seed = [int(x) for x in attrs['seed'].split(',')]
+        
+        # 计算场风 (Prevalent Wind)
+        # 天凤用数字表示局数，每4局换一次场风：
+        # 局数 0-3: 东场 (East)
+        # 局数 4-7: 南场 (South)
+        # 局数 8-11: 西场 (West)
+        # 局数 12-15: 北场 (North)
+        round_idx = seed[0] // 4
+        winds = ['E', 'S', 'W', 'N']  # 东, 南, 西, 北
+        bakaze = winds[round_idx % 4]
+        
+        # 构造一局开始事件
+        event = {
+            "type": "start_kyoku",      # 事件类型
+            "bakaze": bakaze,             # 场风 (E/S/W/N)
+            "kyoku": (seed[0] % 4) + 1,   # 第几局 (1-4)
+            "honba": seed[1],             # 本场数 (连庄次数)
+            "kyotaku": seed[2],           # 供托/立直棒数量
+            "dora_marker": ID_CODES[seed[5]], # 宝牌指示牌
+            "tehais": []                  # 四位玩家的初始手牌
+        }
+        
+        # 解析四位玩家的初始手牌
+        # 属性名格式: hai0, hai1, hai2, hai3 (分别对应东、南、西、北家)
+        # 值格式: "11,22,33,44..." 的逗号分隔字符串
+        for i in range(4):
+            hai_str = attrs.get(f'hai{i}')
+            if hai_str:
+                # 将牌ID字符串转换为牌的代码列表
+                # 查表 ID_CODES 将天凤的牌ID转换为标准麻将牌码
+                tiles = [ID_CODES[int(t)] for t in hai_str.split(',')]
+                event['tehais'].append(tiles)
+            else:
+                # 如果该位置没有手牌数据（可能是三人对局或断线），添加空列表
+                event['tehais'].append([])
+        
+    # ==========================================
+    # 事件类型2: 鸣牌 (N) - 吃、碰、加杠、大明杠、暗杠
+    # ==========================================
+    elif tag == 'N':
+        # N 标签表示玩家进行副露（鸣牌）操作
+        # 属性说明:
+        #   who: 进行鸣牌的玩家ID (0-3，分别代表东、南、西、北家)
+        #   m: 位掩码，编码了详细的鸣牌信息
+        #      包含: 吃了哪张牌、从谁那里吃的、吃的方式（左/中/右碰）等
+        # 在转换时一次性解码 (见 meld_codec.py)，下游不需要再处理 m
+        who = int(attrs.get('who'))
+        naki_type, target, called, consumed = decode_meld(who, attrs.get('m'))
+        event = {
+            "type": "naki",                              # 事件类型
+            "who": who,                                  # 鸣牌玩家ID
+            "naki_type": NAKI_TYPE_NAMES[naki_type],     # chi/pon/kakan/daiminkan/ankan
+            "target": target,                            # 被鸣牌玩家ID (暗杠为自己)
+            "pai": ID_CODES[called] if called is not None else None,  # 被鸣 (或加杠加上) 的牌
+            "consumed": [ID_CODES[t] for t in consumed]  # 从自己手里拿出的牌
+        }
+        
+    # ==========================================
+    # 事件类型3: 立直 (REACH)
+    # ==========================================
+    elif tag == 'REACH':
+        # 立直操作分为两个步骤，对应两个事件:
+        # step="1": 玩家宣言立直（喊"立直"），紧接着会切出一张牌
+        # step="2": 玩家放上1000点立直棒，立直正式成立
+        event = {
+            "type": "reach",               # 事件类型
+            "who": int(attrs.get('who')),  # 立直玩家ID
+            "step": attrs.get('step')      # 立直步骤 ("1" 或 "2")
+        }
+        
+    # ==========================================
+    # 事件类型4: 和牌/游戏结束 (AGARI)
+    # ==========================================
+    elif tag == 'AGARI':
+        # AGARI 表示玩家和牌，包含详细和牌信息:
+        #   who: 和牌玩家ID
+        #   fromWho: 放铳玩家ID (-1 表示自摸)
+        #   ten: 和牌点数
+        #   yaku: 役种列表
+        #   doraHai: 宝牌列表
+        #   machi: 待牌形状（边张、嵌张、双碰等）
+        # 当前版本只标记为和牌事件，暂不解析详细信息
+        event = {"type": "hora"} 
+
+    # ==========================================
+    # 事件类型5: 流局 (RYUUKYOKU)
+    # ==========================================
+    elif tag == 'RYUUKYOKU':
+        # RYUUKYOKU 表示流局（无人和牌）
+        # 可能包含原因，如: "nm" (荒牌流局), "k" (九种九牌), "r" (四风连打) 等
+        event = {"type": "ryukyoku"}
+        
+    # ==========================================
+    # 事件类型6: 摸牌/切牌 (T/D/U/E/V/F/W/G)
+    # ==========================================
+    # 天凤使用单字母编码来表示玩家的摸牌和切牌动作:
+    #   玩家0 (东家): T(摸牌), D(切牌)
+    #   玩家1 (南家): U(摸牌), E(切牌)
+    #   玩家2 (西家): V(摸牌), F(切牌)
+    #   玩家3 (北家): W(摸牌), G(切牌)
+    # 字母后的数字表示牌的ID (天凤内部编码)
+    # 例如: T12 表示东家摸到ID为12的牌
+    elif len(tag) > 1 and tag[0] in ['T', 'D', 'U', 'E', 'V', 'F', 'W', 'G'] and tag[1:].isdigit():
+        # 判断动作类型: 首字母在 T/U/V/W 中表示摸牌，否则为切牌
+        action_type = "tsumo" if tag[0] in ['T','U','V','W'] else "dahai"
+        
+        # 提取玩家ID和牌ID
+        player_id = PLAYER_MAP[tag[0]]
+        tile_id = int(tag[1:])
+        
+        # 构造摸牌或切牌事件
+        event = {
+            "type": action_type,                 # "tsumo" 或 "dahai"
+            "actor": player_id,                  # 执行动作的玩家ID
+            "pai": ID_CODES[tile_id]             # 转换后的牌码
+        }
+
+    # ==========================================
+    # 事件类型7: 新宝牌 (DORA)
+    # ==========================================
+    elif tag == 'DORA':
+        # 开杠后翻开新的宝牌指示牌，hai 为牌ID
+        event = {
+            "type": "dora",
+            "dora_marker": ID_CODES[int(attrs['hai'])]
+        }
+
+    return event
+
+def _file_digest(file_path):
+    """计算源文件的 SHA-1 摘要，用于判断内容是否变化"""
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest(path=MANIFEST_PATH):
+    """读取转换清单 {源文件名: {"size", "mtime", "sha1"}}，不存在或损坏时返回空字典"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """原子地写入转换清单：先写临时文件再 rename，中途崩溃也不会留下半截 JSON"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def output_path_for(fpath):
+    """由 .mjlog 源文件路径得到对应的 .json 输出路径"""
+    fname = os.path.basename(fpath).replace('.mjlog', '.json')
+    return os.path.join(JSON_DIR, fname)
+
+def write_events_json(events, f):
+    """把事件迭代器以紧凑 JSON 数组的形式流式写入文件，返回写出的事件数
+
+    输出与 json.dump(list(events), f, separators=(',', ':')) 完全一致。
+    """
+    encode = _COMPACT_ENCODER.encode
+    count = 0
+    f.write('[')
+    for event in events:
+        if count:
+            f.write(',')
+        f.write(encode(event))
+        count += 1
+    f.write(']')
+    return count
+
+def convert_file(task):
+    """转换单个牌谱文件 (进程池 worker 入口)
+
+    Args:
+        task: (源文件路径, 清单中记录的旧 sha1 或 None, 输出格式 "json"/"binary")
+              binary 模式下只有分片中确实存在这局时才传入旧 sha1 (见 plan_tasks)
+
+    Returns:
+        (源文件名, 状态, 清单条目, 错误信息, 二进制记录)
+        状态取值: "converted" 已转换 / "unchanged" 内容未变跳过 / "failed" 失败
+        二进制记录仅在 binary 模式下返回 (由主进程统一写入分片)，否则为 None
+    """
+    fpath, old_digest, output_format = task
+    name = os.path.basename(fpath)
+    try:
+        st = os.stat(fpath)
+        digest = _file_digest(fpath)
+        entry = {"size": st.st_size, "mtime": st.st_mtime, "sha1": digest}
+
+        if output_format == "binary":
+            # 内容没变，且 plan_tasks 已确认这局还在某个分片里
+            if digest == old_digest:
+                return name, "unchanged", entry, None, None
+            records = event_store.encode_events(iter_mjlog_events(fpath))
+            if len(records) == 0:
+                raise ValueError("没有解析出任何事件")
+            return name, "converted", entry, None, records
+
+        save_path = output_path_for(fpath)
+
+        # mtime 变了但内容没变 (例如重新下载了同一个文件)，不必重新解析
+        if digest == old_digest and os.path.exists(save_path):
+            return name, "unchanged", entry, None, None
+
+        # 先写临时文件再 rename，避免中断后留下不完整的 JSON
+        # 事件边解析边写出，不在内存中保留整局的事件列表
+        tmp_path = save_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                n_events = write_events_json(iter_mjlog_events(fpath), f)
+            if n_events == 0:
+                raise ValueError("没有解析出任何事件")
+            os.replace(tmp_path, save_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name, "converted", entry, None, None
+    except Exception as e:
+        return name, "failed", None, f"{type(e).__name__}: {e}", None
+
+def plan_tasks(files, manifest, force=False, output_format="json", stored=None):
+    """根据清单筛选需要处理的文件
+
+    size 和 mtime 都与清单一致、且输出仍然存在的直接跳过，不读文件；
+    其余的交给 worker，由 worker 再用 sha1 判断内容是否真的变化。
+    输出是否存在: json 模式看输出文件，binary 模式看游戏 ID 是否在 stored (已落盘分片中的游戏) 里；
+    输出已经不存在的 (例如分片被删除) 不传旧 sha1，一定重新转换。
+
+    Args:
+        stored: binary 模式下已落盘的游戏 ID 集合 (event_store.stored_game_ids)，None 时现读 BIN_DIR
+    """
+    if output_format == "binary" and stored is None:
+        stored = event_store.stored_game_ids(BIN_DIR)
+    tasks = []
+    for fpath in files:
+        name = os.path.basename(fpath)
+        entry = None if force else manifest.get(name)
+        if entry:
+            if output_format == "binary":
+                present = name.replace('.mjlog', '') in stored
+            else:
+                present = os.path.exists(output_path_for(fpath))
+            if not present:
+                entry = None
+        if entry:
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                continue
+            if st.st_size == entry.get("size") and st.st_mtime == entry.get("mtime"):
+                continue
+        tasks.append((fpath, entry.get("sha1") if entry else None, output_format))
+    return tasks
+
+def main(num_workers=NUM_WORKERS, chunk_size=CHUNK_SIZE, force=False, output_format=OUTPUT_FORMAT):
+    """批量转换 RAW_DIR 下的牌谱
+
+    Args:
+        num_workers: 进程数，<= 1 时在当前进程内串行转换
+        chunk_size: 每次派发给 worker 的任务数
+        force: 忽略清单，全部重新转换
+        output_format: "json" 每局一个 JSON 文件 / "binary" 写入 BIN_DIR 下的二进制分片
+    """
+    binary = output_format == "binary"
+    out_dir = BIN_DIR if binary else JSON_DIR
+    manifest_path = BIN_MANIFEST_PATH if binary else MANIFEST_PATH
+    if binary and event_store is None:
+        raise ImportError("binary 输出模式需要 numpy: pip install numpy")
+
     # 设置必要的目录结构
-    setup_dir()
+    setup_dir(out_dir)
     
     # 查找所有待转换的 .mjlog 文件
     # glob.glob 返回匹配指定路径模式的文件路径列表
     files = glob.glob(os.path.join(RAW_DIR, "*.mjlog"))
+    manifest = load_manifest(manifest_path)
+    tasks = plan_tasks(files, manifest, force, output_format)
     
     # 输出待转换文件总数
-    print(f"开始转换 {len(files)} 个文件...")
-    
-    # 初始化计数器，记录已成功转换的文件数量
-    count = 0
-    
-    # 遍历所有待转换的文件
-    for fpath in files:
-        # 调用解析函数，将 XML 格式的 mjlog 文件转换为 JSON 数据结构
-        json_data = parse_xml_to_json(fpath)
-        
-        # 只有当解析成功时才进行保存操作
-        if json_data:
-            # 构造输出文件名：将原文件的 .mjlog 扩展名替换为 .json
-            fname = os.path.basename(fpath).replace('.mjlog', '.json')
-            # 构造完整的输出文件路径
-            save_path = os.path.join(JSON_DIR, fname)
-            
-            # 将 JSON 数据写入文件
-            # encoding='utf-8': 指定文件编码为 UTF-8，确保中文字符正确存储
-            # separators=(',', ':'): 去除 JSON 字符串中的空格和换行，减小文件体积
-            with open(save_path, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, separators=(',', ':')) 
-            
-            # 成功转换一个文件后计数器加 1
-            count += 1
-            
-            # 每转换 10 个文件输出一次进度，避免频繁输出影响性能
-            if count % 10 == 0:
-                print(f"已转换 {count} 个文件")
+    print(f"共 {len(files)} 个文件，需要处理 {len(tasks)} 个 (其余未变化已跳过)")
+    if not tasks:
+        print(f"转换完成！输出保存在: {out_dir}")
+        return
+
+    num_workers = max(1, num_workers or 1)
+    counts = {"converted": 0, "unchanged": 0, "failed": 0}
+    failures = []
+    start = time.time()
+
+    # binary 模式下由主进程统一写分片；分片落盘之前，这些游戏不能记入清单
+    writer = event_store.ShardWriter(BIN_DIR) if binary else None
+    unflushed = {}
+
+    pool = None
+    if num_workers > 1:
+        pool = multiprocessing.Pool(num_workers)
+        results = pool.imap_unordered(convert_file, tasks, chunksize=chunk_size)
+    else:
+        results = map(convert_file, tasks)
+
+    try:
+        for done, (name, status, entry, error, records) in enumerate(results, 1):
+            counts[status] += 1
+            if entry is None:
+                # 失败的文件从清单中移除，下次运行会重试
+                manifest.pop(name, None)
+                failures.append((name, error))
+            elif records is not None:
+                if writer.add_game(name.replace('.mjlog', ''), records):
+                    manifest.update(unflushed)
+                    unflushed = {}
+                unflushed[name] = entry
+            else:
+                manifest[name] = entry
+
+            # 定期汇总进度并落盘清单，崩溃后重跑只需处理剩下的部分
+            if done % PROGRESS_EVERY == 0 or done == len(tasks):
+                elapsed = time.time() - start
+                print(f"进度 {done}/{len(tasks)} | 转换 {counts['converted']} "
+                      f"未变 {counts['unchanged']} 失败 {counts['failed']} | "
+                      f"{done / max(elapsed, 1e-9):.1f} 个/秒")
+                save_manifest(manifest, manifest_path)
+        if writer is not None:
+            writer.close()
+            manifest.update(unflushed)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        save_manifest(manifest, manifest_path)
+
+    # 失败汇总：按错误信息归类，只列出少量样例
+    if failures:
+        by_error = {}
+        for name, error in failures:
+            by_error.setdefault(error, []).append(name)
+        print(f"失败 {len(failures)} 个:")
+        for error, names in sorted(by_error.items(), key=lambda kv: -len(kv[1])):
+            print(f"  [{len(names)}] {error} (例如 {', '.join(names[:3])})")
 
     # 输出转换完成信息及文件保存位置
-    print(f"转换完成！JSON文件保存在: {JSON_DIR}")
+    print(f"转换完成！输出保存在: {out_dir}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,539 @@
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from event_store import (START_KYOKU, HAIPAI, DAHAI, REACH, HORA, RYUKYOKU,
+                         EVENT_TYPE_NAMES, EVENT_TYPE_IDS, BAKAZE_NAMES, encode_events, EventStore)
+from tile_codec import KIND_CODES, CODE_KINDS
+
+# 🔎 语料列式索引 + 向量化查询
+#
+# 把转换后的整个语料 (JSON_DIR 下的 .json，或 BIN_DIR 下的二进制分片) 扫描一遍，
+# 展开成按列存储的定长数组，之后的全语料统计只做 NumPy 的过滤 + 分组计数，不再解析任何 JSON。
+#
+# 三张表，每列一个 .bin 文件 (原始小端数组，按 meta.json 中的行数内存映射):
+#   events : 每个事件一行 (不含配牌)
+#            game 游戏行号 / kyoku 小局行号 / turn 巡目 / actor 座位 / type 事件类型 / tile 牌种 / reach 立直状态
+#   kyokus : 每个小局一行
+#            game / bakaze 场风 / kyoku 局 / honba 本场 / events 事件数 / discards 切牌数 / reaches 立直数 / end 结束方式
+#   games  : 每局游戏一行，game_id / kyokus 小局数 / shard 来源分片名 (JSON 语料为空)
+#
+# 字段约定:
+#   type / end 取 event_store 的事件类型枚举，tile 为 0-33 的牌种 (-1 无)，bakaze 为 0-3 (东南西北)
+#   turn: 有座位的事件为该家在本小局的第几巡 (自己切过的牌数 + 1)，无座位的事件按全桌切牌数 // 4 + 1
+#   reach: 4 位的掩码，第 i 位表示座位 i 在该事件之前已立直成立 (step 2)
+#   派生列 opp_reach (他家已立直) / self_reach (自己已立直) 在查询时按块计算
+#   "kyoku.bakaze" 形式的列名通过行号关联到另一张表
+#
+# 二进制分片中同一局出现多次时 (源文件变化后重新转换)，与 EventStore / DataLoader 一样以最新的一份为准；
+# 已索引的游戏换了分片时，旧的行被删除 (整表压缩重写) 后按新的一份重新索引。
+#
+# 用法:
+#   python data/corpus_index.py --build                              # 增量建立索引 (已索引的游戏跳过)
+#   python data/corpus_index.py --count turn --where type=dahai --where opp_reach=1
+#   python data/corpus_index.py --table kyokus --mean discards --by bakaze
+#
+#   index = CorpusIndex()
+#   index.events.count("turn", where={"type": "dahai", "opp_reach": True})
+#   index.kyokus.mean("discards", by="bakaze")
+#   index.events.count(("kyoku.bakaze", "tile"), where={"type": "dahai", "turn": range(1, 7)})
+
+# ⚙️ 配置
+INDEX_DIR = "./data/corpus_index"
+SOURCE_DIR = "./data/json_logs"     # 也可以是二进制分片目录 (./data/bin_logs)
+NUM_WORKERS = os.cpu_count() or 1
+GAMES_PER_CHUNK = 256               # JSON 语料每次派发给 worker 的游戏数
+QUERY_BLOCK = 1 << 24               # 查询时每次处理的行数，限制临时数组的内存
+
+SCHEMA = {
+    "events": {"game": "<i4", "kyoku": "<i4", "turn": "u1", "actor": "i1", "type": "u1", "tile": "i1", "reach": "u1"},
+    "kyokus": {"game": "<i4", "bakaze": "u1", "kyoku": "u1", "honba": "u1", "events": "<i4",
+               "discards": "<i2", "reaches": "u1", "end": "i1"},
+    "games": {"game_id": "S64", "kyokus": "<i2", "shard": "S16"},
+}
+REFS = {"events": {"game": "games", "kyoku": "kyokus"}, "kyokus": {"game": "games"}}
+
+# 枚举列的名称 <-> 数值 (查询条件可以直接写名称，结果的键也换成名称)
+LABELS = {
+    "type": EVENT_TYPE_NAMES,
+    "end": EVENT_TYPE_NAMES,
+    "tile": KIND_CODES,
+    "bakaze": BAKAZE_NAMES,
+}
+_LABEL_IDS = {
+    "type": EVENT_TYPE_IDS,
+    "end": EVENT_TYPE_IDS,
+    "tile": CODE_KINDS,
+    "bakaze": {name: i for i, name in enumerate(BAKAZE_NAMES)},
+}
+
+
+# ------------------------------------------------------------
+# 记录 -> 列
+# ------------------------------------------------------------
+def columnize(records, lengths, game_base=0, kyoku_base=0):
+    """
+    把若干局游戏的事件记录 (event_store.RECORD_DTYPE，按局首尾相接) 展开成三张表的列
+
+    Args:
+        records: 拼接后的记录数组
+        lengths: 每局游戏的记录数
+        game_base / kyoku_base: 本批第一局 / 第一个小局在索引中的行号
+    Returns:
+        {表名: {列名: 数组}}
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    etype = np.asarray(records["type"])
+    actor = np.asarray(records["actor"])
+    flag = np.asarray(records["flag"])
+    game = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+
+    # 小局编号: 每个 START_KYOKU 开启一个新的小局；不属于任何小局 (或跨到下一局游戏) 的记录丢弃
+    is_start = etype == START_KYOKU
+    starts = np.flatnonzero(is_start)
+    kyoku = np.cumsum(is_start) - 1
+    valid = kyoku >= 0
+    valid[valid] = game[starts[kyoku[valid]]] == game[valid]
+    k = np.where(valid, kyoku, 0)
+
+    def within_kyoku(flags):
+        """flags 在本小局内、本行之前的累计次数"""
+        before = np.cumsum(flags) - flags
+        return before - before[starts][k] if len(starts) else before
+
+    is_dahai = etype == DAHAI
+    turn = within_kyoku(is_dahai) // 4 + 1
+    reach = np.zeros(len(etype), dtype=np.uint8)
+    for seat in range(4):
+        mine = actor == seat
+        turn = np.where(mine, within_kyoku(is_dahai & mine) + 1, turn)
+        declared = within_kyoku((etype == REACH) & mine & (flag == 2)) > 0
+        reach |= declared.astype(np.uint8) << seat
+
+    keep = valid & (etype != HAIPAI)
+    n_kyoku = len(starts)
+    kept_kyoku = k[keep]
+    events = {
+        "game": game[keep] + game_base,
+        "kyoku": kept_kyoku + kyoku_base,
+        "turn": np.minimum(turn[keep], 255),
+        "actor": actor[keep],
+        "type": etype[keep],
+        "tile": np.asarray(records["tile"])[keep],
+        "reach": reach[keep],
+    }
+
+    ends = np.flatnonzero(valid & ((etype == HORA) | (etype == RYUKYOKU)))
+    end = np.full(n_kyoku, -1, dtype=np.int8)
+    end[k[ends]] = etype[ends]
+    kyokus = {
+        "game": game[starts] + game_base,
+        "bakaze": flag[starts],
+        "kyoku": np.asarray(records["arg0"])[starts],
+        "honba": np.asarray(records["arg1"])[starts],
+        "events": np.bincount(kept_kyoku, minlength=n_kyoku),
+        "discards": np.bincount(k[valid & is_dahai], minlength=n_kyoku),
+        "reaches": np.bincount(k[valid & (etype == REACH) & (flag == 2)], minlength=n_kyoku),
+        "end": end,
+    }
+    games = {"kyokus": np.bincount(game[starts], minlength=len(lengths))}
+    return {"events": events, "kyokus": kyokus, "games": games}
+
+
+def _encode_chunk(paths):
+    """worker: 读取一批 JSON 游戏并编码为记录 (出错的文件跳过)"""
+    ids, chunks, failed = [], [], []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                records = encode_events(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            failed.append((path, repr(e)))
+            continue
+        ids.append(_game_id_of(path))
+        chunks.append(records)
+    return ids, chunks, failed
+
+
+def _game_id_of(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# ------------------------------------------------------------
+# 建立索引
+# ------------------------------------------------------------
+class IndexWriter:
+    """
+    按表按列追加写入 .bin 文件，每批写完后更新 meta.json
+
+    meta.json 中的行数才是有效行数: 中途中断时多写的尾部在下次打开时截掉。
+    """
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        self.meta = _load_meta(index_dir)
+        for table, columns in SCHEMA.items():
+            rows = self.meta["tables"][table]["rows"]
+            for col, dtype in columns.items():
+                path = _column_path(index_dir, table, col)
+                # 旧版本索引中没有的列在这里补齐 (填 0)
+                with open(path, "ab") as f:
+                    f.truncate(rows * np.dtype(dtype).itemsize)
+                self.meta["tables"][table]["columns"][col] = dtype
+
+    def rows(self, table):
+        return self.meta["tables"][table]["rows"]
+
+    def append(self, game_ids, records, lengths, shard=""):
+        """追加一批游戏 (记录拼接在一起，lengths 为每局的记录数，shard 为来源分片名)"""
+        tables = columnize(records, lengths, self.rows("games"), self.rows("kyokus"))
+        tables["games"]["game_id"] = np.array([g.encode("utf-8") for g in game_ids], dtype="S64")
+        tables["games"]["shard"] = np.full(len(game_ids), shard.encode("utf-8"), dtype="S16")
+        for table, columns in tables.items():
+            for col, dtype in SCHEMA[table].items():
+                with open(_column_path(self.index_dir, table, col), "ab") as f:
+                    f.write(np.ascontiguousarray(columns[col], dtype=dtype).tobytes())
+            self.meta["tables"][table]["rows"] += len(next(iter(columns.values())))
+        self.save()
+
+    def drop_games(self, rows):
+        """
+        删除若干局游戏 (games 表行号) 及其小局 / 事件，其余各行保持顺序，行号引用重新编号
+
+        每列读入、过滤后写临时文件，全部写完再逐个替换。替换过程中 meta.json 标记为 compacting，
+        万一中途中断，打开索引时会提示用 --force 重建，而不是读到行数对不上的列。
+        """
+        n_games = self.rows("games")
+        keep = {"games": np.ones(n_games, dtype=bool)}
+        keep["games"][np.asarray(rows, dtype=np.int64)] = False
+        new_row = {"games": np.cumsum(keep["games"]) - 1}
+        kyoku_game = self._read("kyokus", "game")
+        keep["kyokus"] = keep["games"][kyoku_game]
+        new_row["kyokus"] = np.cumsum(keep["kyokus"]) - 1
+        keep["events"] = keep["games"][self._read("events", "game")]
+
+        replaced = []
+        for table, columns in SCHEMA.items():
+            for col, dtype in columns.items():
+                values = self._read(table, col)[keep[table]]
+                target = REFS.get(table, {}).get(col)
+                if target is not None:
+                    values = new_row[target][values]
+                path = _column_path(self.index_dir, table, col)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+                replaced.append(path)
+        self.meta["compacting"] = True
+        self.save()
+        for path in replaced:
+            os.replace(path + ".tmp", path)
+        for table in SCHEMA:
+            self.meta["tables"][table]["rows"] = int(keep[table].sum())
+        del self.meta["compacting"]
+        self.save()
+
+    def _read(self, table, col):
+        dtype = SCHEMA[table][col]
+        return np.fromfile(_column_path(self.index_dir, table, col), dtype=dtype, count=self.rows(table))
+
+    def save(self):
+        path = os.path.join(self.index_dir, "meta.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+
+def build_index(source=SOURCE_DIR, index_dir=INDEX_DIR, num_workers=NUM_WORKERS,
+                games_per_chunk=GAMES_PER_CHUNK, force=False):
+    """
+    扫描语料目录并追加到索引 (已索引的游戏 ID 跳过；二进制分片中换到了更新分片的游戏重新索引)
+
+    Args:
+        source: JSON 目录 (每局一个 .json) 或二进制分片目录 (shard-*.events.npy)
+        force: 删除已有索引后重建
+    Returns:
+        新增的游戏数
+    """
+    if force and os.path.isdir(index_dir):
+        for path in glob.glob(os.path.join(index_dir, "*.bin")) + [os.path.join(index_dir, "meta.json")]:
+            if os.path.exists(path):
+                os.remove(path)
+    writer = IndexWriter(index_dir)
+    index = CorpusIndex(index_dir)
+    known = dict(zip(index.game_ids(), index.games.column("shard").tolist()))
+    del index
+    start = time.time()
+    added = 0
+
+    if glob.glob(os.path.join(source, "shard-*.events.npy")):
+        # 与 EventStore 相同的去重规则: 同一局以最新的分片为准
+        store = EventStore(source)
+        names = [os.path.basename(shard["base"]).encode("utf-8") for shard in store.shards]
+        by_shard = {}
+        for gid, (shard_idx, i) in store.locator.items():
+            if known.get(gid) != names[shard_idx]:
+                by_shard.setdefault(shard_idx, []).append((i, gid))
+        moved = [gid for indices in by_shard.values() for _, gid in indices if gid in known]
+        if moved:
+            rows = {gid: row for row, gid in enumerate(known)}
+            writer.drop_games([rows[gid] for gid in moved])
+            print(f"  {len(moved)} 局的来源分片有变化 (或旧版本索引未记录来源)，删除旧的索引行后重新索引")
+        for shard_idx, todo in sorted(by_shard.items()):
+            todo.sort()
+            shard = store.shards[shard_idx]
+            events, games = shard["events"], shard["games"]
+            rows = np.array([i for i, _ in todo])
+            if len(rows) == len(games):
+                records = events[games["start"][0]:games["end"][-1]]
+            else:
+                records = np.concatenate([events[games["start"][i]:games["end"][i]] for i in rows])
+            writer.append([gid for _, gid in todo], records, games["end"][rows] - games["start"][rows],
+                          shard=names[shard_idx].decode("utf-8"))
+            added += len(todo)
+            print(f"  {names[shard_idx].decode('utf-8')}: +{len(todo)} 局")
+    else:
+        paths = sorted(p for p in glob.glob(os.path.join(source, "*.json")) if _game_id_of(p) not in known)
+        chunks = [paths[i:i + games_per_chunk] for i in range(0, len(paths), games_per_chunk)]
+        print(f"共 {len(paths)} 局待索引")
+        pool = None
+        if num_workers > 1 and len(chunks) > 1:
+            pool = multiprocessing.Pool(num_workers)
+            results = pool.imap(_encode_chunk, chunks)
+        else:
+            results = map(_encode_chunk, chunks)
+        try:
+            for ids, records, failed in results:
+                for path, error in failed:
+                    print(f"  ❌ {path}: {error}")
+                if ids:
+                    writer.append(ids, np.concatenate(records), [len(r) for r in records])
+                    added += len(ids)
+                    print(f"  已索引 {added}/{len(paths)} 局 ({time.time() - start:.1f}s)")
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    rows = writer.meta["tables"]
+    print(f"索引完成: 新增 {added} 局，共 {rows['games']['rows']} 局 / {rows['kyokus']['rows']} 小局 / "
+          f"{rows['events']['rows']} 事件，用时 {time.time() - start:.1f}s")
+    return added
+
+
+def _column_path(index_dir, table, col):
+    return os.path.join(index_dir, f"{table}.{col}.bin")
+
+
+def _load_meta(index_dir):
+    path = os.path.join(index_dir, "meta.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"version": 1, "tables": {table: {"rows": 0, "columns": dict(cols)} for table, cols in SCHEMA.items()}}
+
+
+# ------------------------------------------------------------
+# 查询
+# ------------------------------------------------------------
+def _opp_reach(table, start, stop):
+    actor = table.column("actor", start, stop).astype(np.int16)
+    own = np.where(actor >= 0, 1 << np.maximum(actor, 0), 0)
+    return (table.column("reach", start, stop) & ~own) != 0
+
+
+def _self_reach(table, start, stop):
+    actor = table.column("actor", start, stop).astype(np.int16)
+    return (actor >= 0) & ((table.column("reach", start, stop) >> np.maximum(actor, 0)) & 1 == 1)
+
+
+DERIVED = {"events": {"opp_reach": _opp_reach, "self_reach": _self_reach}}
+
+
+class Table:
+    """一张内存映射的列式表，提供按块的过滤与分组聚合"""
+    def __init__(self, name, columns, rows):
+        self.name = name
+        self.columns = columns
+        self.rows = rows
+        self.refs = {}          # 列名 -> 该列行号指向的表
+        self.derived = DERIVED.get(name, {})
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name, start=0, stop=None):
+        """读取一列的 [start, stop) 行；支持派生列与 "kyoku.bakaze" 形式的关联列"""
+        if name in self.derived:
+            return self.derived[name](self, start, stop)
+        if "." in name:
+            ref, sub = name.split(".", 1)
+            return self.refs[ref].column(sub)[self.column(ref, start, stop)]
+        return np.asarray(self.columns[name][start:stop])
+
+    def mask(self, where, start=0, stop=None):
+        """
+        过滤条件 -> 布尔数组
+
+        where: {列名: 值}，值可以是单个值、列表/集合/range (任一匹配) 或 callable(列数组) -> 布尔数组；
+        枚举列可以直接写名称，如 {"type": "dahai", "tile": ["5m", "5p", "5s"]}
+        """
+        stop = self.rows if stop is None else stop
+        mask = np.ones(stop - start, dtype=bool)
+        for name, value in (where or {}).items():
+            col = self.column(name, start, stop)
+            if callable(value):
+                mask &= value(col)
+            elif isinstance(value, (list, tuple, set, frozenset, range)):
+                mask &= np.isin(col, [_encode_label(name, v) for v in value])
+            else:
+                mask &= col == _encode_label(name, value)
+        return mask
+
+    def count(self, by, where=None):
+        """分组计数: 返回 {分组键: 行数}，by 为单个列名时键为标量，否则为元组"""
+        return {key: int(n) for key, (n, _) in self._aggregate(by, where).items()}
+
+    def sum(self, value, by, where=None):
+        return {key: float(s) for key, (_, s) in self._aggregate(by, where, value).items()}
+
+    def mean(self, value, by, where=None):
+        return {key: s / n for key, (n, s) in self._aggregate(by, where, value).items()}
+
+    def _aggregate(self, by, where, value=None):
+        single = isinstance(by, str)
+        by = (by,) if single else tuple(by)
+        totals = {}
+        for start in range(0, self.rows, QUERY_BLOCK):
+            stop = min(self.rows, start + QUERY_BLOCK)
+            mask = self.mask(where, start, stop)
+            if not mask.any():
+                continue
+            keys = [self.column(name, start, stop)[mask].astype(np.int64) for name in by]
+            weights = None if value is None else self.column(value, start, stop)[mask].astype(np.float64)
+            # 多列键合成一个整数: 每列减去最小值后按混合进制展开
+            lows = [int(key.min()) for key in keys]
+            spans = [int(key.max()) - low + 1 for key, low in zip(keys, lows)]
+            combined = np.zeros(len(keys[0]), dtype=np.int64)
+            for key, low, span in zip(keys, lows, spans):
+                combined = combined * span + (key - low)
+            uniq, inverse, counts = np.unique(combined, return_inverse=True, return_counts=True)
+            sums = np.bincount(inverse, weights=weights, minlength=len(uniq)) if weights is not None else counts
+            parts = []
+            rest = uniq
+            for low, span in zip(reversed(lows), reversed(spans)):
+                parts.append(rest % span + low)
+                rest = rest // span
+            for i, key in enumerate(zip(*(part.tolist() for part in reversed(parts)))):
+                n, s = totals.get(key, (0, 0.0))
+                totals[key] = (n + int(counts[i]), s + float(sums[i]))
+        result = {}
+        for key in sorted(totals):
+            label = tuple(_decode_label(name, v) for name, v in zip(by, key))
+            result[label[0] if single else label] = totals[key]
+        return result
+
+
+def _label_name(name):
+    return name.rsplit(".", 1)[-1]
+
+
+def _encode_label(name, value):
+    if isinstance(value, str):
+        return _LABEL_IDS[_label_name(name)][value]
+    return value
+
+
+def _decode_label(name, value):
+    labels = LABELS.get(_label_name(name))
+    if labels is not None and 0 <= value < len(labels):
+        return labels[value]
+    return value
+
+
+class CorpusIndex:
+    """
+    打开 build_index 生成的索引目录 (只读，内存映射)
+
+    index.events / index.kyokus / index.games 为 Table，直接在上面调用 count / mean / sum / mask
+    """
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        meta = _load_meta(index_dir)
+        if meta.get("compacting"):
+            raise RuntimeError(f"索引 {index_dir} 在压缩重写时中断，请用 --build --force 重建")
+        for name, cols in SCHEMA.items():
+            rows = meta["tables"][name]["rows"]
+            columns = {}
+            for col, dtype in cols.items():
+                path = _column_path(index_dir, name, col)
+                if rows and col in meta["tables"][name]["columns"]:
+                    columns[col] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+                else:
+                    # 空表，或旧版本索引中还没有这一列
+                    columns[col] = np.zeros(rows, dtype=dtype)
+            setattr(self, name, Table(name, columns, rows))
+        for name, refs in REFS.items():
+            table = getattr(self, name)
+            for col, target in refs.items():
+                table.refs[col] = getattr(self, target)
+
+    def __len__(self):
+        return len(self.games)
+
+    def game_ids(self):
+        return [g.decode("utf-8") for g in self.games.column("game_id").tolist()]
+
+    def game_events(self, game_id):
+        """某一局游戏在 events 表中的行号 (用于把统计结果定位回具体牌谱)"""
+        row = self.game_ids().index(game_id)
+        return np.flatnonzero(self.events.column("game") == row)
+
+
+def _parse_where(items):
+    """命令行的 key=value (value 可以用逗号分隔多个) -> where 字典"""
+    where = {}
+    for item in items or []:
+        key, _, raw = item.partition("=")
+        values = [int(v) if v.lstrip("-").isdigit() else v for v in raw.split(",")]
+        where[key] = values[0] if len(values) == 1 else values
+    return where
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="语料列式索引与统计查询")
+    parser.add_argument("--build", action="store_true", help="扫描语料并增量建立索引")
+    parser.add_argument("--source", default=SOURCE_DIR, help="JSON 目录或二进制分片目录")
+    parser.add_argument("--index", default=INDEX_DIR, help="索引目录")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--force", action="store_true", help="删除已有索引后重建")
+    parser.add_argument("--table", default="events", choices=list(SCHEMA))
+    parser.add_argument("--count", metavar="BY", help="分组计数的列，多个用逗号分隔")
+    parser.add_argument("--mean", metavar="COL", help="求平均值的列 (配合 --by)")
+    parser.add_argument("--by", help="--mean 的分组列，多个用逗号分隔")
+    parser.add_argument("--where", action="append", metavar="COL=VALUE", help="过滤条件，可重复")
+    args = parser.parse_args()
+
+    if args.build:
+        build_index(args.source, args.index, args.workers, force=args.force)
+    index = CorpusIndex(args.index)
+    table = getattr(index, args.table)
+    where = _parse_where(args.where)
+    start = time.time()
+    if args.count:
+        by = args.count.split(",")
+        result = table.count(by[0] if len(by) == 1 else by, where)
+    elif args.mean:
+        by = (args.by or "game").split(",")
+        result = table.mean(args.mean, by[0] if len(by) == 1 else by, where)
+    else:
+        if not args.build:
+            print(f"{len(index)} 局 / {len(index.kyokus)} 小局 / {len(index.events)} 事件")
+        sys.exit()
+    for key, value in result.items():
+        print(f"{key}\t{value:.3f}" if isinstance(value, float) else f"{key}\t{value}")
+    print(f"({len(table)} 行，用时 {time.time() - start:.2f}s)", file=sys.stderr)
@@ -0,0 +1,273 @@
+import os
+import glob
+import json
+import hashlib
+import multiprocessing
+import numpy as np
+
+import event_store
+from features import FeatureTracker, NUM_CHANNELS, OBS_SCALE
+from tile_codec import NUM_KINDS
+
+# 📚 DataLoader：把转换后的牌谱语料变成训练批次
+#
+# 数据流:
+#   任务 (一组游戏) --> worker 进程解码 + 特征化 --> 有界预取队列
+#     --> 主进程按任务顺序接收 --> 大容量洗牌缓冲区 --> 预分配的批数组
+#
+# 语料可以是 convert_to_json 输出的 JSON 目录，也可以是二进制分片目录 (event_store)。
+# 训练/验证集按游戏 ID 的哈希划分，与文件顺序、worker 数无关，每次运行结果一致。
+
+# ⚙️ 默认配置
+BATCH_SIZE = 256
+VAL_RATIO = 0.05            # 验证集比例
+NUM_WORKERS = 4             # 特征化进程数 (0 表示在主进程内完成，便于调试)
+PREFETCH = 8                # 同时在途 (已派发未消费) 的任务数上限
+SHUFFLE_BUFFER = 100_000    # 洗牌缓冲区容量 (样本数)，uint8 存储约 180MB
+GAMES_PER_TASK = 16         # 每个任务包含的游戏数
+
+
+def split_of(game_id, val_ratio=VAL_RATIO, seed=0):
+    """按游戏 ID 的哈希确定所属数据集，返回 "train" 或 "val" """
+    digest = hashlib.blake2b(f"{seed}:{game_id}".encode("utf-8"), digest_size=8).digest()
+    return "val" if int.from_bytes(digest, "little") / 2.0 ** 64 < val_ratio else "train"
+
+
+def _game_id_of(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# ------------------------------------------------------------
+# worker 侧: 任务 -> 样本数组
+# ------------------------------------------------------------
+_shard_cache = {}
+
+
+def _load_task_games(task):
+    """按任务描述读出每局的事件列表"""
+    kind, ref, items = task
+    if kind == "json":
+        for path in items:
+            with open(path, "r", encoding="utf-8") as f:
+                yield json.load(f)
+    else:
+        # 同一 worker 反复处理同一个分片时复用内存映射
+        shard = _shard_cache.get(ref)
+        if shard is None:
+            _shard_cache.clear()
+            shard = _shard_cache[ref] = (np.load(ref + ".events.npy", mmap_mode="r"), np.load(ref + ".games.npy"))
+        events, games = shard
+        for i in items:
+            yield event_store.decode_records(events[games[i]["start"]:games[i]["end"]])
+
+
+def featurize_task(task):
+    """
+    把一个任务中的所有游戏特征化，返回 (obs uint8, mask, labels)
+
+    obs 为 FeatureTracker 的 compact 格式，批次组装时再转换为 float32。
+    """
+    tracker = FeatureTracker()
+    parts = [tracker.encode_game(events, compact=True)[:3] for events in _load_task_games(task)]
+    if not parts:
+        return (np.zeros((0, NUM_CHANNELS, NUM_KINDS), np.uint8), np.zeros((0, NUM_KINDS), bool),
+                np.zeros(0, np.int8))
+    return tuple(np.concatenate(cols) for cols in zip(*parts))
+
+
+def _worker_loop(task_queue, result_queue):
+    while True:
+        item = task_queue.get()
+        if item is None:
+            break
+        task_id, task = item
+        try:
+            result = featurize_task(task)
+        except Exception as e:
+            result = RuntimeError(f"任务 {task_id} 失败: {type(e).__name__}: {e}")
+        result_queue.put((task_id, result))
+
+
+# ------------------------------------------------------------
+# 主进程侧
+# ------------------------------------------------------------
+class DataLoader:
+    """
+    批次生成器
+
+    用法:
+        loader = DataLoader("./data/json_logs", split="train")
+        for obs, mask, labels in loader:      # 每次迭代是一个 epoch
+            ...
+        state = loader.state_dict()           # 可在 epoch 中途保存
+        loader.load_state_dict(state)         # 恢复后从保存点继续
+
+    注意: 每个批次返回的是预分配数组本身，下一次迭代会被覆盖，需要保留时请自行 copy。
+    最后一个不足 batch_size 的批次会被丢弃 (drop_last)。
+    """
+    def __init__(self, source, split="train", batch_size=BATCH_SIZE, val_ratio=VAL_RATIO,
+                 num_workers=NUM_WORKERS, prefetch=PREFETCH, shuffle_buffer=SHUFFLE_BUFFER,
+                 games_per_task=GAMES_PER_TASK, seed=0, shuffle=True):
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.prefetch = max(1, prefetch)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.buffer_size = max(shuffle_buffer, batch_size) if shuffle else batch_size
+        self.tasks = self._build_tasks(source, split, val_ratio, seed, games_per_task)
+
+        # 迭代状态: 当前 epoch、本 epoch 已完整进入缓冲区的任务数、已产出的批次数
+        self.epoch = 0
+        self.next_task = 0
+        self.batches = 0
+
+        # 预分配的缓冲区与批数组
+        self.buf_obs = np.empty((self.buffer_size, NUM_CHANNELS, NUM_KINDS), dtype=np.uint8)
+        self.buf_mask = np.empty((self.buffer_size, NUM_KINDS), dtype=bool)
+        self.buf_label = np.empty(self.buffer_size, dtype=np.int8)
+        self._batch_u8 = np.empty((batch_size, NUM_CHANNELS, NUM_KINDS), dtype=np.uint8)
+        self.batch_obs = np.empty((batch_size, NUM_CHANNELS, NUM_KINDS), dtype=np.float32)
+        self.batch_mask = np.empty((batch_size, NUM_KINDS), dtype=bool)
+        self.batch_label = np.empty(batch_size, dtype=np.int64)
+
+    @staticmethod
+    def _build_tasks(source, split, val_ratio, seed, games_per_task):
+        """扫描语料目录，按数据集筛选游戏并切分成任务"""
+        tasks = []
+        if glob.glob(os.path.join(source, "shard-*.events.npy")):
+            store = event_store.EventStore(source)
+            by_shard = {}
+            for game_id, (shard_idx, i) in store.locator.items():
+                if split_of(game_id, val_ratio, seed) == split:
+                    by_shard.setdefault(shard_idx, []).append(i)
+            for shard_idx, indices in sorted(by_shard.items()):
+                # 分片编号可能不连续 (中间的分片被删除过)，用实际的文件名而不是枚举下标
+                base = store.shards[shard_idx]["base"]
+                indices.sort()
+                for k in range(0, len(indices), games_per_task):
+                    tasks.append(("binary", base, indices[k:k + games_per_task]))
+        else:
+            paths = sorted(p for p in glob.glob(os.path.join(source, "*.json"))
+                           if split_of(_game_id_of(p), val_ratio, seed) == split)
+            for k in range(0, len(paths), games_per_task):
+                tasks.append(("json", None, paths[k:k + games_per_task]))
+        return tasks
+
+    def state_dict(self):
+        """
+        当前迭代位置。恢复后从下一个未进入缓冲区的任务继续；
+        保存时仍在洗牌缓冲区里的样本在本 epoch 内不会再出现 (最多 shuffle_buffer 个)。
+        """
+        return {"epoch": self.epoch, "next_task": self.next_task, "batches": self.batches, "seed": self.seed}
+
+    def load_state_dict(self, state):
+        self.epoch = state["epoch"]
+        self.next_task = state["next_task"]
+        self.batches = state["batches"]
+        self.seed = state.get("seed", self.seed)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def _task_order(self):
+        if not self.shuffle:
+            return list(range(len(self.tasks)))
+        return np.random.default_rng([self.seed, self.epoch]).permutation(len(self.tasks)).tolist()
+
+    def _iter_results(self, order):
+        """按 order 顺序产出任务结果；worker 可以乱序完成，这里负责重排"""
+        if self.num_workers <= 0:
+            for pos in range(self.next_task, len(order)):
+                yield pos, featurize_task(self.tasks[order[pos]])
+            return
+
+        ctx = multiprocessing.get_context()
+        task_queue, result_queue = ctx.Queue(), ctx.Queue()
+        workers = [ctx.Process(target=_worker_loop, args=(task_queue, result_queue), daemon=True)
+                   for _ in range(self.num_workers)]
+        for w in workers:
+            w.start()
+        try:
+            dispatched = self.next_task
+            pending = {}
+            for pos in range(self.next_task, len(order)):
+                # 保持最多 prefetch 个任务在途，限制内存占用
+                while dispatched < len(order) and dispatched - pos < self.prefetch:
+                    task_queue.put((dispatched, self.tasks[order[dispatched]]))
+                    dispatched += 1
+                while pos not in pending:
+                    task_id, result = result_queue.get()
+                    pending[task_id] = result
+                result = pending.pop(pos)
+                if isinstance(result, Exception):
+                    raise result
+                yield pos, result
+        finally:
+            for _ in workers:
+                task_queue.put(None)
+            for w in workers:
+                w.join(timeout=1)
+                if w.is_alive():
+                    w.terminate()
+
+    def _emit(self, idx):
+        """把缓冲区中 idx 位置的样本组装进批数组"""
+        np.take(self.buf_obs, idx, axis=0, out=self._batch_u8)
+        np.multiply(self._batch_u8, OBS_SCALE, out=self.batch_obs)
+        np.take(self.buf_mask, idx, axis=0, out=self.batch_mask)
+        self.batch_label[:] = self.buf_label[idx]
+        self.batches += 1
+        return self.batch_obs, self.batch_mask, self.batch_label
+
+    def __iter__(self):
+        order = self._task_order()
+        rng = np.random.default_rng([self.seed, self.epoch, self.next_task])
+        bs, cap = self.batch_size, self.buffer_size
+        n = 0   # 缓冲区中的样本数
+
+        for pos, (obs, mask, labels) in self._iter_results(order):
+            k, c = len(labels), 0
+            while c < k:
+                if n < cap:
+                    # 缓冲区未满: 直接追加
+                    take = min(cap - n, k - c)
+                    self.buf_obs[n:n + take] = obs[c:c + take]
+                    self.buf_mask[n:n + take] = mask[c:c + take]
+                    self.buf_label[n:n + take] = labels[c:c + take]
+                    n += take
+                    c += take
+                    continue
+                # 缓冲区已满: 随机取出一批，再用新样本填上空位
+                take = min(bs, k - c)
+                idx = rng.choice(cap, size=bs, replace=False) if self.shuffle else np.arange(bs)
+                yield self._emit(idx)
+                holes = idx[:take]
+                self.buf_obs[holes] = obs[c:c + take]
+                self.buf_mask[holes] = mask[c:c + take]
+                self.buf_label[holes] = labels[c:c + take]
+                c += take
+                if take < bs:
+                    # 新样本不够填满空位: 把尾部样本挪进剩余空位，缓冲区缩小
+                    n = self._compact(idx[take:], n)
+            self.next_task = pos + 1
+
+        # 输入耗尽: 打乱剩余样本后依次输出
+        rest = rng.permutation(n) if self.shuffle else np.arange(n)
+        for k in range(0, n - bs + 1, bs):
+            yield self._emit(rest[k:k + bs])
+
+        self.epoch += 1
+        self.next_task = 0
+        self.batches = 0
+
+    def _compact(self, holes, n):
+        """用缓冲区尾部的样本填补 holes，返回新的样本数"""
+        holes = np.sort(holes)
+        new_n = n - len(holes)
+        # 尾部 [new_n, n) 中不是空位的样本，搬到 [0, new_n) 中的空位上
+        tail = np.setdiff1d(np.arange(new_n, n), holes, assume_unique=True)
+        dest = holes[holes < new_n]
+        self.buf_obs[dest] = self.buf_obs[tail]
+        self.buf_mask[dest] = self.buf_mask[tail]
+        self.buf_label[dest] = self.buf_label[tail]
+        return new_n
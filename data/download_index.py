@@ -0,0 +1,251 @@
+import os
+import time
+import sqlite3
+import argparse
+import threading
+
+# 🗂️ 下载状态索引 (SQLite)
+#
+# 记录每个牌谱的下载状态，代替对 SAVE_DIR 逐个 os.path.exists:
+#   logs 表: log_id / 日期 / 在当天列表中的序号 / 状态 / 大小 / SHA-1 / 尝试次数 / 最后错误 / 更新时间
+#   days 表: 已经解析过的每日列表 (日期 / 牌谱数 / 获取时间)，缓存之后不再重复下载和解析
+#
+# 状态: pending (已知但未下载) / ok (已落盘) / failed (失败，attempts 记录尝试次数)
+# 未完成的牌谱有一个部分索引 (WHERE status != 'ok')，todo(day) 的开销只与未完成的数量有关，
+# 续传整个日期范围不需要再碰已完成的部分。
+#
+# 下载线程通过 record_ok / record_failed 提交结果，攒够 COMMIT_EVERY 条或调用 flush 时批量写入。
+#
+# 用法:
+#   python data/download_index.py                         # 按状态 / 日期汇总
+#   python data/download_index.py --import-dir ./data/raw_mjlog   # 把已有文件登记为 ok (旧目录迁移)
+#   python data/download_index.py --verify                # 检查 ok 的文件是否仍在磁盘上，缺失的改回 pending
+
+# ⚙️ 配置
+INDEX_PATH = "./data/download_index.sqlite"
+COMMIT_EVERY = 256          # 攒够多少条下载结果提交一次事务
+MAX_ATTEMPTS = 5            # 失败次数达到该值的牌谱不再自动重试 (可用 reset_failed 清零)
+BULK_CHUNK = 900            # 批量查询时每条 SQL 的参数个数上限 (SQLite 默认限制 999)
+
+PENDING, OK, FAILED = "pending", "ok", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    log_id   TEXT PRIMARY KEY,
+    day      TEXT,
+    seq      INTEGER,
+    status   TEXT NOT NULL DEFAULT 'pending',
+    size     INTEGER,
+    sha1     TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error    TEXT,
+    updated  REAL
+);
+CREATE INDEX IF NOT EXISTS logs_todo ON logs (day, seq) WHERE status != 'ok';
+CREATE TABLE IF NOT EXISTS days (
+    day     TEXT PRIMARY KEY,
+    count   INTEGER NOT NULL,
+    fetched REAL NOT NULL
+);
+"""
+
+
+class DownloadIndex:
+    """
+    下载状态索引
+
+    用法:
+        index = DownloadIndex()
+        if not index.has_day(day):
+            index.add_day(day, ids)                 # 缓存当天列表
+        for log_id in index.todo(day, limit=50):    # 只返回未完成 / 失败的
+            ...
+            index.record_ok(log_id, size, sha1)
+        index.flush()
+    """
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 下载线程只往 _updates 里追加，真正的写入在持锁时批量进行
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+        self._updates = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------- 每日列表缓存 ----------------
+    def has_day(self, day):
+        return self.conn.execute("SELECT 1 FROM days WHERE day = ?", (str(day),)).fetchone() is not None
+
+    def add_day(self, day, log_ids):
+        """缓存某天解析出的牌谱列表；已知的 log_id 保留原有状态，只补上日期和序号"""
+        day, now = str(day), time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO logs (log_id, day, seq, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (log_id) DO UPDATE SET day = excluded.day, seq = excluded.seq",
+                ((log_id, day, seq, now) for seq, log_id in enumerate(log_ids)))
+            self.conn.execute("INSERT OR REPLACE INTO days (day, count, fetched) VALUES (?, ?, ?)",
+                              (day, len(log_ids), now))
+
+    def day_ids(self, day, limit=None):
+        """某天的完整列表 (按原列表顺序)"""
+        sql = "SELECT log_id FROM logs WHERE day = ? ORDER BY seq"
+        params = [str(day)]
+        if limit:
+            sql = "SELECT log_id FROM logs WHERE day = ? AND seq < ? ORDER BY seq"
+            params.append(limit)
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+    def day_count(self, day):
+        row = self.conn.execute("SELECT count FROM days WHERE day = ?", (str(day),)).fetchone()
+        return row[0] if row else 0
+
+    # ---------------- 待下载 ----------------
+    def todo(self, day, limit=None, max_attempts=MAX_ATTEMPTS):
+        """
+        某天还需要下载的牌谱 (pending 或失败次数未到上限)，走部分索引，只扫描未完成的行
+
+        Args:
+            limit: 只考虑当天列表的前 limit 个 (对应 DOWNLOAD_LIMIT_PER_DAY)
+        """
+        self.flush()
+        sql = "SELECT log_id FROM logs WHERE day = ? AND status != 'ok' AND attempts < ?"
+        params = [str(day), max_attempts]
+        if limit:
+            sql += " AND seq < ?"
+            params.append(limit)
+        return [row[0] for row in self.conn.execute(sql + " ORDER BY seq", params)]
+
+    def status_many(self, log_ids):
+        """批量查询状态: {log_id: status}，索引中没有的 ID 不出现在结果里"""
+        self.flush()
+        log_ids = list(log_ids)
+        result = {}
+        for i in range(0, len(log_ids), BULK_CHUNK):
+            chunk = log_ids[i:i + BULK_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            result.update(self.conn.execute(f"SELECT log_id, status FROM logs WHERE log_id IN ({marks})", chunk))
+        return result
+
+    def missing(self, log_ids):
+        """给定 ID 中尚未成功下载的 (保持原顺序)"""
+        status = self.status_many(log_ids)
+        return [log_id for log_id in log_ids if status.get(log_id) != OK]
+
+    # ---------------- 下载结果 ----------------
+    def record_ok(self, log_id, size, sha1=None):
+        self._record((OK, size, sha1, 0, None, time.time(), log_id))
+
+    def record_failed(self, log_id, error):
+        self._record((FAILED, None, None, 1, str(error)[:500], time.time(), log_id))
+
+    def _record(self, update):
+        with self.lock:
+            self._updates.append(update)
+            if len(self._updates) >= COMMIT_EVERY:
+                self._flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._updates:
+            return
+        updates, self._updates = self._updates, []
+        with self.conn:
+            # 先保证行存在 (不在任何每日列表中的 ID，例如直接下载的)
+            self.conn.executemany("INSERT OR IGNORE INTO logs (log_id) VALUES (?)", ((u[-1],) for u in updates))
+            self.conn.executemany(
+                "UPDATE logs SET status = ?, size = COALESCE(?, size), sha1 = COALESCE(?, sha1), "
+                "attempts = attempts + ?, error = ?, updated = ? WHERE log_id = ?", updates)
+
+    def reset_failed(self, day=None):
+        """把失败记录的尝试次数清零，下次运行时重新下载"""
+        self.flush()
+        with self.lock, self.conn:
+            sql = "UPDATE logs SET attempts = 0 WHERE status = 'failed'"
+            params = ()
+            if day is not None:
+                sql, params = sql + " AND day = ?", (str(day),)
+            return self.conn.execute(sql, params).rowcount
+
+    # ---------------- 迁移与校验 ----------------
+    def import_dir(self, save_dir):
+        """把目录中已有的 .mjlog 登记为 ok (只记录大小，不计算摘要)，返回登记数"""
+        rows = []
+        now = time.time()
+        with os.scandir(save_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".mjlog") and entry.is_file():
+                    rows.append((entry.name[:-len(".mjlog")], entry.stat().st_size, now))
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO logs (log_id, status, size, updated) VALUES (?, 'ok', ?, ?) "
+                "ON CONFLICT (log_id) DO UPDATE SET status = 'ok', size = excluded.size, updated = excluded.updated",
+                ((log_id, size, ts) for log_id, size, ts in rows))
+        return len(rows)
+
+    def verify(self, save_dir):
+        """检查标记为 ok 的文件是否存在且大小一致，不一致的改回 pending，返回改动数"""
+        self.flush()
+        present = {}
+        with os.scandir(save_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".mjlog"):
+                    present[entry.name[:-len(".mjlog")]] = entry.stat().st_size
+        bad = [log_id for log_id, size in self.conn.execute("SELECT log_id, size FROM logs WHERE status = 'ok'")
+               if log_id not in present or (size is not None and present[log_id] != size)]
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE logs SET status = 'pending' WHERE log_id = ?", ((b,) for b in bad))
+        return len(bad)
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM logs LIMIT 1").fetchone() is None
+
+    def summary(self):
+        """{状态: 数量}"""
+        self.flush()
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM logs GROUP BY status"))
+
+    def day_summary(self):
+        """[(日期, 列表数, ok 数)]"""
+        self.flush()
+        ok = dict(self.conn.execute("SELECT day, COUNT(*) FROM logs WHERE status = 'ok' GROUP BY day"))
+        return [(day, count, ok.get(day, 0))
+                for day, count in self.conn.execute("SELECT day, count FROM days ORDER BY day")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="下载状态索引")
+    parser.add_argument("--index", default=INDEX_PATH)
+    parser.add_argument("--import-dir", metavar="DIR", help="把目录中已有的 .mjlog 登记为已下载")
+    parser.add_argument("--verify", metavar="DIR", nargs="?", const="./data/raw_mjlog",
+                        help="检查已下载的文件是否仍在磁盘上")
+    parser.add_argument("--reset-failed", action="store_true", help="失败记录的尝试次数清零")
+    args = parser.parse_args()
+
+    with DownloadIndex(args.index) as index:
+        if args.import_dir:
+            print(f"已登记 {index.import_dir(args.import_dir)} 个文件")
+        if args.verify:
+            print(f"{index.verify(args.verify)} 个文件缺失或大小不符，已改回 pending")
+        if args.reset_failed:
+            print(f"已重置 {index.reset_failed()} 条失败记录")
+        for day, count, ok in index.day_summary():
+            print(f"  {day}: {ok}/{count}")
+        summary = index.summary()
+        print("  ".join(f"{status} {summary.get(status, 0)}" for status in (OK, PENDING, FAILED)))
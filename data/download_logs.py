@@ -2,9 +2,15 @@ import os
 import requests
 import gzip
 import re
+import hashlib
 import time
 import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import date, timedelta
+from requests.adapters import HTTPAdapter
+from download_index import DownloadIndex, INDEX_PATH
 
 # --- 配置区 ---
 START_DATE = date(2026, 1, 1)  # 2026年1月1日
@@ -17,6 +23,23 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Referer": "https://tenhou.net/"
 }
+# 每日列表与单个牌谱的地址模板 (测试时可指向本地 HTTP 服务)
+LIST_URL = "https://tenhou.net/sc/raw/dat/{filename}"
+LOG_URL = "https://tenhou.net/0/log/?{log_id}"
+
+# --- 并发与限速 ---
+MAX_IN_FLIGHT = 4       # 同时进行中的请求数上限 (也是连接池大小)
+RATE_PER_SEC = 0.75     # 令牌桶平均速率: 每秒最多发起多少个请求
+BURST = 4               # 令牌桶容量: 空闲后允许的突发请求数
+MAX_RETRIES = 4         # 失败后的最大重试次数
+BACKOFF_BASE = 1.0      # 指数退避基数 (秒): 第 n 次重试前等待 BACKOFF_BASE * 2^n + 随机抖动
+TIMEOUT = 15            # 单个请求超时 (秒)
+
+# --- 下载状态索引 ---
+# 每个牌谱的状态 / 大小 / SHA-1 / 尝试次数与已解析的每日列表记录在 SQLite (INDEX_PATH) 中，
+# 续传时只处理未完成或失败的牌谱，不再对目录逐个 os.path.exists，也不再重新下载解析旧的每日列表。
+# 设为 False 恢复按文件是否存在判断
+USE_INDEX = True
 # ----------------
 
 def setup_dir():
@@ -24,72 +47,260 @@ def setup_dir():
         os.makedirs(SAVE_DIR)
         print(f"创建目录: {SAVE_DIR}")
 
-def get_log_ids_for_date(target_date):
-    # 构造文件名: scc2026010100.html.gz
-    date_str = target_date.strftime("%Y%m%d")
-    filename = f"scc{date_str}00.html.gz"
-    
-    # --- 修正点: 使用 dat 目录 ---
-    url = f"https://tenhou.net/sc/raw/dat/{filename}"
-    
-    print(f"\n[列表] 正在获取 {target_date} 的数据: {url}")
-    
-    try:
-        resp = requests.get(url, headers=HEADERS)
-        if resp.status_code == 404:
-            print(f"[提示] {target_date} 的文件不存在 (可能日期不对或未归档)")
+
+class TokenBucket:
+    """
+    线程安全的令牌桶限速器。
+    以 rate 个/秒的速度补充令牌，最多攒 capacity 个；每个请求消耗一个令牌，
+    没有令牌时阻塞等待。相比固定 sleep，空闲期攒下的令牌可以让后续请求立刻发出。
+    """
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class LogDownloader:
+    """
+    并发下载引擎：连接池 Session + 有界并发 + 令牌桶限速 + 指数退避重试。
+    牌谱先写入同目录下的 .part 临时文件，写完后再原子 rename 为 .mjlog，
+    因此中途崩溃不会留下被 os.path.exists 误判为"已完成"的半截文件。
+
+    传入 index (DownloadIndex) 时，是否已下载以索引为准，每日列表也从索引缓存读取。
+    """
+    def __init__(self, save_dir=SAVE_DIR, max_in_flight=MAX_IN_FLIGHT, rate=RATE_PER_SEC,
+                 burst=BURST, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+                 timeout=TIMEOUT, list_url=LIST_URL, log_url=LOG_URL, index=None):
+        self.save_dir = save_dir
+        self.index = index
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.list_url = list_url
+        self.log_url = log_url
+        self.bucket = TokenBucket(rate, burst)
+
+        # 复用 TCP/TLS 连接，连接池大小与并发数一致
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def _get(self, url):
+        """带限速和重试的 GET。404 等客户端错误直接返回，网络异常 / 429 / 5xx 会重试"""
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                resp = self.session.get(url, timeout=self.timeout)
+                if resp.status_code != 429 and resp.status_code < 500:
+                    return resp
+                error = f"HTTP {resp.status_code}"
+            except requests.RequestException as e:
+                error = e
+            if attempt >= self.max_retries:
+                raise RuntimeError(f"重试 {attempt} 次后仍失败: {error}")
+            time.sleep(self.backoff_base * (2 ** attempt) * random.uniform(1.0, 1.5))
+            attempt += 1
+
+    def get_log_ids_for_date(self, target_date, refresh=False):
+        # 已归档的日期列表不会再变化，解析过一次就从索引读取
+        if self.index is not None and not refresh and self.index.has_day(target_date):
+            return self.index.day_ids(target_date)
+
+        # 构造文件名: scc2026010100.html.gz
+        date_str = target_date.strftime("%Y%m%d")
+        filename = f"scc{date_str}00.html.gz"
+        url = self.list_url.format(filename=filename)
+
+        print(f"\n[列表] 正在获取 {target_date} 的数据: {url}")
+
+        try:
+            resp = self._get(url)
+            if resp.status_code == 404:
+                print(f"[提示] {target_date} 的文件不存在 (可能日期不对或未归档)")
+                return []
+            resp.raise_for_status()
+
+            content = gzip.decompress(resp.content).decode('utf-8')
+
+            # 解析 Log ID
+            pattern = r'log=([^"]+)'
+            ids = re.findall(pattern, content)
+            print(f"[列表] 找到 {len(ids)} 个牌谱")
+            # 当天的列表可能还在增长，只缓存已经过去的日期
+            if self.index is not None and target_date < date.today():
+                self.index.add_day(target_date, ids)
+            return ids
+        except Exception as e:
+            print(f"[错误] 获取列表失败: {e}")
             return []
-        resp.raise_for_status()
-        
-        content = gzip.decompress(resp.content).decode('utf-8')
-        
-        # 解析 Log ID
-        pattern = r'log=([^"]+)'
-        ids = re.findall(pattern, content)
-        print(f"[列表] 找到 {len(ids)} 个牌谱")
-        return ids
-    except Exception as e:
-        print(f"[错误] 获取列表失败: {e}")
-        return []
 
-def download_log(log_id):
-    path = os.path.join(SAVE_DIR, f"{log_id}.mjlog")
-    if os.path.exists(path):
-        return # 已存在跳过
-    
-    url = f"https://tenhou.net/0/log/?{log_id}"
-    try:
-        resp = requests.get(url, headers=HEADERS, timeout=15)
-        if resp.status_code == 200:
-            with open(path, "wb") as f:
-                f.write(resp.content)
-            print(f"  - 下载成功: {log_id}")
-        else:
+    def fetch_log(self, log_id):
+        """下载单个牌谱的内容 (bytes)，失败返回 None (有索引时记录失败)"""
+        url = self.log_url.format(log_id=log_id)
+        try:
+            resp = self._get(url)
+        except Exception as e:
+            print(f"  - 异常: {log_id} {e}")
+            self._record_failed(log_id, e)
+            return None
+        if resp.status_code != 200:
             print(f"  - 下载失败 {resp.status_code}: {log_id}")
-    except Exception as e:
-        print(f"  - 异常: {log_id} {e}")
+            self._record_failed(log_id, f"HTTP {resp.status_code}")
+            return None
+        return resp.content
+
+    def save_log(self, log_id, content, record=True):
+        """
+        把牌谱内容原子地写入 save_dir，返回文件路径
+        有索引且 record 为 True 时记为已下载 (流水线等到转换结果落盘后才记录，见 pipeline.py)
+        """
+        path = os.path.join(self.save_dir, f"{log_id}.mjlog")
+        # 先写临时文件，完整落盘后再原子替换
+        fd, tmp_path = tempfile.mkstemp(dir=self.save_dir, prefix=f"{log_id}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        if record and self.index is not None:
+            self.index.record_ok(log_id, len(content), hashlib.sha1(content).hexdigest())
+        return path
+
+    def download_log(self, log_id):
+        """
+        下载单个牌谱。
+        返回 "skipped" (已存在) / "ok" (下载成功) / "failed" (失败)
+        有索引时由调用方 (download_many / 索引的 todo) 负责跳过已下载的牌谱
+        """
+        path = os.path.join(self.save_dir, f"{log_id}.mjlog")
+        if self.index is None and os.path.exists(path):
+            return "skipped" # 已存在跳过
+
+        content = self.fetch_log(log_id)
+        if content is None:
+            return "failed"
+        try:
+            self.save_log(log_id, content)
+            return "ok"
+        except Exception as e:
+            print(f"  - 异常: {log_id} {e}")
+            self._record_failed(log_id, e)
+            return "failed"
+
+    def _record_failed(self, log_id, error):
+        if self.index is not None:
+            self.index.record_failed(log_id, error)
+
+    def download_many(self, log_ids):
+        """
+        并发下载一批牌谱，最多同时提交 2 * max_in_flight 个任务，
+        避免百万级 ID 一次性塞进线程池队列。返回各状态的计数。
+        有索引时先批量查询，已下载的直接计入 skipped。
+        """
+        counts = {"ok": 0, "skipped": 0, "failed": 0}
+        if self.index is not None:
+            log_ids = list(log_ids)
+            todo = self.index.missing(log_ids)
+            counts["skipped"] = len(log_ids) - len(todo)
+            log_ids = todo
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            for lid in log_ids:
+                if len(pending) >= 2 * self.max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        counts[fut.result()] += 1
+                pending.add(pool.submit(self.download_log, lid))
+            for fut in wait(pending).done:
+                counts[fut.result()] += 1
+        if self.index is not None:
+            self.index.flush()
+        return counts
+
+
+# 兼容旧接口：模块级函数使用默认配置的下载器
+_default_downloader = None
+
+def _get_default_downloader():
+    global _default_downloader
+    if _default_downloader is None:
+        _default_downloader = LogDownloader()
+    return _default_downloader
+
+def get_log_ids_for_date(target_date):
+    return _get_default_downloader().get_log_ids_for_date(target_date)
+
+def download_log(log_id):
+    return _get_default_downloader().download_log(log_id)
+
+def open_index(path=INDEX_PATH, save_dir=SAVE_DIR):
+    """打开下载状态索引；第一次使用时把 save_dir 中已有的牌谱登记为已下载"""
+    index = DownloadIndex(path)
+    if index.is_empty() and os.path.isdir(save_dir):
+        n = index.import_dir(save_dir)
+        if n:
+            print(f"[索引] 已登记目录中已有的 {n} 个牌谱")
+    return index
 
 def main():
     setup_dir()
-    
-    current_date = START_DATE
-    while current_date <= END_DATE:
-        log_ids = get_log_ids_for_date(current_date)
-        
-        count = 0
-        for lid in log_ids:
-            if DOWNLOAD_LIMIT_PER_DAY and count >= DOWNLOAD_LIMIT_PER_DAY:
-                break
-            
-            download_log(lid)
-            count += 1
-            # 随机休眠
-            time.sleep(random.uniform(1.0, 2.0))
-            
-        current_date += timedelta(days=1)
-        time.sleep(1)
-
-    print(f"\n任务完成！请检查目录: {os.path.abspath(SAVE_DIR)}")
+    index = open_index() if USE_INDEX else None
+    downloader = LogDownloader(index=index)
+    total = {"ok": 0, "skipped": 0, "failed": 0}
+
+    try:
+        current_date = START_DATE
+        while current_date <= END_DATE:
+            if index is None or not index.has_day(current_date):
+                log_ids = downloader.get_log_ids_for_date(current_date)
+            if index is not None and index.has_day(current_date):
+                # 列表已缓存: 只取未完成 / 失败的牌谱，已完成的部分不再逐个检查
+                listed = index.day_count(current_date)
+                if DOWNLOAD_LIMIT_PER_DAY:
+                    listed = min(listed, DOWNLOAD_LIMIT_PER_DAY)
+                todo = index.todo(current_date, DOWNLOAD_LIMIT_PER_DAY)
+                counts = downloader.download_many(todo)
+                counts["skipped"] += listed - len(todo)
+            else:
+                if DOWNLOAD_LIMIT_PER_DAY:
+                    log_ids = log_ids[:DOWNLOAD_LIMIT_PER_DAY]
+                counts = downloader.download_many(log_ids)
+
+            for k, v in counts.items():
+                total[k] += v
+            print(f"[下载] {current_date}: 成功 {counts['ok']} 跳过 {counts['skipped']} 失败 {counts['failed']}")
+
+            current_date += timedelta(days=1)
+    finally:
+        downloader.close()
+        if index is not None:
+            index.close()
+
+    print(f"\n任务完成！成功 {total['ok']} 跳过 {total['skipped']} 失败 {total['failed']}")
+    print(f"请检查目录: {os.path.abspath(SAVE_DIR)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,314 @@
+import os
+import glob
+import numpy as np
+from tile_codec import CODE_KINDS, KIND_CODES
+from meld_codec import NAKI_TYPE_NAMES, NAKI_TYPE_IDS
+
+# 📦 二进制事件存储
+# 把转换后的事件流编码为定长记录 (numpy 结构化数组)，按分片 (shard) 写入磁盘。
+# 每个分片由三个文件组成:
+#   shard-00000.events.npy : 所有事件记录，可以 np.load(mmap_mode='r') 内存映射
+#   shard-00000.games.npy  : 每局游戏在 events 中的 [start, end) 偏移 + 小局索引范围
+#   shard-00000.kyoku.npy  : 每个小局 (start_kyoku 到下一个 start_kyoku 之前) 的偏移
+# 读取任意一局只需要切片，无需解析 JSON。
+
+# 事件类型枚举
+START_KYOKU = 0
+HAIPAI = 1       # 配牌：每张起手牌一条记录，紧跟在 START_KYOKU 之后
+TSUMO = 2
+DAHAI = 3
+NAKI = 4
+REACH = 5
+HORA = 6
+RYUKYOKU = 7
+DORA = 8
+
+EVENT_TYPE_NAMES = ["start_kyoku", "haipai", "tsumo", "dahai", "naki", "reach", "hora", "ryukyoku", "dora"]
+EVENT_TYPE_IDS = {name: i for i, name in enumerate(EVENT_TYPE_NAMES)}
+
+# 定长事件记录 (12 字节)，各字段含义随事件类型变化:
+#   类型          actor      tile        flag      arg0     arg1     arg2
+#   START_KYOKU   -1         宝牌指示牌   场风 0-3   局 1-4   本场数   供托数
+#   HAIPAI        座位       起手牌       -         -        -        -
+#   TSUMO/DAHAI   座位       牌           -         -        -        -
+#   NAKI          座位       被鸣的牌     副露类型   对象座位  -        自己拿出的牌 (打包)
+#   REACH         座位       -1          step      -        -        -
+#   HORA/RYUKYOKU -1         -1          -         -        -        -
+#   DORA          -1         新宝牌指示牌 -         -        -        -
+# tile 为 0-33 的牌种索引 (万 0-8, 筒 9-17, 条 18-26, 字 27-33)，-1 表示无
+# NAKI 的副露类型取 meld_codec 中的枚举；自己拿出的牌 (最多 4 张) 每张占 6 位，存 牌种+1
+RECORD_DTYPE = np.dtype([
+    ("type", "u1"),
+    ("actor", "i1"),
+    ("tile", "i1"),
+    ("flag", "u1"),
+    ("arg0", "i2"),
+    ("arg1", "i2"),
+    ("arg2", "i4"),
+])
+
+GAME_INDEX_DTYPE = np.dtype([
+    ("game_id", "S64"),
+    ("start", "i8"),
+    ("end", "i8"),
+    ("kyoku_start", "i4"),
+    ("kyoku_end", "i4"),
+])
+
+KYOKU_INDEX_DTYPE = np.dtype([
+    ("game", "i4"),     # 在本分片 games 数组中的下标
+    ("start", "i8"),
+    ("end", "i8"),
+])
+
+# 📏 分片配置
+# SHARD_MAX_RECORDS: 单个分片最多容纳的事件记录数 (约 48MB)
+SHARD_MAX_RECORDS = 4_000_000
+
+BAKAZE_NAMES = ["E", "S", "W", "N"]
+_BAKAZE_IDS = {w: i for i, w in enumerate(BAKAZE_NAMES)}
+
+
+def _tile_index(code):
+    return CODE_KINDS.get(code, -1) if code else -1
+
+
+def _tile_code(idx):
+    return KIND_CODES[idx] if idx >= 0 else None
+
+
+def _pack_kinds(codes):
+    packed = 0
+    for i, code in enumerate(codes):
+        packed |= (_tile_index(code) + 1) << (6 * i)
+    return packed
+
+
+def unpack_kinds(packed, as_codes=True):
+    """解包 NAKI 记录的 arg2 字段，返回牌代码列表 (as_codes=False 时返回牌种)"""
+    kinds = []
+    while packed:
+        kinds.append((packed & 0x3F) - 1)
+        packed >>= 6
+    return [KIND_CODES[k] for k in kinds] if as_codes else kinds
+
+
+def encode_events(events):
+    """
+    把 convert_to_json 产出的事件字典序列编码为 RECORD_DTYPE 数组
+
+    Args:
+        events: 事件字典的可迭代对象 (如 iter_mjlog_events 的输出)
+
+    Returns:
+        一维 numpy 结构化数组
+    """
+    rows = []
+    for event in events:
+        etype = event.get("type")
+        if etype == "start_kyoku":
+            rows.append((START_KYOKU, -1, _tile_index(event.get("dora_marker")),
+                         _BAKAZE_IDS.get(event.get("bakaze"), 0), event.get("kyoku", 1),
+                         event.get("honba", 0), event.get("kyotaku", 0)))
+            for seat, hand in enumerate(event.get("tehais", [])):
+                for code in hand:
+                    rows.append((HAIPAI, seat, _tile_index(code), 0, 0, 0, 0))
+        elif etype in ("tsumo", "dahai"):
+            rows.append((EVENT_TYPE_IDS[etype], event["actor"], _tile_index(event.get("pai")), 0, 0, 0, 0))
+        elif etype == "naki":
+            rows.append((NAKI, event["who"], _tile_index(event.get("pai")),
+                         NAKI_TYPE_IDS[event["naki_type"]], event["target"], 0,
+                         _pack_kinds(event["consumed"])))
+        elif etype == "reach":
+            rows.append((REACH, event["who"], -1, int(event.get("step") or 0), 0, 0, 0))
+        elif etype in ("hora", "ryukyoku"):
+            rows.append((EVENT_TYPE_IDS[etype], -1, -1, 0, 0, 0, 0))
+        elif etype == "dora":
+            rows.append((DORA, -1, _tile_index(event.get("dora_marker")), 0, 0, 0, 0))
+    return np.array(rows, dtype=RECORD_DTYPE)
+
+
+def decode_records(records):
+    """
+    encode_events 的逆过程：把记录数组还原为事件字典列表 (与 JSON 输出格式一致)
+    """
+    events = []
+    current = None  # 最近的 start_kyoku 事件，用于收集 HAIPAI
+    for r in records.tolist():
+        etype, actor, tile, flag, arg0, arg1, arg2 = r
+        if etype == START_KYOKU:
+            current = {
+                "type": "start_kyoku",
+                "bakaze": BAKAZE_NAMES[flag],
+                "kyoku": arg0,
+                "honba": arg1,
+                "kyotaku": arg2,
+                "dora_marker": _tile_code(tile),
+                "tehais": [[], [], [], []],
+            }
+            events.append(current)
+        elif etype == HAIPAI:
+            current["tehais"][actor].append(_tile_code(tile))
+        elif etype in (TSUMO, DAHAI):
+            events.append({"type": EVENT_TYPE_NAMES[etype], "actor": actor, "pai": _tile_code(tile)})
+        elif etype == NAKI:
+            events.append({"type": "naki", "who": actor, "naki_type": NAKI_TYPE_NAMES[flag],
+                           "target": arg0, "pai": _tile_code(tile), "consumed": unpack_kinds(arg2)})
+        elif etype == REACH:
+            events.append({"type": "reach", "who": actor, "step": str(flag)})
+        elif etype == DORA:
+            events.append({"type": "dora", "dora_marker": _tile_code(tile)})
+        else:
+            events.append({"type": EVENT_TYPE_NAMES[etype]})
+    return events
+
+
+def _save_npy_atomic(path, array):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def next_shard_no(directory, prefix="shard-", suffix=".events.npy"):
+    """
+    目录中已有分片的最大编号 + 1 (没有分片时为 0)
+    按编号而不是按文件数计算，删除过中间的分片后也不会覆盖已有的文件
+    """
+    numbers = [int(name[len(prefix):-len(suffix)]) for name in os.listdir(directory)
+               if name.startswith(prefix) and name.endswith(suffix) and name[len(prefix):-len(suffix)].isdigit()]
+    return max(numbers) + 1 if numbers else 0
+
+
+def stored_game_ids(out_dir):
+    """目录中已经落盘的分片里保存的所有游戏 ID (只读 games 索引，不打开 events)"""
+    ids = set()
+    if not os.path.isdir(out_dir):
+        return ids
+    for events_path in glob.glob(os.path.join(out_dir, "shard-*.events.npy")):
+        games = np.load(events_path[:-len(".events.npy")] + ".games.npy")
+        ids.update(gid.decode("utf-8") for gid in games["game_id"].tolist())
+    return ids
+
+
+class ShardWriter:
+    """
+    按顺序追加整局游戏的记录，累计到 shard_max_records 后写出一个分片。
+    一局游戏不会跨分片。
+    """
+    def __init__(self, out_dir, shard_max_records=SHARD_MAX_RECORDS):
+        self.out_dir = out_dir
+        self.shard_max_records = shard_max_records
+        os.makedirs(out_dir, exist_ok=True)
+        self.shard_no = next_shard_no(out_dir)
+        self._reset()
+
+    def _reset(self):
+        self.chunks = []
+        self.games = []
+        self.kyokus = []
+        self.n_records = 0
+
+    def add_game(self, game_id, records):
+        """
+        追加一局游戏的记录 (encode_events 的结果)
+
+        Returns:
+            如果追加前缓冲已满而写出了一个分片，返回该分片名，否则返回 None。
+            调用方可据此确认此前追加的游戏已经落盘。
+        """
+        flushed = None
+        if self.n_records and self.n_records + len(records) > self.shard_max_records:
+            flushed = self.flush()
+
+        start = self.n_records
+        game_idx = len(self.games)
+        kyoku_first = len(self.kyokus)
+        # 小局边界: 每个 START_KYOKU 记录的位置
+        bounds = np.flatnonzero(records["type"] == START_KYOKU).tolist() + [len(records)]
+        for k_start, k_end in zip(bounds[:-1], bounds[1:]):
+            self.kyokus.append((game_idx, start + k_start, start + k_end))
+
+        self.chunks.append(records)
+        self.n_records += len(records)
+        self.games.append((game_id.encode("utf-8"), start, self.n_records, kyoku_first, len(self.kyokus)))
+        return flushed
+
+    def flush(self):
+        """把当前缓冲写成一个分片，返回分片名 (缓冲为空时返回 None)"""
+        if not self.games:
+            return None
+        name = f"shard-{self.shard_no:05d}"
+        base = os.path.join(self.out_dir, name)
+        events = np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=RECORD_DTYPE)
+        # 索引先写，events 最后写：EventStore 只认 events 文件存在的分片
+        _save_npy_atomic(base + ".games.npy", np.array(self.games, dtype=GAME_INDEX_DTYPE))
+        _save_npy_atomic(base + ".kyoku.npy", np.array(self.kyokus, dtype=KYOKU_INDEX_DTYPE))
+        _save_npy_atomic(base + ".events.npy", events)
+        self.shard_no += 1
+        self._reset()
+        return name
+
+    def close(self):
+        return self.flush()
+
+
+class EventStore:
+    """
+    以内存映射方式打开二进制分片目录，按游戏 ID 随机访问
+
+    用法:
+        store = EventStore("./data/bin_logs")
+        records = store.game("2026013000gm-00a9-0000-0cb89d26")
+        for kyoku in store.kyokus(game_id): ...
+    """
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.shards = []
+        self.locator = {}   # game_id -> (分片下标, games 数组下标)
+        for events_path in sorted(glob.glob(os.path.join(out_dir, "shard-*.events.npy"))):
+            base = events_path[:-len(".events.npy")]
+            shard = {
+                "base": base,   # 分片路径前缀 (不含 .events.npy 等后缀)
+                "events": np.load(events_path, mmap_mode="r"),
+                "games": np.load(base + ".games.npy"),
+                "kyoku": np.load(base + ".kyoku.npy"),
+            }
+            shard_idx = len(self.shards)
+            self.shards.append(shard)
+            # 同一局在后面的分片中重新出现 (源文件变化后重新转换) 时，以最新的为准
+            for i, gid in enumerate(shard["games"]["game_id"].tolist()):
+                self.locator[gid.decode("utf-8")] = (shard_idx, i)
+
+    def __len__(self):
+        return len(self.locator)
+
+    def __contains__(self, game_id):
+        return game_id in self.locator
+
+    def game_ids(self):
+        return list(self.locator)
+
+    def game(self, game_id):
+        """返回一局游戏的记录切片 (内存映射视图，不复制数据)"""
+        shard_idx, i = self.locator[game_id]
+        shard = self.shards[shard_idx]
+        g = shard["games"][i]
+        return shard["events"][g["start"]:g["end"]]
+
+    def kyokus(self, game_id):
+        """返回一局游戏中每个小局的记录切片列表"""
+        shard_idx, i = self.locator[game_id]
+        shard = self.shards[shard_idx]
+        g = shard["games"][i]
+        events = shard["events"]
+        return [events[k["start"]:k["end"]] for k in shard["kyoku"][g["kyoku_start"]:g["kyoku_end"]]]
+
+    def iter_games(self):
+        """
+        按分片顺序遍历 (game_id, 记录切片)，同一局只出现最新的一份
+        按 (分片, 分片内位置) 排序，而不是 locator 的插入顺序 (重新加入的游戏会留在第一次出现的位置)
+        """
+        for game_id, _ in sorted(self.locator.items(), key=lambda item: item[1]):
+            yield game_id, self.game(game_id)
+
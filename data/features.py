@@ -0,0 +1,265 @@
+import numpy as np
+from tile_codec import CODE_KINDS, NUM_KINDS
+
+# 🧠 特征工程：把转换后的事件流变成 (Observation, Action) 样本
+#
+# FeatureTracker 只顺序消费一次事件流，在预分配的 numpy 平面上原地更新状态，
+# 每个事件只改动常数个格子；到决策点 (切牌) 时把当前视角的平面拷贝出来作为观测，
+# 不需要从小局开头重放。
+#
+# 观测张量形状为 [NUM_CHANNELS, 34]，座位均为相对视角 (0=自己, 1=下家, 2=对家, 3=上家):
+#   0-3    自己的手牌          (温度计编码: 第 n 个通道表示该牌至少有 n+1 张)
+#   4-19   各家牌河            (每家 4 个通道，温度计编码)
+#   20-35  各家副露            (每家 4 个通道，温度计编码)
+#   36-39  宝牌指示牌          (温度计编码)
+#   40-43  各家是否立直        (整行为 1)
+#   44-47  场风 one-hot        (整行为 1)
+#   48-51  自风 one-hot        (整行为 1)
+#   52     剩余牌数 / 70       (整行)
+#   53     刚摸到的牌          (one-hot，鸣牌后的切牌为全 0)
+# 动作为 34 种牌的切牌，合法动作掩码为手里有的牌 (立直后只能摸切)。
+
+NUM_CHANNELS = 54
+HAND_CH = 0
+DISCARD_CH = 4
+MELD_CH = 20
+DORA_CH = 36
+REACH_CH = 40
+BAKAZE_CH = 44
+JIKAZE_CH = 48
+REMAIN_CH = 52
+DRAW_CH = 53
+
+# 一局开始时牌山中可摸的牌数 (136 - 14 王牌 - 52 配牌)
+WALL_TILES = 70
+
+# compact 观测 (uint8) 转回 float32 时逐通道乘的系数，形状 [NUM_CHANNELS, 1]
+OBS_SCALE = np.ones((NUM_CHANNELS, 1), dtype=np.float32)
+OBS_SCALE[REMAIN_CH] = 1.0 / WALL_TILES
+
+_BAKAZE_IDS = {"E": 0, "S": 1, "W": 2, "N": 3}
+
+# 内部以"绝对座位"布局保存状态平面，每个事件只改一个格子；
+# 输出观测时按决策者座位做一次通道置换 (np.take)，得到相对视角。
+_A_HAND = 0         # 4 家手牌，各 4 通道
+_A_DISCARD = 16     # 4 家牌河，各 4 通道
+_A_MELD = 32        # 4 家副露，各 4 通道
+_A_DORA = 48        # 宝牌指示牌，4 通道
+_A_REACH = 52       # 4 家立直
+_A_BAKAZE = 56      # 场风 one-hot
+_A_JIKAZE = 60      # 4 家自风 one-hot，各 4 通道
+_A_DRAW = 76        # 4 家刚摸到的牌
+_A_REMAIN = 80      # 剩余牌数 (占位，始终为 0，输出时再填入)
+_A_CHANNELS = 81
+
+
+def _build_perm(seat):
+    """座位 seat 视角下，输出通道 -> 绝对布局通道 的映射"""
+    perm = []
+    perm += [_A_HAND + 4 * seat + n for n in range(4)]
+    for base in (_A_DISCARD, _A_MELD):
+        for r in range(4):
+            perm += [base + 4 * ((seat + r) % 4) + n for n in range(4)]
+    perm += [_A_DORA + n for n in range(4)]
+    perm += [_A_REACH + (seat + r) % 4 for r in range(4)]
+    perm += [_A_BAKAZE + n for n in range(4)]
+    perm += [_A_JIKAZE + 4 * seat + n for n in range(4)]
+    perm += [_A_REMAIN, _A_DRAW + seat]
+    return np.array(perm, dtype=np.intp)
+
+
+_PERMS = [_build_perm(seat) for seat in range(4)]
+_PERM_TABLE = np.stack(_PERMS)
+
+
+class FeatureTracker:
+    """
+    增量状态追踪器
+
+    用法:
+        tracker = FeatureTracker()
+        obs, mask, labels, seats = tracker.encode_game(events)
+    或者逐个事件调用 process()，自行决定把观测写到哪里 (例如 DataLoader 的批数组)。
+    """
+    def __init__(self):
+        # 状态平面只含 0/1，用 uint8 保存，快照拷贝更便宜
+        self.planes = np.zeros((_A_CHANNELS, NUM_KINDS), dtype=np.uint8)
+        # 计数用纯 Python 列表：标量读写比 numpy 快得多
+        self.hands = [[0] * NUM_KINDS for _ in range(4)]
+        self.discards = [[0] * NUM_KINDS for _ in range(4)]
+        self.melds = [[0] * NUM_KINDS for _ in range(4)]
+        self.dora = [0] * NUM_KINDS
+        self.reach = [False] * 4
+        self.last_draw = [-1] * 4
+        self.remaining = WALL_TILES
+
+    # ------------------------------------------------------------
+    # 平面更新的基本操作
+    # ------------------------------------------------------------
+    def _add(self, counts, base, kind):
+        c = counts[kind]
+        counts[kind] = c + 1
+        self.planes[base + c, kind] = 1
+
+    def _remove(self, counts, base, kind):
+        c = counts[kind] - 1
+        counts[kind] = c
+        self.planes[base + c, kind] = 0
+
+    def _clear_draw(self, seat):
+        if self.last_draw[seat] >= 0:
+            self.planes[_A_DRAW + seat, self.last_draw[seat]] = 0
+            self.last_draw[seat] = -1
+
+    # ------------------------------------------------------------
+    # 事件处理
+    # ------------------------------------------------------------
+    def start_kyoku(self, event):
+        """重置状态并载入配牌 (每个小局开始时调用一次)"""
+        self.planes.fill(0)
+        for seat in range(4):
+            self.hands[seat] = [0] * NUM_KINDS
+            self.discards[seat] = [0] * NUM_KINDS
+            self.melds[seat] = [0] * NUM_KINDS
+        self.dora = [0] * NUM_KINDS
+        self.reach = [False] * 4
+        self.last_draw = [-1] * 4
+        self.remaining = WALL_TILES
+
+        self._add(self.dora, _A_DORA, CODE_KINDS[event["dora_marker"]])
+        self.planes[_A_BAKAZE + _BAKAZE_IDS.get(event.get("bakaze"), 0), :] = 1
+        oya = event.get("kyoku", 1) - 1
+        for seat in range(4):
+            self.planes[_A_JIKAZE + 4 * seat + (seat - oya) % 4, :] = 1
+        for seat, hand in enumerate(event.get("tehais", [])):
+            for code in hand:
+                self._add(self.hands[seat], _A_HAND + 4 * seat, CODE_KINDS[code])
+
+    def observe(self, seat, obs_out, mask_out=None):
+        """把 seat 视角的当前观测写入 obs_out ([NUM_CHANNELS, 34])，可选写入合法切牌掩码"""
+        obs_out[:] = self.planes[_PERMS[seat]]
+        obs_out[REMAIN_CH, :] = self.remaining / WALL_TILES
+        if mask_out is not None:
+            if self.reach[seat] and self.last_draw[seat] >= 0:
+                mask_out[:] = False
+                mask_out[self.last_draw[seat]] = True
+            else:
+                np.greater(self.planes[_A_HAND + 4 * seat], 0, out=mask_out)
+
+    def process(self, event, obs_out=None, mask_out=None):
+        """
+        处理一个事件
+
+        如果该事件是一个切牌决策点 (且不是立直后的强制摸切)，
+        先把决策前的观测写入 obs_out / mask_out，再应用事件，返回 (座位, 切出的牌种)；
+        其他事件返回 None。
+        """
+        etype = event["type"]
+
+        if etype == "tsumo":
+            seat = event["actor"]
+            kind = CODE_KINDS[event["pai"]]
+            self._add(self.hands[seat], _A_HAND + 4 * seat, kind)
+            self.planes[_A_DRAW + seat, kind] = 1
+            self.last_draw[seat] = kind
+            self.remaining -= 1
+            return None
+
+        if etype == "dahai":
+            seat = event["actor"]
+            kind = CODE_KINDS[event["pai"]]
+            result = None
+            if not self.reach[seat]:
+                if obs_out is not None:
+                    self.observe(seat, obs_out, mask_out)
+                result = (seat, kind)
+            self._remove(self.hands[seat], _A_HAND + 4 * seat, kind)
+            self._add(self.discards[seat], _A_DISCARD + 4 * seat, kind)
+            self._clear_draw(seat)
+            return result
+
+        if etype == "naki":
+            seat = event["who"]
+            hand, meld = self.hands[seat], self.melds[seat]
+            hand_base, meld_base = _A_HAND + 4 * seat, _A_MELD + 4 * seat
+            if event["naki_type"] == "kakan":
+                # 加杠: 从手里拿出加上的那一张，原来碰的三张已经在副露中
+                kind = CODE_KINDS[event["pai"]]
+                self._remove(hand, hand_base, kind)
+                self._add(meld, meld_base, kind)
+            else:
+                for code in event["consumed"]:
+                    kind = CODE_KINDS[code]
+                    self._remove(hand, hand_base, kind)
+                    self._add(meld, meld_base, kind)
+                if event.get("pai") is not None:
+                    self._add(meld, meld_base, CODE_KINDS[event["pai"]])
+            # 鸣牌后的切牌不是摸切，清除摸牌标记
+            self._clear_draw(seat)
+
+        elif etype == "reach":
+            # step 2 (立直成立) 之后的切牌都是强制摸切
+            if event.get("step") == "2":
+                seat = event["who"]
+                self.reach[seat] = True
+                self.planes[_A_REACH + seat, :] = 1
+
+        elif etype == "dora":
+            self._add(self.dora, _A_DORA, CODE_KINDS[event["dora_marker"]])
+
+        elif etype == "start_kyoku":
+            self.start_kyoku(event)
+
+        return None
+
+    def encode_game(self, events, compact=False):
+        """
+        把一整局的事件编码为样本数组
+
+        决策点上只把绝对布局的 uint8 平面快照下来，整局结束后再用一次向量化的
+        通道置换得到所有样本的相对视角观测，避免逐样本的 numpy 调用开销。
+
+        Args:
+            events: 一局的事件列表
+            compact: 为 True 时 obs 以 uint8 返回 (REMAIN_CH 为剩余牌数原值 0-70)，
+                     体积只有 float32 的 1/4，适合跨进程传输，使用前再乘以 OBS_SCALE
+
+        Returns:
+            obs:    float32 [N, NUM_CHANNELS, 34] (compact 时为 uint8)
+            mask:   bool    [N, 34]
+            labels: int8    [N]   切出的牌种
+            seats:  int8    [N]   决策者座位
+        """
+        events = events if isinstance(events, list) else list(events)
+        # 样本数不超过切牌事件数，按上界一次性分配
+        n_max = sum(1 for e in events if e["type"] == "dahai")
+        snaps = np.empty((n_max, _A_CHANNELS, NUM_KINDS), dtype=np.uint8)
+        remaining = np.empty(n_max, dtype=np.uint8)
+        labels = np.empty(n_max, dtype=np.int8)
+        seats = np.empty(n_max, dtype=np.intp)
+
+        n = 0
+        process = self.process
+        for event in events:
+            if event["type"] == "dahai" and not self.reach[event["actor"]]:
+                snaps[n] = self.planes
+                remaining[n] = self.remaining
+                seats[n], labels[n] = process(event)
+                n += 1
+            else:
+                process(event)
+
+        snaps, seats = snaps[:n], seats[:n]
+        # 立直后的强制摸切不会成为样本，因此掩码就是决策者手里有的牌
+        mask = snaps[np.arange(n), _A_HAND + 4 * seats] > 0
+        obs = snaps[np.arange(n)[:, None], _PERM_TABLE[seats]]
+        if compact:
+            obs[:, REMAIN_CH, :] = remaining[:n, None]
+        else:
+            obs = obs.astype(np.float32)
+            obs[:, REMAIN_CH, :] = (remaining[:n] / WALL_TILES)[:, None]
+        return obs, mask, labels[:n], seats.astype(np.int8)
+
+def encode_game(events):
+    """FeatureTracker().encode_game 的快捷方式"""
+    return FeatureTracker().encode_game(events)
@@ -0,0 +1,101 @@
+# 🀄 天凤鸣牌 (N 标签 m 属性) 解码
+#
+# m 是一个 16 位的位域，低 2 位是被鸣牌玩家相对鸣牌者的座位偏移 (0 表示自己)，
+# 第 2-5 位决定副露类型:
+#   bit2 (0x04) 吃:     bits 10-15 = 顺子编号 * 3 + 被鸣的是第几张，bits 3-8 每两位是三张牌各自的副本号 (0-3)
+#   bit3 (0x08) 碰:     bits 9-15  = 牌种 * 3 + 被鸣的是第几张，bits 5-6 是没用到的那一张副本号
+#   bit4 (0x10) 加杠:   同碰，bits 5-6 是加上去的那一张
+#   bit5 (0x20) 拔北:   三人麻将，bits 8-15 = 牌ID
+#   否则       杠:      bits 8-15 = 牌ID，座位偏移为 0 是暗杠，否则是大明杠
+# 解码结果采用 MJAI 约定: pai 为被鸣 (或加杠加上) 的牌，consumed 为从自己手里拿出的牌。
+
+CHI = 0
+PON = 1
+KAKAN = 2
+DAIMINKAN = 3
+ANKAN = 4
+NUKIDORA = 5
+
+NAKI_TYPE_NAMES = ["chi", "pon", "kakan", "daiminkan", "ankan", "nukidora"]
+NAKI_TYPE_IDS = {name: i for i, name in enumerate(NAKI_TYPE_NAMES)}
+NAKI_TYPE_LABELS = ["吃", "碰", "加杠", "大明杠", "暗杠", "拔北"]
+
+# 吃: 顺子编号 (0-20) -> 最小那张的牌种 (每门 7 种顺子: 123 ~ 789)
+_CHI_BASE_KINDS = tuple((t // 7) * 9 + t % 7 for t in range(21))
+
+
+def decode_meld(who, m):
+    """
+    解码一次鸣牌
+
+    Args:
+        who: 鸣牌玩家座位 (0-3)
+        m: N 标签的 m 属性 (int 或数字字符串)
+
+    Returns:
+        (副露类型, 被鸣牌玩家座位, 被鸣的牌ID, 自己拿出的牌ID 元组)
+        暗杠和拔北没有被鸣的牌 (为 None)，被鸣牌玩家就是自己；
+        加杠的被鸣牌玩家为原来碰的对象，被鸣的牌为加上去的那一张
+    """
+    m = int(m)
+    target = (who + (m & 3)) % 4
+
+    if m & 0x04:
+        t, r = divmod(m >> 10, 3)
+        base = _CHI_BASE_KINDS[t] * 4
+        tiles = [base + 4 * i + ((m >> (3 + 2 * i)) & 3) for i in range(3)]
+        called = tiles.pop(r)
+        return CHI, target, called, tuple(tiles)
+
+    if m & 0x18:
+        t, r = divmod(m >> 9, 3)
+        base = t * 4
+        unused = (m >> 5) & 3
+        tiles = [base + i for i in range(4) if i != unused]
+        if m & 0x08:
+            called = tiles.pop(r)
+            return PON, target, called, tuple(tiles)
+        # 加杠: 原来碰的三张都在副露里，加上的是第四张
+        return KAKAN, target, base + unused, tuple(tiles)
+
+    if m & 0x20:
+        return NUKIDORA, who, None, (m >> 8,)
+
+    tile = m >> 8
+    base = (tile // 4) * 4
+    if m & 3 == 0:
+        return ANKAN, who, None, tuple(range(base, base + 4))
+    return DAIMINKAN, target, tile, tuple(i for i in range(base, base + 4) if i != tile)
+
+
+def encode_meld(naki_type, who, target, called, consumed):
+    """
+    decode_meld 的逆过程，生成天凤的 m 值 (用于合成牌谱和测试)
+
+    Args:
+        naki_type: CHI / PON / KAKAN / DAIMINKAN / ANKAN
+        who, target: 鸣牌玩家与被鸣牌玩家座位
+        called: 被鸣 (加杠为加上) 的牌ID，暗杠为 None
+        consumed: 自己拿出的牌ID 序列 (加杠为原来碰的三张)
+    """
+    offset = (target - who) % 4
+    if naki_type == CHI:
+        tiles = sorted(tuple(consumed) + (called,))
+        base = tiles[0] // 4
+        t = (base // 9) * 7 + base % 9
+        m = ((t * 3 + tiles.index(called)) << 10) | 0x04 | offset
+        for i, tile in enumerate(tiles):
+            m |= (tile % 4) << (3 + 2 * i)
+        return m
+    if naki_type in (PON, KAKAN):
+        kind = called // 4
+        if naki_type == PON:
+            tiles = sorted(tuple(consumed) + (called,))
+            unused = next(i for i in range(4) if kind * 4 + i not in tiles)
+            return ((kind * 3 + tiles.index(called)) << 9) | 0x08 | (unused << 5) | offset
+        return ((kind * 3) << 9) | 0x10 | ((called % 4) << 5) | offset
+    if naki_type == ANKAN:
+        return (min(consumed) << 8)
+    if naki_type == DAIMINKAN:
+        return (called << 8) | offset
+    raise ValueError(f"不支持的副露类型: {naki_type}")
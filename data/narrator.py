@@ -1,152 +1,373 @@
-import json
+import io
 import os
+import sys
+import json
+import glob
+import time
+import codecs
+import argparse
+import multiprocessing
+from tile_codec import CODE_NAMES, CODE_SORT_KEYS, NUM_KINDS
+from meld_codec import decode_meld, NAKI_TYPE_IDS, NAKI_TYPE_LABELS
+
+# 🎙️ 中文解说引擎
+#
+# iter_lines 把任意事件迭代器逐条渲染成解说文字 (生成器)，在此之上:
+#   narrate(events, out)        写入任意文本流 (默认 stdout)，分批 write 而不是逐行 print
+#   narrate_to_string(events)   返回字符串
+#   iter_log_events(path)       读取转换后的日志 (.json 数组 / .jsonl 每行一个事件)
+#   tail_events(path)           跟随一个仍在写入的日志 (例如服务器对局中的 game_log.json)
+#   narrate_corpus(src, dst)    多进程把整个目录的日志解说成文本文件
+#
+# 牌的显示文字与理牌顺序都是预先生成的表，输出耗时只与事件数成正比。
+#
+# 用法:
+#   python data/narrator.py game.json                      # 输出到屏幕
+#   python data/narrator.py test/game_log.json --follow    # 跟随对局实时解说
+#   python data/narrator.py --corpus ./data/json_logs --out ./data/narration --workers 8
+
+# ⚙️ 配置
+JSON_DIR = "./data/json_logs"
+NARRATION_DIR = "./data/narration"
+NUM_WORKERS = os.cpu_count() or 1
+CHUNK_SIZE = 16
+WRITE_BATCH = 256           # 每积累多少行写一次
+TAIL_POLL = 0.5             # 跟随模式下检查新内容的间隔 (秒)
+
+# 预计算的牌显示文字 (1m -> [一万]，5mr -> [赤五万]) 与理牌权重
+TILE_TEXT = {code: f"[{name}]" for code, name in CODE_NAMES.items()}
+_UNKNOWN_ORDER = 2 * NUM_KINDS
+
+
+def tile_text(code):
+    if not code: return ""
+    return TILE_TEXT.get(code) or f"[{code}]"
+
+
+def hand_text(tiles):
+    """理牌并拼接显示文字"""
+    order = CODE_SORT_KEYS.get
+    return " ".join(tile_text(c) for c in sorted(tiles, key=lambda c: order(c, _UNKNOWN_ORDER)))
+
 
 class MahjongNarrator:
     def __init__(self):
         self.players = ["玩家0", "玩家1", "玩家2", "玩家3"]
-        self.tile_map = self._build_tile_map()
-    
-    def _build_tile_map(self):
-        """构建牌代码到中文的映射"""
-        mapping = {}
-        # 万筒条
-        nums = ["一", "二", "三", "四", "五", "六", "七", "八", "九"]
-        for i, n in enumerate(nums):
-            mapping[f"{i+1}m"] = f"{n}万"
-            mapping[f"{i+1}p"] = f"{n}筒"
-            mapping[f"{i+1}s"] = f"{n}条"
-        # 字牌
-        z_names = ["东", "南", "西", "北", "白", "发", "中"]
-        for i, z in enumerate(z_names):
-            mapping[f"{i+1}z"] = z
-        return mapping
+        self.tile_map = TILE_TEXT
+        self._discard_lines = {}    # (座位, 摸切/手切, 牌) -> 一行文字，渲染过一次就缓存
 
     def t(self, tile_code):
         """将 1m 转换为 [一万]"""
-        if not tile_code: return ""
-        return f"[{self.tile_map.get(tile_code, tile_code)}]"
+        return tile_text(tile_code)
 
     def sort_hand(self, tiles):
-        """简单理牌（排序）"""
-        def sort_key(t):
-            # 排序权重: m=0, p=1, s=2, z=3, 数字在后
-            type_order = {'m': 0, 'p': 1, 's': 2, 'z': 3}
-            return type_order.get(t[-1], 9), int(t[:-1])
-        
-        return sorted(tiles, key=sort_key)
-
-    def decode_naki(self, raw_m):
+        """简单理牌（排序），排序权重来自预计算的 CODE_SORT_KEYS"""
+        order = CODE_SORT_KEYS.get
+        return sorted(tiles, key=lambda c: order(c, _UNKNOWN_ORDER))
+
+    def decode_naki(self, raw_m, who=0):
         """
-        简单解析天凤的副露编码 (raw_m)
-        注意：完整解析非常复杂，这里只区分吃/碰/杠类型
+        解析旧版 JSON 中保留的天凤副露编码 (raw_m)，返回副露类型名
+        新版转换结果已直接带有 naki_type 字段，无需再解析
         """
         try:
-            m = int(raw_m)
-            if m & 0x4:
-                return "吃"
-            elif m & 0x18:
-                return "碰"
-            elif m & 0x20:
-                return "加杠"
-            else:
-                return "杠" # 暗杠或大明杠
-        except:
+            return NAKI_TYPE_LABELS[decode_meld(who, raw_m)[0]]
+        except (TypeError, ValueError):
             return "副露"
 
-    def narrate(self, json_data):
-        if isinstance(json_data, str):
-            data = json.loads(json_data)
-        else:
-            data = json_data
+    def iter_lines(self, events, header=True):
+        """
+        把一局的事件逐条渲染成解说文字
 
-        print("="*60)
-        print("🀄 麻将对局中文解说开始")
-        print("="*60)
+        Args:
+            events: 事件的可迭代对象 (列表、iter_log_events、tail_events 等均可)
+            header: 是否输出开头的标题
+        """
+        if header:
+            yield "=" * 60
+            yield "🀄 麻将对局中文解说开始"
+            yield "=" * 60
 
         # 状态追踪
         last_draw = {} # 记录每个玩家最后摸的牌，用于判断"摸切"
+        players = self.players
+        discard_lines = self._discard_lines
+        t = tile_text
 
-        for event in data:
+        for event in events:
             etype = event.get("type")
             who = event.get("actor")
             if who is None: who = event.get("who") # 部分事件用 who
-            
-            p_name = self.players[who] if who is not None else ""
-
-            # --- 1. 开局 ---
-            if etype == "start_kyoku":
-                print(f"\n>>> {event['bakaze']}风 {event['kyoku']}局 (本场:{event['honba']}) <<<")
-                print(f"宝牌指示: {self.t(event['dora_marker'])}")
-                
-                # 展示初始手牌
-                tehais = event.get("tehais")
-                if tehais:
-                    print("-" * 30)
-                    for idx, hand in enumerate(tehais):
-                        sorted_hand = self.sort_hand(hand)
-                        hand_str = " ".join([self.t(x) for x in sorted_hand])
-                        print(f"玩家{idx} 起手: {hand_str}")
-                    print("-" * 30)
-            
-            # --- 2. 摸牌 ---
-            elif etype == "tsumo":
-                tile = event['pai']
-                last_draw[who] = tile
-                # 摸牌通常不单独打印，除非为了调试，或者合并在切牌里显示
-                pass 
 
-            # --- 3. 切牌 ---
+            # --- 摸牌 / 切牌 (最多的两种事件放在最前面) ---
+            if etype == "tsumo":
+                # 摸牌通常不单独打印，合并在切牌里显示
+                last_draw[who] = event['pai']
+
             elif etype == "dahai":
                 tile = event['pai']
-                draw_tile = last_draw.get(who)
-                
-                action_str = ""
-                if draw_tile == tile:
-                    action_str = "摸切" # 摸什么打什么
-                else:
-                    action_str = f"手切" # 换了一张牌打
-                    
-                print(f"{p_name} {action_str} {self.t(tile)}")
+                # 摸什么打什么为摸切，否则为手切
+                key = (who, last_draw.get(who) == tile, tile)
+                line = discard_lines.get(key)
+                if line is None:
+                    line = discard_lines[key] = f"{players[who]} {'摸切' if key[1] else '手切'} {t(tile)}"
+                yield line
 
-            # --- 4. 鸣牌 (副露) ---
+            # --- 开局 ---
+            elif etype == "start_kyoku":
+                yield f"\n>>> {event['bakaze']}风 {event['kyoku']}局 (本场:{event['honba']}) <<<"
+                yield f"宝牌指示: {t(event['dora_marker'])}"
+
+                # 展示初始手牌
+                tehais = event.get("tehais")
+                if tehais and any(tehais):
+                    yield "-" * 30
+                    for idx, hand in enumerate(tehais):
+                        yield f"玩家{idx} 起手: {hand_text(hand)}"
+                    yield "-" * 30
+
+            # --- 鸣牌 (副露) ---
             elif etype == "naki":
-                naki_type = self.decode_naki(event.get('raw_m'))
-                print(f"⚡ {p_name} {naki_type}!")
+                p_name = players[who] if who is not None else ""
+                if "naki_type" in event:
+                    naki_type = NAKI_TYPE_LABELS[NAKI_TYPE_IDS[event["naki_type"]]]
+                    yield f"⚡ {p_name} {naki_type} {t(event.get('pai'))}!"
+                else:
+                    naki_type = self.decode_naki(event.get('raw_m'), who)
+                    yield f"⚡ {p_name} {naki_type}!"
 
-            # --- 5. 立直 ---
+            # --- 立直 ---
             elif etype == "reach":
                 step = event.get('step')
                 if step == '1':
-                    print(f"🚩 {p_name} 宣布立直!")
+                    yield f"🚩 {players[who] if who is not None else ''} 宣布立直!"
                 elif step == '2':
-                    print(f"   (立直成立，放棒)")
+                    yield "   (立直成立，放棒)"
 
-            # --- 6. 和牌/流局 ---
+            # --- 新宝牌 ---
+            elif etype == "dora":
+                yield f"   新宝牌指示: {t(event['dora_marker'])}"
+
+            # --- 和牌/流局 ---
             elif etype == "hora":
-                print(f"🎉 和牌 (Ron/Tsumo)!")
-                print("="*30)
-            
+                yield "🎉 和牌 (Ron/Tsumo)!"
+                yield "=" * 30
+
             elif etype == "ryukyoku":
-                print(f"💨 流局")
-                print("="*30)
+                yield "💨 流局"
+                yield "=" * 30
+
+    def narrate(self, json_data, out=None, header=True):
+        """
+        解说一局并写入 out (默认 stdout)，返回输出的行数
+
+        json_data: JSON 字符串、事件列表或任意事件迭代器
+        """
+        if isinstance(json_data, str):
+            json_data = json.loads(json_data)
+        out = out or sys.stdout
+        follow = not isinstance(json_data, (list, tuple))
+        batch = []
+        count = 0
+        for line in self.iter_lines(json_data, header):
+            batch.append(line)
+            # 跟随模式下每行都立即输出，否则攒一批再写
+            if follow or len(batch) >= WRITE_BATCH:
+                out.write("\n".join(batch) + "\n")
+                count += len(batch)
+                batch = []
+                if follow:
+                    out.flush()
+        if batch:
+            out.write("\n".join(batch) + "\n")
+            count += len(batch)
+        return count
+
+    def narrate_to_string(self, json_data, header=True):
+        buf = io.StringIO()
+        self.narrate(json_data, buf, header)
+        return buf.getvalue()
+
+
+# ------------------------------------------------------------
+# 事件来源
+# ------------------------------------------------------------
+def iter_log_events(path):
+    """读取一局的日志: .jsonl 逐行读取，其余按 JSON 数组读取"""
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+class _IncrementalEvents:
+    """
+    增量解析仍在写入的日志文本: JSON 数组 (MjaiWriter 的 "[{..},{..}" 形式，结尾的 "]" 最后才写) 或 JSONL。
+    feed() 喂入新文本，返回其中已经完整的事件。
+    """
+    def __init__(self, lines=False):
+        self.lines = lines
+        self.buf = ""
+        self.pos = 0
+        self.finished = False
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, text):
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        events = []
+        buf = self.buf
+        if self.lines:
+            end = buf.rfind("\n") + 1
+            events = [json.loads(line) for line in buf[:end].splitlines() if line.strip()]
+            self.pos = end
+            return events
+        n = len(buf)
+        while True:
+            pos = self.pos
+            while pos < n and buf[pos] in " \t\r\n[,":
+                pos += 1
+            if pos < n and buf[pos] == "]":
+                self.finished = True
+                self.pos = pos + 1
+                return events
+            try:
+                event, end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # 最后一个事件还没写完，等下一次
+                return events
+            events.append(event)
+            self.pos = end
+
+
+def tail_events(path, poll_interval=TAIL_POLL, idle_timeout=None):
+    """
+    跟随一个仍在写入的日志，逐个产生新事件 (类似 tail -f)。
+    JSON 数组读到结尾的 "]"、或读到 end_game 事件、或超过 idle_timeout 秒没有新内容时结束。
+    文件还不存在时等待它出现。
+    """
+    while not os.path.exists(path):
+        time.sleep(poll_interval)
+    parser = _IncrementalEvents(lines=path.endswith(".jsonl"))
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    idle_since = time.monotonic()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read()
+            if data:
+                idle_since = time.monotonic()
+                for event in parser.feed(decoder.decode(data)):
+                    yield event
+                    if event.get("type") == "end_game":
+                        return
+                if parser.finished:
+                    return
+                continue
+            if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                return
+            time.sleep(poll_interval)
+
+
+# ------------------------------------------------------------
+# 批量解说
+# ------------------------------------------------------------
+_narrator = None
+
+
+def narrate_file(src, dst):
+    """解说一个日志文件并写入 dst，返回行数"""
+    global _narrator
+    if _narrator is None:
+        _narrator = MahjongNarrator()
+    tmp = dst + ".tmp"
+    with open(tmp, "w", encoding="utf-8", buffering=1 << 16) as f:
+        count = _narrator.narrate(list(iter_log_events(src)), f)
+    os.replace(tmp, dst)
+    return count
+
+
+def _narrate_job(job):
+    src, dst = job
+    try:
+        return src, narrate_file(src, dst), None
+    except Exception as e:
+        return src, 0, f"{type(e).__name__}: {e}"
+
+
+def narrate_corpus(src_dir=JSON_DIR, out_dir=NARRATION_DIR, num_workers=NUM_WORKERS,
+                   chunk_size=CHUNK_SIZE, force=False):
+    """
+    多进程把 src_dir 下的所有日志 (.json / .jsonl) 解说为 out_dir 下同名的 .txt
+
+    已有且比源文件新的输出会跳过 (force=True 时全部重新生成)。
+    Returns:
+        {"done": 完成数, "skipped": 跳过数, "failed": 失败数, "lines": 总行数}
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    files = sorted(glob.glob(os.path.join(src_dir, "*.json")) + glob.glob(os.path.join(src_dir, "*.jsonl")))
+    jobs = []
+    for src in files:
+        dst = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + ".txt")
+        if not force and os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+            continue
+        jobs.append((src, dst))
+    print(f"共 {len(files)} 个日志，需要解说 {len(jobs)} 个")
+
+    stats = {"done": 0, "skipped": len(files) - len(jobs), "failed": 0, "lines": 0}
+    if not jobs:
+        return stats
+    start = time.time()
+    if num_workers and num_workers > 1:
+        with multiprocessing.Pool(num_workers) as pool:
+            _collect(pool.imap_unordered(_narrate_job, jobs, chunksize=chunk_size), stats)
+    else:
+        _collect(map(_narrate_job, jobs), stats)
+    elapsed = time.time() - start
+    print(f"解说完成: {stats['done']} 个，失败 {stats['failed']} 个，"
+          f"耗时 {elapsed:.1f}s ({stats['done'] / elapsed if elapsed else 0:.1f} 个/秒)")
+    return stats
+
+
+def _collect(results, stats):
+    for src, count, error in results:
+        if error:
+            stats["failed"] += 1
+            print(f"[错误] {src}: {error}")
+        else:
+            stats["done"] += 1
+            stats["lines"] += count
+
 
 if __name__ == "__main__":
-    # 读取刚才生成的 json 文件
-    # 请替换为你实际的文件名
-    target_file = "./data/json_logs/2026013000gm-00a9-0000-0cb89d26.json"
-    
+    parser = argparse.ArgumentParser(description="麻将对局中文解说")
+    parser.add_argument("path", nargs="?", help="日志文件 (.json / .jsonl)，不指定时解说 JSON_DIR 中的第一个文件")
+    parser.add_argument("--follow", action="store_true", help="跟随仍在写入的日志实时解说")
+    parser.add_argument("--corpus", metavar="DIR", help="批量解说目录下的所有日志")
+    parser.add_argument("--out", default=NARRATION_DIR, help="批量解说的输出目录")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--force", action="store_true", help="批量解说时忽略已有输出")
+    args = parser.parse_args()
+
+    if args.corpus:
+        narrate_corpus(args.corpus, args.out, args.workers, force=args.force)
+        sys.exit()
+
+    target_file = args.path
     # 自动查找第一个json文件演示
-    if not os.path.exists(target_file):
-        files = [f for f in os.listdir("./data/json_logs") if f.endswith(".json")]
-        if files:
-            target_file = os.path.join("./data/json_logs", files[0])
-        else:
+    if not target_file:
+        files = sorted(glob.glob(os.path.join(JSON_DIR, "*.json")))
+        if not files:
             print("找不到JSON文件，请先运行数据转换脚本。")
-            exit()
+            sys.exit()
+        target_file = files[0]
 
     print(f"正在读取: {target_file}")
-    with open(target_file, 'r', encoding='utf-8') as f:
-        content = json.load(f)
-        
     narrator = MahjongNarrator()
-    narrator.narrate(content)
\ No newline at end of file
+    if args.follow:
+        narrator.narrate(tail_events(target_file), sys.stdout)
+    else:
+        narrator.narrate(list(iter_log_events(target_file)), sys.stdout)
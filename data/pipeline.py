@@ -0,0 +1,436 @@
+import io
+import os
+import gzip
+import time
+import queue
+import signal
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, timedelta
+import numpy as np
+import event_store
+from convert_to_json import (RAW_DIR, JSON_DIR, MANIFEST_PATH, BIN_DIR, BIN_MANIFEST_PATH, OUTPUT_FORMAT,
+                             iter_mjlog_events, write_events_json, load_manifest, save_manifest, setup_dir)
+
+# 🚰 下载 → 解析 → 写出 流水线
+#
+# download_logs.py 与 convert_to_json.py 的流式合体: 下载到的字节经有界队列直接交给解析进程，
+# 解析结果由主进程写出，不需要等整批下载结束，也不再从磁盘重新读取、glob 整个目录。
+#
+#   来源 (线程)                      解析 (进程池)                    写出 (主进程)
+#   crawl: 按日期下载 (DOWNLOAD_WORKERS 个线程)                        json:   每局一个文件 (JSON_DIR)
+#   dir:   扫描 RAW_DIR (--watch 时持续监视)  ──队列──▶  PARSE_WORKERS 个进程  ──▶  binary: 事件分片 (BIN_DIR)
+#                                                                     特征:   训练样本分片 (--features)
+#
+#   - 队列容量 QUEUE_SIZE、解析在途任务数 2 * PARSE_WORKERS 都有上限，下游跟不上时上游自动阻塞
+#   - 清单 (MANIFEST_PATH / BIN_MANIFEST_PATH) 与 convert_to_json 共用，两边可以交替运行
+#   - 分片与特征文件每 FLUSH_SECONDS 秒至少写出一次，长时间爬取期间就能陆续拿到可训练的数据
+#   - crawl 使用 download_index 记录下载状态，中断后重跑只处理未完成的牌谱；
+#     一局只有在转换结果落盘 (JSON 写出 / 所在分片写出) 之后才记为已下载，中断时在途的牌谱下次会重新下载
+#
+# 用法:
+#   python data/pipeline.py                                     # 处理 RAW_DIR 中尚未转换的文件
+#   python data/pipeline.py --watch --format binary             # 持续监视 RAW_DIR，新文件落地即转换
+#   python data/pipeline.py --crawl --start 2026-01-01 --end 2026-01-31 --features ./data/features
+#   python data/pipeline.py --crawl --watch                     # 爬完日期范围后继续等待新归档的日期
+
+# ⚙️ 配置
+DOWNLOAD_WORKERS = 4            # 下载线程数 (同时也受 download_logs 的令牌桶限速)
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # 解析进程数 (<= 1 时在主进程内解析)
+QUEUE_SIZE = 256                # 来源 → 解析 的队列容量 (局)
+FLUSH_SECONDS = 600             # 分片 / 特征文件 / 清单至少每隔多少秒写出一次
+WATCH_INTERVAL = 30             # 监视模式下扫描目录 / 检查新日期的间隔 (秒)
+FEATURE_SHARD_SAMPLES = 200_000 # 每个特征分片的样本数上限 (compact uint8 约 370MB)
+PROGRESS_EVERY = 1000           # 每处理多少局输出一次进度
+SAVE_RAW = True                 # crawl 时是否同时把原始牌谱保存到 RAW_DIR
+
+
+# ------------------------------------------------------------
+# 解析 (worker 进程)
+# ------------------------------------------------------------
+def parse_job(job):
+    """
+    解析一局牌谱的原始字节
+
+    Args:
+        job: (源文件名, 字节, mtime, 输出格式, 是否特征化)
+    Returns:
+        (源文件名, 清单条目, 输出 (JSON 文本或记录数组), 样本 (obs, mask, labels) 或 None, 错误信息)
+    """
+    name, data, mtime, output_format, featurize = job
+    try:
+        entry = {"size": len(data), "mtime": mtime, "sha1": hashlib.sha1(data).hexdigest()}
+        raw = gzip.decompress(data) if data[:2] == b"\x1f\x8b" else data
+        events = list(iter_mjlog_events(io.BytesIO(raw)))
+        if not events:
+            raise ValueError("没有解析出任何事件")
+        if output_format == "binary":
+            payload = event_store.encode_events(events)
+        else:
+            buf = io.StringIO()
+            write_events_json(events, buf)
+            payload = buf.getvalue()
+        samples = None
+        if featurize:
+            from features import FeatureTracker
+            samples = FeatureTracker().encode_game(events, compact=True)[:3]
+        return name, entry, payload, samples, None
+    except Exception as e:
+        return name, None, None, None, f"{type(e).__name__}: {e}"
+
+
+def _log_id(name):
+    return name[:-len(".mjlog")] if name.endswith(".mjlog") else name
+
+
+def _init_worker():
+    # Ctrl-C 由主进程处理 (写出已完成的部分)，worker 忽略
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class _Done:
+    """串行模式下与 AsyncResult 接口一致的结果包装"""
+    def __init__(self, result):
+        self.result = result
+
+    def ready(self):
+        return True
+
+    def get(self):
+        return self.result
+
+
+# ------------------------------------------------------------
+# 来源 (线程)
+# ------------------------------------------------------------
+def _put(q, item, stop):
+    """放入有界队列；队列满时阻塞，但收到停止信号后放弃"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def dir_source(out_q, stop, manifest, raw_dir=RAW_DIR, watch=False, interval=WATCH_INTERVAL, json_dir=None,
+               stored=None):
+    """
+    扫描 raw_dir 中的 .mjlog，把清单中没有 (或 size/mtime 变化、输出已不存在) 的文件送入队列
+    下载器先写 .part 再原子重命名，所以扫描到的 .mjlog 都是完整的
+
+    Args:
+        json_dir: json 输出时检查输出文件是否存在
+        stored: binary 输出时启动前已落盘的游戏 ID 集合 (event_store.stored_game_ids)
+    """
+    # 已经送入队列的版本: 文件名 -> (size, mtime)。清单要等输出落盘后才更新，
+    # 靠它避免重复扫描时把还在缓冲中的文件再送一次；文件被重写 (size/mtime 变化) 后会重新送入
+    seen = {}
+    while not stop.is_set():
+        with os.scandir(raw_dir) as it:
+            names = sorted((e.name, e.path) for e in it if e.name.endswith(".mjlog"))
+        for name, path in names:
+            try:
+                st = os.stat(path)
+                version = (st.st_size, st.st_mtime)
+                if seen.get(name) == version:
+                    continue
+                entry = manifest.get(name)
+                if (entry and (entry.get("size"), entry.get("mtime")) == version
+                        and (json_dir is None or os.path.exists(os.path.join(json_dir, name.replace(".mjlog", ".json"))))
+                        and (stored is None or _log_id(name) in stored)):
+                    seen[name] = version
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            seen[name] = version
+            if not _put(out_q, (name, data, st.st_mtime), stop):
+                return
+        if not watch:
+            return
+        stop.wait(interval)
+
+
+def _crawl_days(start, end, watch, stop, interval):
+    """要爬取的日期；监视模式下爬完范围后继续等待新归档的日期 (昨天及以前)"""
+    day = start
+    while not stop.is_set():
+        if not watch and day > end:
+            return
+        if day < date.today() or (not watch and day <= end):
+            yield day
+            day += timedelta(days=1)
+        else:
+            stop.wait(interval)
+
+
+def crawl_source(out_q, stop, index, start, end, limit=None, watch=False, workers=DOWNLOAD_WORKERS,
+                 save_raw=SAVE_RAW, interval=WATCH_INTERVAL, stats=None):
+    """
+    按日期下载牌谱，把内容直接送入队列 (save_raw 时同时保存到 RAW_DIR)
+
+    这里只记录下载失败；成功由 Pipeline 在转换结果落盘后记入 index (需要把同一个 index 传给 Pipeline)
+    """
+    import download_logs
+    downloader = download_logs.LogDownloader(max_in_flight=workers, index=index)
+    if save_raw:
+        download_logs.setup_dir()
+
+    def fetch(log_id):
+        content = downloader.fetch_log(log_id)
+        if content is None:
+            if stats is not None:
+                stats["download_failed"] += 1
+            return
+        mtime = None
+        if save_raw:
+            try:
+                mtime = os.stat(downloader.save_log(log_id, content, record=False)).st_mtime
+            except OSError as e:
+                print(f"  - 保存失败: {log_id} {e}")
+        _put(out_q, (f"{log_id}.mjlog", content, mtime), stop)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for day in _crawl_days(start, end, watch, stop, interval):
+                ids = None
+                if not index.has_day(day):
+                    ids = downloader.get_log_ids_for_date(day)
+                if index.has_day(day):
+                    ids = index.todo(day, limit)
+                elif limit:
+                    ids = ids[:limit]
+                ids = index.missing(ids)
+                print(f"[流水线] {day}: 待下载 {len(ids)} 局")
+                pending = set()
+                for log_id in ids:
+                    if stop.is_set():
+                        break
+                    if len(pending) >= 2 * workers:
+                        _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    pending.add(pool.submit(fetch, log_id))
+                wait(pending)
+                index.flush()
+    finally:
+        downloader.close()
+
+
+# ------------------------------------------------------------
+# 写出 (主进程)
+# ------------------------------------------------------------
+class Pipeline:
+    """
+    串起来源 → 解析 → 写出
+
+    用法:
+        pipe = Pipeline(output_format="binary", feature_dir="./data/features")
+        pipe.run(lambda q, stop: dir_source(q, stop, pipe.manifest, watch=True))
+
+    index: crawl 时传入下载状态索引，游戏落盘后才记为已下载，转换失败记为失败
+    """
+    def __init__(self, output_format=OUTPUT_FORMAT, parse_workers=PARSE_WORKERS, queue_size=QUEUE_SIZE,
+                 feature_dir=None, flush_seconds=FLUSH_SECONDS, feature_shard_samples=FEATURE_SHARD_SAMPLES,
+                 index=None):
+        self.output_format = output_format
+        self.index = index
+        self.binary = output_format == "binary"
+        self.out_dir = BIN_DIR if self.binary else JSON_DIR
+        self.manifest_path = BIN_MANIFEST_PATH if self.binary else MANIFEST_PATH
+        self.parse_workers = parse_workers
+        self.in_flight = 2 * max(1, parse_workers)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop = threading.Event()
+        self.flush_seconds = flush_seconds
+        self.feature_dir = feature_dir
+        self.feature_shard_samples = feature_shard_samples
+
+        setup_dir(self.out_dir)
+        self.manifest = load_manifest(self.manifest_path)
+        self.writer = event_store.ShardWriter(BIN_DIR) if self.binary else None
+        self.unflushed = {}         # 已写入分片缓冲、但分片尚未落盘的清单条目
+        self.samples = []
+        self.n_samples = 0
+        if feature_dir:
+            os.makedirs(feature_dir, exist_ok=True)
+            self.feature_shard_no = event_store.next_shard_no(feature_dir, "feat-", ".npz")
+        self.stats = {"converted": 0, "failed": 0, "download_failed": 0, "shards": 0, "feature_shards": 0}
+        self.failures = []
+        self.last_flush = time.time()
+
+    # ---------------- 主循环 ----------------
+    def run(self, source):
+        """
+        Args:
+            source: callable(queue, stop)，在后台线程中把 (源文件名, 字节, mtime) 放入队列，返回即表示结束
+        """
+        def run_source():
+            try:
+                source(self.queue, self.stop)
+            finally:
+                _put(self.queue, None, self.stop)
+
+        thread = threading.Thread(target=run_source, daemon=True)
+        pool = multiprocessing.Pool(self.parse_workers, _init_worker) if self.parse_workers > 1 else None
+        featurize = self.feature_dir is not None
+        pending = deque()
+        start = time.time()
+        try:
+            thread.start()
+            while True:
+                try:
+                    item = self.queue.get(timeout=0.5)
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    break
+                if item:
+                    job = item + (self.output_format, featurize)
+                    pending.append(pool.apply_async(parse_job, (job,)) if pool else _Done(parse_job(job)))
+                # 在途任务达到上限时等待最早的一个；已完成的按提交顺序写出
+                while pending and (len(pending) >= self.in_flight or pending[0].ready()):
+                    self._write(pending.popleft().get(), start)
+                if time.time() - self.last_flush >= self.flush_seconds:
+                    self.flush()
+            while pending:
+                self._write(pending.popleft().get(), start)
+        except KeyboardInterrupt:
+            print("\n[流水线] 中断，写出已完成的部分...")
+        finally:
+            self.stop.set()
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            self.close()
+        self._report(start)
+        return self.stats
+
+    def _write(self, result, start):
+        name, entry, payload, samples, error = result
+        if error is not None:
+            self.stats["failed"] += 1
+            self.failures.append((name, error))
+            self.manifest.pop(name, None)
+            if self.index is not None:
+                self.index.record_failed(_log_id(name), error)
+            return
+        game_id = _log_id(name)
+        if self.binary:
+            if self.writer.add_game(game_id, payload):
+                self._on_shard()
+            self.unflushed[name] = entry
+        else:
+            path = os.path.join(self.out_dir, game_id + ".json")
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            self._persisted({name: entry})
+        if samples is not None and len(samples[2]):
+            self.samples.append(samples)
+            self.n_samples += len(samples[2])
+            if self.n_samples >= self.feature_shard_samples:
+                self._write_features()
+        self.stats["converted"] += 1
+        done = self.stats["converted"] + self.stats["failed"]
+        if done % PROGRESS_EVERY == 0:
+            elapsed = time.time() - start
+            print(f"[流水线] 转换 {self.stats['converted']} 失败 {self.stats['failed']} | "
+                  f"队列 {self.queue.qsize()} | {done / max(elapsed, 1e-9):.1f} 局/秒")
+            save_manifest(self.manifest, self.manifest_path)
+
+    def _on_shard(self):
+        """一个分片落盘后，其中的游戏才记入清单"""
+        self._persisted(self.unflushed)
+        self.unflushed = {}
+        self.stats["shards"] += 1
+
+    def _persisted(self, entries):
+        """游戏已经落盘: 记入清单，crawl 时同时在下载状态索引中记为已下载"""
+        self.manifest.update(entries)
+        if self.index is not None:
+            for name, entry in entries.items():
+                self.index.record_ok(_log_id(name), entry["size"], entry["sha1"])
+
+    def _write_features(self):
+        if not self.samples:
+            return
+        obs, mask, labels = (np.concatenate(cols) for cols in zip(*self.samples))
+        path = os.path.join(self.feature_dir, f"feat-{self.feature_shard_no:05d}.npz")
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, obs=obs, mask=mask, labels=labels)
+        os.replace(path + ".tmp", path)
+        self.feature_shard_no += 1
+        self.samples, self.n_samples = [], 0
+        self.stats["feature_shards"] += 1
+
+    def flush(self):
+        """把缓冲中的分片、特征与清单写出"""
+        if self.writer is not None and self.writer.flush():
+            self._on_shard()
+        self._write_features()
+        save_manifest(self.manifest, self.manifest_path)
+        self.last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        if self.index is not None:
+            self.index.flush()
+
+    def _report(self, start):
+        s = self.stats
+        print(f"[流水线] 完成: 转换 {s['converted']} 失败 {s['failed']} 下载失败 {s['download_failed']} | "
+              f"分片 {s['shards']} 特征分片 {s['feature_shards']} | 用时 {time.time() - start:.1f}s")
+        if self.failures:
+            by_error = {}
+            for name, error in self.failures:
+                by_error.setdefault(error, []).append(name)
+            for error, names in sorted(by_error.items(), key=lambda kv: -len(kv[1])):
+                print(f"  [{len(names)}] {error} (例如 {', '.join(names[:3])})")
+        print(f"输出保存在: {self.out_dir}" + (f"，特征: {self.feature_dir}" if self.feature_dir else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="下载 → 解析 → 写出 流水线")
+    parser.add_argument("--crawl", action="store_true", help="从天凤按日期下载 (否则处理 RAW_DIR 中的文件)")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="起始日期 (默认 download_logs.START_DATE)")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="结束日期 (默认 download_logs.END_DATE)")
+    parser.add_argument("--limit", type=int, default=None, help="每天最多下载多少局")
+    parser.add_argument("--watch", action="store_true", help="持续运行: 监视 RAW_DIR 的新文件 / 等待新归档的日期")
+    parser.add_argument("--format", choices=["json", "binary"], default=OUTPUT_FORMAT)
+    parser.add_argument("--features", metavar="DIR", default=None, help="同时特征化，样本分片写入该目录")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS)
+    parser.add_argument("--download-workers", type=int, default=DOWNLOAD_WORKERS)
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE, help="来源 → 解析 队列容量")
+    parser.add_argument("--flush-seconds", type=float, default=FLUSH_SECONDS)
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="监视模式的轮询间隔 (秒)")
+    parser.add_argument("--no-save-raw", action="store_true", help="crawl 时不保存原始牌谱")
+    args = parser.parse_args()
+
+    index = None
+    if args.crawl:
+        import download_logs
+        index = download_logs.open_index()
+    pipe = Pipeline(args.format, args.parse_workers, args.queue, args.features, args.flush_seconds, index=index)
+    if args.crawl:
+        start = args.start or download_logs.START_DATE
+        end = args.end or download_logs.END_DATE
+        limit = args.limit if args.limit is not None else download_logs.DOWNLOAD_LIMIT_PER_DAY
+        source = lambda q, stop: crawl_source(q, stop, index, start, end, limit, args.watch, args.download_workers,
+                                               not args.no_save_raw, args.interval, pipe.stats)
+    else:
+        json_dir = None if pipe.binary else JSON_DIR
+        stored = event_store.stored_game_ids(BIN_DIR) if pipe.binary else None
+        source = lambda q, stop: dir_source(q, stop, pipe.manifest, RAW_DIR, args.watch, args.interval, json_dir,
+                                            stored)
+    try:
+        pipe.run(source)
+    finally:
+        if index is not None:
+            index.close()
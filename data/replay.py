@@ -0,0 +1,216 @@
+import json
+import numpy as np
+from tile_codec import CODE_KINDS, KIND_CODES, NUM_KINDS, counts_to_kinds
+
+# ⏪ 随机访问回放引擎
+#
+# 为一局游戏建立 (小局, 步) 索引，并在每个小局开始处 (以及可选的每 N 个事件) 保存
+# 牌桌状态快照。查询任意位置时，从最近的快照出发只重放一小段事件即可，
+# 不需要像 MahjongNarrator.narrate 那样从头开始。
+#
+# 位置的表示:
+#   kyoku: 小局序号 (本局游戏中的第几个小局，从 0 开始)，可用 find_kyoku("S", 2) 由场风+局数查找
+#   step:  小局内的事件偏移 (0 = 刚配完牌)，state_at 返回应用了前 step 个事件之后的状态
+#   turn:  小局内的第几次切牌 (从 0 开始)，state_at_turn 返回该次切牌之前的状态
+
+# 默认快照间隔 (事件数)，None 表示只在小局开始处保存
+SNAPSHOT_EVERY = 32
+
+# 一局开始时牌山中可摸的牌数 (136 - 14 王牌 - 52 配牌)
+WALL_TILES = 70
+
+
+class TableState:
+    """
+    牌桌状态 (全部为牌种索引，紧凑且易于复制)
+
+    hands:   int8 [4, 34] 各家手牌计数
+    rivers:  4 个列表，各家按顺序打出的牌
+    melds:   4 个列表，各家副露 (副露类型, 牌种元组)
+    dora:    宝牌指示牌列表
+    reach:   各家是否已立直
+    """
+    __slots__ = ("bakaze", "kyoku", "honba", "kyotaku", "hands", "rivers", "melds",
+                 "dora", "reach", "remaining", "last_draw")
+
+    def __init__(self, start_event):
+        self.bakaze = start_event.get("bakaze", "E")
+        self.kyoku = start_event.get("kyoku", 1)
+        self.honba = start_event.get("honba", 0)
+        self.kyotaku = start_event.get("kyotaku", 0)
+        self.hands = np.zeros((4, NUM_KINDS), dtype=np.int8)
+        for seat, hand in enumerate(start_event.get("tehais", [])):
+            for code in hand:
+                self.hands[seat, CODE_KINDS[code]] += 1
+        self.rivers = [[], [], [], []]
+        self.melds = [[], [], [], []]
+        self.dora = [CODE_KINDS[start_event["dora_marker"]]]
+        self.reach = [False] * 4
+        self.remaining = WALL_TILES
+        self.last_draw = [-1] * 4
+
+    def copy(self):
+        other = TableState.__new__(TableState)
+        other.bakaze, other.kyoku, other.honba, other.kyotaku = self.bakaze, self.kyoku, self.honba, self.kyotaku
+        other.hands = self.hands.copy()
+        other.rivers = [list(r) for r in self.rivers]
+        other.melds = [list(m) for m in self.melds]
+        other.dora = list(self.dora)
+        other.reach = list(self.reach)
+        other.remaining = self.remaining
+        other.last_draw = list(self.last_draw)
+        return other
+
+    def apply(self, event):
+        """应用一个小局内的事件"""
+        etype = event["type"]
+        if etype == "tsumo":
+            seat, kind = event["actor"], CODE_KINDS[event["pai"]]
+            self.hands[seat, kind] += 1
+            self.last_draw[seat] = kind
+            self.remaining -= 1
+        elif etype == "dahai":
+            seat, kind = event["actor"], CODE_KINDS[event["pai"]]
+            self.hands[seat, kind] -= 1
+            self.rivers[seat].append(kind)
+            self.last_draw[seat] = -1
+        elif etype == "naki":
+            seat, naki_type = event["who"], event["naki_type"]
+            if naki_type == "kakan":
+                kind = CODE_KINDS[event["pai"]]
+                self.hands[seat, kind] -= 1
+                # 把原来的碰升级为加杠
+                for i, (t, kinds) in enumerate(self.melds[seat]):
+                    if t == "pon" and kinds[0] == kind:
+                        self.melds[seat][i] = ("kakan", kinds + (kind,))
+                        break
+            else:
+                kinds = tuple(CODE_KINDS[c] for c in event["consumed"])
+                for kind in kinds:
+                    self.hands[seat, kind] -= 1
+                if event.get("pai") is not None:
+                    kinds = tuple(sorted(kinds + (CODE_KINDS[event["pai"]],)))
+                self.melds[seat].append((naki_type, kinds))
+            self.last_draw[seat] = -1
+        elif etype == "reach":
+            if event.get("step") == "2":
+                self.reach[event["who"]] = True
+                self.kyotaku += 1
+        elif etype == "dora":
+            self.dora.append(CODE_KINDS[event["dora_marker"]])
+
+    def to_dict(self):
+        """转换为可直接 JSON 序列化的字典 (牌代码形式)，供分析界面使用"""
+        return {
+            "bakaze": self.bakaze,
+            "kyoku": self.kyoku,
+            "honba": self.honba,
+            "kyotaku": self.kyotaku,
+            "hands": [[KIND_CODES[k] for k in counts_to_kinds(h).tolist()] for h in self.hands],
+            "rivers": [[KIND_CODES[k] for k in r] for r in self.rivers],
+            "melds": [[{"type": t, "pai": [KIND_CODES[k] for k in kinds]} for t, kinds in m] for m in self.melds],
+            "dora_markers": [KIND_CODES[k] for k in self.dora],
+            "reach": list(self.reach),
+            "remaining": self.remaining,
+        }
+
+
+class ReplayEngine:
+    """
+    一局游戏的随机访问回放
+
+    用法:
+        engine = ReplayEngine.from_file("./data/json_logs/xxx.json")
+        state = engine.state_at_turn(engine.find_kyoku("S", 2), 37)
+        print(state.to_dict())
+    """
+    def __init__(self, events, snapshot_every=SNAPSHOT_EVERY):
+        self.events = events if isinstance(events, list) else list(events)
+        self.snapshot_every = snapshot_every
+        self.kyoku_starts = []      # 每个小局 start_kyoku 事件的位置
+        self.kyoku_ends = []        # 每个小局结束位置 (不含)
+        self.turns = []             # 每个小局中每次切牌的 step
+        self.snapshots = []         # 每个小局的 [(step, TableState)]，按 step 升序
+        self._build_index()
+
+    @classmethod
+    def from_file(cls, path, snapshot_every=SNAPSHOT_EVERY):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), snapshot_every)
+
+    @classmethod
+    def from_store(cls, store, game_id, snapshot_every=SNAPSHOT_EVERY):
+        """从二进制分片 (event_store.EventStore) 中读取一局"""
+        import event_store
+        return cls(event_store.decode_records(store.game(game_id)), snapshot_every)
+
+    def _build_index(self):
+        """一次顺序扫描: 记录小局边界、切牌位置，并按间隔保存快照"""
+        state = None
+        for pos, event in enumerate(self.events):
+            if event["type"] == "start_kyoku":
+                if state is not None:
+                    self.kyoku_ends.append(pos)
+                state = TableState(event)
+                self.kyoku_starts.append(pos)
+                self.turns.append([])
+                self.snapshots.append([(0, state.copy())])
+                continue
+            if state is None:
+                continue
+            step = pos - self.kyoku_starts[-1]
+            if event["type"] == "dahai":
+                self.turns[-1].append(step - 1)
+            state.apply(event)
+            if self.snapshot_every and step % self.snapshot_every == 0:
+                self.snapshots[-1].append((step, state.copy()))
+        if state is not None:
+            self.kyoku_ends.append(len(self.events))
+
+    def __len__(self):
+        """小局数"""
+        return len(self.kyoku_starts)
+
+    def kyoku_info(self, kyoku):
+        e = self.events[self.kyoku_starts[kyoku]]
+        return {"bakaze": e["bakaze"], "kyoku": e["kyoku"], "honba": e["honba"],
+                "steps": self.num_steps(kyoku), "turns": len(self.turns[kyoku])}
+
+    def find_kyoku(self, bakaze, kyoku, honba=None):
+        """由场风 + 局数 (+ 本场) 找到小局序号，有连庄时默认返回第一个"""
+        for i, pos in enumerate(self.kyoku_starts):
+            e = self.events[pos]
+            if e["bakaze"] == bakaze and e["kyoku"] == kyoku and (honba is None or e["honba"] == honba):
+                return i
+        raise KeyError(f"找不到小局 {bakaze}{kyoku} 本场={honba}")
+
+    def num_steps(self, kyoku):
+        """小局内的事件数 (不含 start_kyoku)"""
+        return self.kyoku_ends[kyoku] - self.kyoku_starts[kyoku] - 1
+
+    def events_of(self, kyoku):
+        return self.events[self.kyoku_starts[kyoku] + 1:self.kyoku_ends[kyoku]]
+
+    def state_at(self, kyoku, step):
+        """应用了小局内前 step 个事件之后的牌桌状态 (返回新对象，可随意修改)"""
+        step = max(0, min(step, self.num_steps(kyoku)))
+        snaps = self.snapshots[kyoku]
+        # 快照按 step 升序，找到不超过 step 的最近一个
+        lo, hi = 0, len(snaps) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if snaps[mid][0] <= step:
+                lo = mid
+            else:
+                hi = mid - 1
+        base_step, snap = snaps[lo]
+        state = snap.copy()
+        start = self.kyoku_starts[kyoku] + 1
+        for event in self.events[start + base_step:start + step]:
+            state.apply(event)
+        return state
+
+    def state_at_turn(self, kyoku, turn):
+        """小局内第 turn 次切牌之前的牌桌状态，同时返回该次切牌事件"""
+        step = self.turns[kyoku][turn]
+        return self.state_at(kyoku, step), self.events[self.kyoku_starts[kyoku] + 1 + step]
@@ -0,0 +1,537 @@
+import os
+import sys
+import argparse
+import numpy as np
+from tile_codec import NUM_KINDS, KIND_CODES, CODE_KINDS
+
+# 🧮 向听数 / 有效牌 (受け入れ) 计算
+#
+# 输入为 34 维的牌种计数向量 (tile_codec.ids_to_counts / codes_to_counts 的输出)。
+#
+# 一般形 (4 面子 1 雀头) 用查表计算:
+#   对每一门 (万/筒/条 各 9 种，字牌 7 种) 的每一种计数组合 (每种 0-4 张，以 5 进制编码为下标)，
+#   预先算出"凑成 j 个面子 (0-4)、有/没有雀头"最少还要摸进几张牌，共 10 个值。
+#   一手牌只需取 4 行表、做一次很小的组合 (min-plus 卷积)，向听数 = 所需张数 - 1。
+#   表在第一次使用时用 NumPy 生成 (数秒)，保存到 TABLE_DIR 后以内存映射方式加载。
+# 七对子与国士无双直接按公式计算，只对没有副露的手牌 (13/14 张) 有效。
+#
+# 向听数的定义: 和牌最少还需要摸进的张数 - 1，并且每种牌只有 4 张 —— 手里已经有 4 张的牌不会再摸到。
+# 因此与只数面子 / 搭子的常见公式在这类手牌上差 1，例如 123m456p789s1111z 按公式是 (形式) 听牌，
+# 这里是 1 向听 (单骑的 1z 已经全在手里)；有效牌 (ukeire) 也按同样的定义计算。
+#
+# 批量接口 shanten_batch 对 [N, 34] 一次算出 N 手牌的向听数，适合给整个语料的每个决策点做标注。
+#
+# 用法:
+#   python data/shanten.py 123m456p789s1122z        # 向听数与有效牌
+#   python data/shanten.py 1234567m11p234s5z5m      # 14 张时列出每种打法的有效牌
+#   python data/shanten.py --build                  # 预先生成查找表
+#   python data/shanten.py --check 2000             # 与暴力实现交叉校验
+
+# ⚙️ 配置
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shanten_tables")
+
+NUM_PATTERNS = 10       # 0-4 个面子 x 有无雀头: 下标 j 为 j 个面子，5 + j 为 j 个面子加雀头
+_SUIT_SIZES = (9, 9, 9, 7)
+_SUIT_SLICES = (slice(0, 9), slice(9, 18), slice(18, 27), slice(27, 34))
+_TERMINALS = np.array([0, 8, 9, 17, 18, 26] + list(range(27, 34)))
+_INF = 255
+
+_tables = None          # (数牌表 [5^9, 10], 字牌表 [5^7, 10])
+
+
+# ------------------------------------------------------------
+# 查找表生成
+# ------------------------------------------------------------
+def _digits(size):
+    """所有 5 进制计数组合 [5^size, size]，第 i 列为第 i 种牌的张数"""
+    idx = np.arange(5 ** size)
+    return np.stack([(idx // 5 ** i) % 5 for i in range(size)], axis=1).astype(np.int8)
+
+
+def _build_table(size, sequences):
+    """
+    生成一门的查找表: table[下标, 模式] = 凑成该模式最少需要摸进的张数
+
+    思路: 一手牌 "包含" 某个模式 (j 个面子 + 可能的雀头) 时需要 0 张；
+    否则需要的张数 = 1 + 多摸一张之后的最小值。
+    按总张数从少到多传播"包含"，再从多到少传播所需张数，全部是整列的 NumPy 操作。
+    """
+    n = 5 ** size
+    powers = [5 ** i for i in range(size)]
+    digits = _digits(size)
+    totals = digits.sum(axis=1)
+
+    # 恰好由 j 个面子 (+ 雀头) 组成的计数组合 (每种牌不超过 4 张)
+    def unit(*kinds):
+        vec = [0] * size
+        for k in kinds:
+            vec[k] += 1
+        return tuple(vec)
+
+    def add(a, b):
+        return tuple(x + y for x, y in zip(a, b))
+
+    melds = [unit(i, i, i) for i in range(size)]
+    if sequences:
+        melds += [unit(i, i + 1, i + 2) for i in range(size - 2)]
+    exact = [{unit()}]
+    for _ in range(4):
+        exact.append({v for t in exact[-1] for m in melds for v in [add(t, m)] if max(v) <= 4})
+    pairs = [unit(i, i) for i in range(size)]
+    with_pair = [{v for t in exact[j] for p in pairs for v in [add(t, p)] if max(v) <= 4} for j in range(5)]
+
+    contains = np.zeros((n, NUM_PATTERNS), dtype=bool)
+    for pattern, vecs in enumerate(exact + with_pair):
+        contains[np.array(sorted(vecs), dtype=np.int64) @ np.array(powers), pattern] = True
+
+    levels = [np.flatnonzero(totals == level) for level in range(4 * size + 1)]
+    # 包含关系向上传播: 计数组合 c 包含模式 <=> c 本身是该模式，或 c 去掉某一张之后仍包含
+    for idx in levels[1:]:
+        acc = contains[idx]
+        for i, p in enumerate(powers):
+            has = digits[idx, i] > 0
+            acc[has] |= contains[idx[has] - p]
+        contains[idx] = acc
+
+    table = np.full((n, NUM_PATTERNS), _INF, dtype=np.uint8)
+    for idx in reversed(levels):
+        best = np.full((len(idx), NUM_PATTERNS), _INF - 1, dtype=np.int16)
+        for i, p in enumerate(powers):
+            room = digits[idx, i] < 4
+            best[room] = np.minimum(best[room], table[idx[room] + p].astype(np.int16))
+        table[idx] = np.where(contains[idx], 0, np.minimum(best + 1, _INF)).astype(np.uint8)
+    return table
+
+
+def build_tables(table_dir=TABLE_DIR):
+    """生成并保存查找表"""
+    os.makedirs(table_dir, exist_ok=True)
+    suit = _build_table(9, True)
+    honor = _build_table(7, False)
+    for name, table in (("suit", suit), ("honor", honor)):
+        tmp = os.path.join(table_dir, f"{name}.tmp.npy")
+        np.save(tmp, table)
+        os.replace(tmp, os.path.join(table_dir, f"{name}.npy"))
+    return suit, honor
+
+
+def load_tables(table_dir=TABLE_DIR):
+    """加载查找表 (内存映射)，不存在时先生成"""
+    global _tables
+    if _tables is None:
+        paths = [os.path.join(table_dir, f"{name}.npy") for name in ("suit", "honor")]
+        if all(os.path.exists(p) for p in paths):
+            _tables = tuple(np.load(p, mmap_mode="r") for p in paths)
+        else:
+            print(f"[shanten] 正在生成向听数查找表 -> {table_dir} ...")
+            _tables = build_tables(table_dir)
+    return _tables
+
+
+_POWERS = [5 ** i for i in range(9)]
+_SUIT_POWERS = np.array(_POWERS, dtype=np.int64)
+_HONOR_POWERS = _SUIT_POWERS[:7]
+_TERMINAL_LIST = _TERMINALS.tolist()
+
+
+# ------------------------------------------------------------
+# 向听数
+# ------------------------------------------------------------
+def _combine(a, b):
+    """两组 [N, 10] 的所需张数做 min-plus 卷积 (面子数相加，雀头至多一个)"""
+    out = np.empty_like(a)
+    for j in range(5):
+        out[:, j] = np.min([a[:, k] + b[:, j - k] for k in range(j + 1)], axis=0)
+        out[:, 5 + j] = np.min([a[:, 5 + k] + b[:, j - k] for k in range(j + 1)]
+                               + [a[:, k] + b[:, 5 + j - k] for k in range(j + 1)], axis=0)
+    return out
+
+
+def shanten_regular_batch(counts, melds=None):
+    """
+    一般形向听数 (批量)
+
+    Args:
+        counts: [N, 34] 手牌 (不含副露) 的牌种计数
+        melds: [N] 或标量，已有副露数；None 时按手牌张数推算 (13/14 张为 0，10/11 张为 1 ...)
+    """
+    counts = np.asarray(counts, dtype=np.int64).reshape(-1, NUM_KINDS)
+    suit, honor = load_tables()
+    rows = [np.asarray(suit[counts[:, s] @ _SUIT_POWERS], dtype=np.int16) for s in _SUIT_SLICES[:3]]
+    rows.append(np.asarray(honor[counts[:, 27:] @ _HONOR_POWERS], dtype=np.int16))
+    acc = rows[0]
+    for row in rows[1:]:
+        acc = _combine(acc, row)
+    if melds is None:
+        need = np.minimum(4, counts.sum(axis=1) // 3)
+    else:
+        need = 4 - np.broadcast_to(np.asarray(melds), (len(counts),))
+    return (acc[np.arange(len(counts)), 5 + need] - 1).astype(np.int8)
+
+
+def shanten_chiitoi_batch(counts):
+    """七对子向听数 (批量)，只对 13/14 张有意义"""
+    counts = np.asarray(counts).reshape(-1, NUM_KINDS)
+    pairs = (counts >= 2).sum(axis=1)
+    kinds = (counts >= 1).sum(axis=1)
+    return (6 - pairs + np.maximum(0, 7 - kinds)).astype(np.int8)
+
+
+def shanten_kokushi_batch(counts):
+    """国士无双向听数 (批量)，只对 13/14 张有意义"""
+    term = np.asarray(counts).reshape(-1, NUM_KINDS)[:, _TERMINALS]
+    return (13 - (term >= 1).sum(axis=1) - (term >= 2).any(axis=1)).astype(np.int8)
+
+
+def shanten_batch(counts, melds=None):
+    """
+    向听数 (批量)：一般形 / 七对子 / 国士无双中的最小值；有副露时只算一般形
+
+    Returns:
+        int8 [N]，-1 表示已经和牌
+    """
+    counts = np.asarray(counts).reshape(-1, NUM_KINDS)
+    result = shanten_regular_batch(counts, melds)
+    closed = counts.sum(axis=1) >= 13
+    if melds is not None:
+        closed &= np.broadcast_to(np.asarray(melds), (len(counts),)) == 0
+    if closed.any():
+        special = np.minimum(shanten_chiitoi_batch(counts[closed]), shanten_kokushi_batch(counts[closed]))
+        result[closed] = np.minimum(result[closed], special)
+    return result
+
+
+# ------------------------------------------------------------
+# 单手牌 (纯 Python)
+# 批量接口每次调用有数百微秒的 NumPy 固定开销，单手牌只需组合 4 行 10 个数，直接用 Python 列表计算
+# ------------------------------------------------------------
+def _suit_codes(counts):
+    """每一门的表下标 (counts 为 Python 列表)"""
+    return [sum(c * p for c, p in zip(counts[sl], _POWERS)) for sl in _SUIT_SLICES]
+
+
+def _suit_rows(codes):
+    suit, honor = load_tables()
+    return [suit[codes[0]].tolist(), suit[codes[1]].tolist(), suit[codes[2]].tolist(), honor[codes[3]].tolist()]
+
+
+def _combine_one(a, b):
+    """_combine 的单手牌版本"""
+    out = [0] * NUM_PATTERNS
+    for j in range(5):
+        out[j] = min(a[k] + b[j - k] for k in range(j + 1))
+        out[5 + j] = min(min(a[5 + k] + b[j - k], a[k] + b[5 + j - k]) for k in range(j + 1))
+    return out
+
+
+def _pattern_one(a, b, need):
+    """a、b 组合后凑成 need 个面子加雀头所需的张数 (只算最后需要的这一个模式)"""
+    return min(min(a[5 + k] + b[need - k], a[k] + b[5 + need - k]) for k in range(need + 1))
+
+
+def _special_one(counts):
+    """七对子与国士无双向听数的较小值"""
+    pairs = sum(c >= 2 for c in counts)
+    kinds = sum(c >= 1 for c in counts)
+    term = [counts[k] for k in _TERMINAL_LIST]
+    kokushi = 13 - sum(c >= 1 for c in term) - any(c >= 2 for c in term)
+    return min(6 - pairs + max(0, 7 - kinds), kokushi)
+
+
+def _need(total, melds):
+    return min(4, total // 3) if melds is None else 4 - int(melds)
+
+
+def shanten(counts, melds=None):
+    """单手牌的向听数 (与 shanten_batch 结果一致)"""
+    counts = np.asarray(counts).reshape(-1).tolist()
+    total = sum(counts)
+    rows = _suit_rows(_suit_codes(counts))
+    result = _pattern_one(_combine_one(_combine_one(rows[0], rows[1]), rows[2]), rows[3], _need(total, melds)) - 1
+    if total >= 13 and not melds:
+        result = min(result, _special_one(counts))
+    return result
+
+
+# ------------------------------------------------------------
+# 有效牌
+# ------------------------------------------------------------
+def ukeire(counts, visible=None, melds=None):
+    """
+    3n+1 张手牌的有效牌: 摸进后向听数减少的牌种
+
+    Args:
+        visible: 可选的 [34] 场上已见的张数 (牌河、副露、宝牌指示牌)，用来计算剩余枚数
+    Returns:
+        (当前向听数, 有效牌种列表, 剩余总枚数)
+    """
+    counts = np.asarray(counts).reshape(-1).tolist()
+    current = shanten(counts, melds)
+    need = _need(sum(counts) + 1, melds)
+    special = sum(counts) + 1 >= 13 and not melds
+    codes = _suit_codes(counts)
+    rows = _suit_rows(codes)
+    tables = load_tables()
+    kinds = []
+    # 摸进一张只改变一门的行: 其余三门先组合好，每种候选牌只需查一行、算一个模式
+    for s, sl in enumerate(_SUIT_SLICES):
+        a, b, c = [rows[t] for t in range(4) if t != s]
+        rest = _combine_one(_combine_one(a, b), c)
+        table = tables[0 if s < 3 else 1]
+        for i, kind in enumerate(range(sl.start, sl.stop)):
+            if counts[kind] >= 4:
+                continue
+            after = _pattern_one(rest, table[codes[s] + _POWERS[i]].tolist(), need) - 1
+            if special and after >= current:
+                counts[kind] += 1
+                after = min(after, _special_one(counts))
+                counts[kind] -= 1
+            if after < current:
+                kinds.append(kind)
+    seen = [0] * NUM_KINDS if visible is None else np.asarray(visible).tolist()
+    remaining = sum(max(0, 4 - counts[k] - seen[k]) for k in kinds)
+    return current, kinds, remaining
+
+
+def discard_options(counts, visible=None, melds=None):
+    """
+    3n+2 张手牌每种打法之后的向听数与有效牌 (牌效率)
+
+    Returns:
+        [(打出的牌种, 向听数, 有效牌种列表, 剩余总枚数)]，按 (向听数, -剩余枚数) 排序
+    """
+    counts = np.asarray(counts, dtype=np.int8).reshape(-1)
+    discards = np.flatnonzero(counts > 0)
+    # 所有 (打出, 摸进) 组合拼成一个批次: 前 len(discards) 行为打出之后的手牌，其余为再摸进一张
+    base = np.repeat(counts[None, :], len(discards), axis=0)
+    base[np.arange(len(discards)), discards] -= 1
+    rows, draws = np.nonzero(base < 4)
+    hands = base[rows]
+    hands[np.arange(len(rows)), draws] += 1
+    result = shanten_batch(np.concatenate([base, hands]), melds)
+    current = result[:len(discards)]
+    improved = np.zeros(base.shape, dtype=bool)
+    improved[rows, draws] = result[len(discards):] < current[rows]
+    remaining = 4 - base.astype(np.int16)
+    if visible is not None:
+        remaining = np.maximum(0, remaining - np.asarray(visible))
+    options = []
+    for i, kind in enumerate(discards.tolist()):
+        kinds = np.flatnonzero(improved[i])
+        options.append((kind, int(current[i]), kinds.tolist(), int(remaining[i, kinds].sum())))
+    options.sort(key=lambda o: (o[1], -o[3], o[0]))
+    return options
+
+
+# ------------------------------------------------------------
+# 语料标注
+# ------------------------------------------------------------
+def annotate_decisions(events):
+    """
+    为一局中每次切牌之前的手牌计算向听数 (批量)
+
+    Returns:
+        (位置列表, 向听数 int8 数组)，位置为该 dahai 事件在 events 中的下标
+    """
+    from replay import TableState
+    positions, hands, melds = [], [], []
+    state = None
+    for pos, event in enumerate(events):
+        etype = event.get("type")
+        if etype == "start_kyoku":
+            state = TableState(event)
+            continue
+        if state is None:
+            continue
+        if etype == "dahai":
+            seat = event["actor"]
+            positions.append(pos)
+            hands.append(state.hands[seat].copy())
+            melds.append(len(state.melds[seat]))
+        state.apply(event)
+    if not hands:
+        return positions, np.zeros(0, dtype=np.int8)
+    return positions, shanten_batch(np.stack(hands), np.array(melds))
+
+
+# ------------------------------------------------------------
+# 交叉校验
+# ------------------------------------------------------------
+def shanten_reference(counts, melds=None):
+    """
+    暴力参考实现 (很慢，只用于校验)，与查表使用同一个定义: 和牌还需要摸进的最少张数 - 1。
+    穷举目标和牌形 (need 个面子 + 雀头，每种牌不超过 4 张)，所需张数 = 目标比手牌多出的张数。
+    与手牌没有交集的面子 / 雀头总是各需 3 / 2 张，所以只枚举与手牌有交集的，其余按"另找一种牌"计算；
+    七对子与国士无双用与批量接口无关的计数方式计算
+    """
+    c = np.asarray(counts).reshape(-1).tolist()
+    total = sum(c)
+    need = _need(total, melds)
+    held = [k for k in range(NUM_KINDS) if c[k]]
+    units = [(k, k, k) for k in held]
+    units += [(i, i + 1, i + 2) for i in range(27) if i % 9 <= 6 and (c[i] or c[i + 1] or c[i + 2])]
+    target = [0] * NUM_KINDS
+    best = [3 * need + 2]
+
+    def extra(k, n):
+        """目标中第 k 种牌再加 n 张时多需要摸进的张数"""
+        return max(0, target[k] + n - c[k]) - max(0, target[k] - c[k])
+
+    def finish(cost):
+        pair = min([extra(k, 2) for k in held if target[k] <= 2] + [2])
+        best[0] = min(best[0], cost + pair)
+
+    def rec(first, left, cost):
+        if cost >= best[0]:
+            return
+        finish(cost + 3 * left)     # 剩下的面子全部另找
+        if not left:
+            return
+        for u in range(first, len(units)):
+            kinds = units[u]
+            if any(target[k] + kinds.count(k) > 4 for k in kinds):
+                continue
+            delta = 0
+            for k in kinds:
+                delta += extra(k, 1)
+                target[k] += 1
+            rec(u, left - 1, cost + delta)
+            for k in kinds:
+                target[k] -= 1
+
+    rec(0, need, 0)
+    result = best[0] - 1
+    if total >= 13 and not melds:
+        pairs = len([k for k in range(NUM_KINDS) if c[k] >= 2])
+        kinds = len([k for k in range(NUM_KINDS) if c[k] >= 1])
+        orphans = [k for k in _TERMINAL_LIST if c[k] >= 1]
+        kokushi = 13 - len(orphans) - (1 if any(c[k] >= 2 for k in orphans) else 0)
+        result = min(result, 6 - pairs + max(0, 7 - kinds), kokushi)
+    return result
+
+
+# 固定的边界手牌与期望向听数: 多是某种牌 4 张全在手里、常见公式会少算 1 的情况
+_EDGE_CASES = [
+    ("123m456p789s1111z", 1),
+    ("1111m234p567s789s", 1),
+    ("1111m", 1),
+    ("2222m", 1),
+    ("1111m2222p", 1),
+    ("1111m1111p1111s11z", 1),
+    ("1111z2222z3333z5z", 3),
+    ("11112222333344m", -1),
+    ("123m456p789s1122z", 0),
+    ("19m19p19s1234567z1z", -1),
+    ("11223344556677z", -1),
+]
+
+
+def self_check(n=2000, seed=0):
+    """
+    交叉校验 (固定的边界手牌 + 随机手牌):
+      shanten / shanten_batch 与暴力参考实现一致，边界手牌还要等于 _EDGE_CASES 中的期望值；
+      ukeire 与逐张摸进后用 shanten_batch 重算一致；discard_options 与逐种打出后调用 ukeire 一致
+    Returns:
+        不一致的手牌数
+    """
+    bad = 0
+    for text, expect in _EDGE_CASES:
+        counts = parse_hand(text)
+        got = (shanten(counts), int(shanten_batch(counts)[0]), shanten_reference(counts))
+        if got != (expect,) * 3:
+            bad += 1
+            print(f"  边界手牌不一致: {text} 期望 {expect} 单手牌 / 批量 / 参考 {got}")
+
+    rng = np.random.default_rng(seed)
+    wall = np.repeat(np.arange(NUM_KINDS), 4)
+    suit_wall = wall[(wall < 9) | (wall >= 27)]     # 集中在一门的手牌更容易出现复杂的拆法
+    hands, sizes = [parse_hand(text) for text, _ in _EDGE_CASES], [13, 14, 10, 11, 7, 8, 4, 5, 1, 2]
+    for i in range(n):
+        size = sizes[i % len(sizes)]
+        if i % 3 < 2:
+            tiles = rng.choice(suit_wall if i % 3 else wall, size, replace=False)
+            hands.append(np.bincount(tiles, minlength=NUM_KINDS).astype(np.int8))
+            continue
+        # 集中在少数几种牌上，经常出现 3-4 张相同的牌 (均匀抽样几乎抽不到 4 张)
+        few = rng.choice(NUM_KINDS, 4, replace=False)
+        counts = np.zeros(NUM_KINDS, dtype=np.int8)
+        while counts.sum() < size:
+            kind = rng.choice(few) if rng.random() < 0.7 else rng.integers(NUM_KINDS)
+            if counts[kind] < 4:
+                counts[kind] += 1
+        hands.append(counts)
+    batch = shanten_batch(np.stack(hands))
+
+    for i, counts in enumerate(hands):
+        expect = shanten_reference(counts)
+        got = (shanten(counts), int(batch[i]))
+        if got != (expect, expect):
+            bad += 1
+            print(f"  向听数不一致: {counts.tolist()} 参考 {expect} 单手牌 {got[0]} 批量 {got[1]}")
+            continue
+        if counts.sum() % 3 == 1:
+            draws = np.flatnonzero(counts < 4)
+            after = np.repeat(counts[None, :], len(draws), axis=0)
+            after[np.arange(len(draws)), draws] += 1
+            kinds = draws[shanten_batch(after) < expect].tolist()
+            if ukeire(counts)[:2] != (expect, kinds):
+                bad += 1
+                print(f"  有效牌不一致: {counts.tolist()} {ukeire(counts)[:2]} != {(expect, kinds)}")
+        elif i % 10 == 0:
+            expected = []
+            for kind in np.flatnonzero(counts > 0).tolist():
+                after = counts.copy()
+                after[kind] -= 1
+                expected.append((kind,) + ukeire(after))
+            expected.sort(key=lambda o: (o[1], -o[3], o[0]))
+            if discard_options(counts) != expected:
+                bad += 1
+                print(f"  打法不一致: {counts.tolist()}")
+    return bad
+
+
+def parse_hand(text):
+    """"123m456p789s11z" 形式 -> 34 维计数"""
+    counts = np.zeros(NUM_KINDS, dtype=np.int8)
+    digits = []
+    for ch in text:
+        if ch.isdigit():
+            digits.append(ch)
+        elif ch in "mpsz":
+            for d in digits:
+                # 0 表示赤五
+                counts[CODE_KINDS[f"{5 if d == '0' else d}{ch}"]] += 1
+            digits = []
+        else:
+            raise ValueError(f"无法解析的手牌: {text}")
+    if digits:
+        raise ValueError(f"缺少花色: {text}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="向听数 / 有效牌计算")
+    parser.add_argument("hand", nargs="?", help="手牌，如 123m456p789s1122z")
+    parser.add_argument("--build", action="store_true", help="生成查找表")
+    parser.add_argument("--check", type=int, metavar="N", help="用 N 手随机牌与暴力实现交叉校验")
+    args = parser.parse_args()
+
+    if args.build:
+        build_tables()
+        print(f"查找表已保存: {TABLE_DIR}")
+    if args.check:
+        bad = self_check(args.check)
+        print(f"交叉校验 {args.check} 手: {'全部一致' if not bad else f'{bad} 手不一致'}")
+        sys.exit(1 if bad else 0)
+    if not args.hand:
+        sys.exit()
+
+    counts = parse_hand(args.hand)
+    names = lambda kinds: " ".join(KIND_CODES[k] for k in kinds)
+    if counts.sum() % 3 == 2:
+        print(f"向听数: {shanten(counts)}")
+        for kind, s, kinds, total in discard_options(counts):
+            print(f"  打 {KIND_CODES[kind]:<3} 向听 {s}  有效牌 {total:>2} 枚: {names(kinds)}")
+    else:
+        s, kinds, total = ukeire(counts)
+        print(f"向听数: {s}  有效牌 {total} 枚: {names(kinds)}")
@@ -0,0 +1,257 @@
+import os
+import gzip
+import random
+from meld_codec import encode_meld, CHI, PON, KAKAN, DAIMINKAN, ANKAN
+
+# 🎲 合成天凤牌谱生成器
+#
+# 按给定随机种子生成结构上逼真的 .mjlog (XML)：配牌、摸切、吃碰杠 (合法的 m 编码)、
+# 立直、开杠后的新宝牌与岭上摸牌、和牌与流局，以及对局头部的 SHUFFLE/GO/UN/TAIKYOKU。
+# 出牌策略是随机的，牌型不保证合法，但牌的流转 (手牌/牌山/副露) 始终自洽，
+# 可以完整走通 convert_to_json、features 等下游流程。
+# 用于离线基准测试 (benchmark.py)，不需要下载真实牌谱。
+
+DRAW_TAGS = "TUVW"
+DISCARD_TAGS = "DEFG"
+
+# 每个事件发生的概率
+P_REACH = 0.02
+P_PON = 0.12
+P_CHI = 0.08
+P_DAIMINKAN = 0.05
+P_KAN = 0.3           # 手里有 4 张 / 碰过且摸到第 4 张时开杠
+P_AGARI = 0.008       # 每次切牌后有人和牌
+P_RENCHAN = 0.3       # 连庄 (本场数 +1)
+
+
+def _tile_attr(ids):
+    return ",".join(str(t) for t in ids)
+
+
+class _Kyoku:
+    """模拟一个小局，产出 XML 标签字符串"""
+    def __init__(self, rnd, seed_attr, oya, scores):
+        self.rnd = rnd
+        self.tags = []
+        self.wall = list(range(136))
+        rnd.shuffle(self.wall)
+        self.hands = [sorted(self.wall[i * 13:(i + 1) * 13]) for i in range(4)]
+        self.live = 52          # 下一张可摸的牌
+        self.live_end = 122     # 牌山末端 (之后是王牌)
+        self.dead = 135         # 岭上牌从王牌末端开始摸
+        self.dora_pos = 130     # 宝牌指示牌位置，每开一次杠往前移两张
+        self.pons = [[], [], [], []]
+        self.reach = [False] * 4
+        self.melded = [False] * 4
+        self.oya = oya
+        self.scores = scores
+        seed_attr = seed_attr + [self.wall[self.dora_pos]]
+        hai = " ".join(f'hai{i}="{_tile_attr(self.hands[i])}"' for i in range(4))
+        self.tags.append(f'<INIT seed="{_tile_attr(seed_attr)}" ten="{_tile_attr(scores)}" oya="{oya}" {hai}/>')
+
+    def _draw(self, seat, rinshan=False):
+        if rinshan:
+            tile = self.wall[self.dead]
+            self.dead -= 1
+            self.live_end -= 1
+        else:
+            tile = self.wall[self.live]
+            self.live += 1
+        self.hands[seat].append(tile)
+        self.tags.append(f"<{DRAW_TAGS[seat]}{tile}/>")
+        return tile
+
+    def _discard(self, seat, tile):
+        self.hands[seat].remove(tile)
+        self.tags.append(f"<{DISCARD_TAGS[seat]}{tile}/>")
+
+    def _meld(self, seat, naki_type, target, called, consumed):
+        m = encode_meld(naki_type, seat, target, called, consumed)
+        self.tags.append(f'<N who="{seat}" m="{m}" />')
+        self.melded[seat] = True
+
+    def _new_dora(self):
+        self.dora_pos -= 2
+        self.tags.append(f'<DORA hai="{self.wall[self.dora_pos]}" />')
+
+    def _by_kind(self, seat, kind):
+        return [t for t in self.hands[seat] if t // 4 == kind]
+
+    def _try_self_kan(self, seat, drawn):
+        """摸牌后尝试暗杠或加杠，成功返回 True (需要岭上摸牌)"""
+        # 海底牌不能开杠
+        if self.live >= self.live_end or self.rnd.random() >= P_KAN:
+            return False
+        kind = drawn // 4
+        same = self._by_kind(seat, kind)
+        if len(same) == 4 and not self.reach[seat]:
+            for t in same:
+                self.hands[seat].remove(t)
+            self._meld(seat, ANKAN, seat, None, sorted(same))
+            return True
+        for i, (pon_kind, target, pon_tiles) in enumerate(self.pons[seat]):
+            if pon_kind == kind:
+                self.hands[seat].remove(drawn)
+                self._meld(seat, KAKAN, target, drawn, sorted(pon_tiles))
+                del self.pons[seat][i]
+                return True
+        return False
+
+    def _try_call(self, discarder, tile):
+        """其他玩家对打出的牌鸣牌，返回 (鸣牌者座位或 None, 是否为大明杠)"""
+        kind = tile // 4
+        for offset in (1, 2, 3):
+            seat = (discarder + offset) % 4
+            if self.reach[seat]:
+                continue
+            same = self._by_kind(seat, kind)
+            if len(same) == 3 and self.rnd.random() < P_DAIMINKAN and self.live < self.live_end:
+                for t in same:
+                    self.hands[seat].remove(t)
+                self._meld(seat, DAIMINKAN, discarder, tile, sorted(same))
+                return seat, True
+            if len(same) >= 2 and self.rnd.random() < P_PON:
+                used = sorted(same[:2])
+                for t in used:
+                    self.hands[seat].remove(t)
+                self._meld(seat, PON, discarder, tile, used)
+                self.pons[seat].append((kind, discarder, used + [tile]))
+                return seat, False
+        # 只有下家可以吃
+        seat = (discarder + 1) % 4
+        if kind < 27 and not self.reach[seat] and self.rnd.random() < P_CHI:
+            num = kind % 9
+            for lo in (num - 2, num - 1, num):
+                if lo < 0 or lo + 2 > 8:
+                    continue
+                others = [kind - num + lo + i for i in range(3) if lo + i != num]
+                picks = [self._by_kind(seat, k) for k in others]
+                if all(picks):
+                    used = sorted(p[0] for p in picks)
+                    for t in used:
+                        self.hands[seat].remove(t)
+                    self._meld(seat, CHI, discarder, tile, used)
+                    return seat, False
+        return None, False
+
+    def _choose_discard(self, seat, drawn):
+        if self.reach[seat] and drawn is not None:
+            return drawn
+        return self.rnd.choice(self.hands[seat])
+
+    def _agari(self, who, from_who):
+        ten = self.rnd.choice([1000, 2000, 3900, 5200, 8000, 12000])
+        sc = []
+        for seat in range(4):
+            delta = ten // 100 if seat == who else (-ten // 100 if seat == from_who else 0)
+            sc += [self.scores[seat], delta]
+        self.tags.append(
+            f'<AGARI ba="0,0" hai="{_tile_attr(sorted(self.hands[who]))}" machi="{self.hands[who][-1]}" '
+            f'ten="30,{ten},0" yaku="1,1,52,1" doraHai="{self.wall[130]}" who="{who}" fromWho="{from_who}" '
+            f'sc="{_tile_attr(sc)}" />')
+        return who == self.oya
+
+    def play(self):
+        """进行一个小局，返回庄家是否连庄"""
+        seat, skip_draw = self.oya, False
+        while True:
+            drawn = None
+            if not skip_draw:
+                if self.live >= self.live_end:
+                    sc = []
+                    for s in range(4):
+                        sc += [self.scores[s], 0]
+                    self.tags.append(f'<RYUUKYOKU ba="0,0" sc="{_tile_attr(sc)}" />')
+                    return True
+                drawn = self._draw(seat)
+                while self._try_self_kan(seat, drawn):
+                    self._new_dora()
+                    drawn = self._draw(seat, rinshan=True)
+                if self.rnd.random() < P_AGARI / 4:
+                    return self._agari(seat, seat)
+            skip_draw = False
+
+            declare = (not self.reach[seat] and not self.melded[seat] and drawn is not None
+                       and self.rnd.random() < P_REACH)
+            if declare:
+                self.tags.append(f'<REACH who="{seat}" step="1"/>')
+            tile = self._choose_discard(seat, drawn)
+            self._discard(seat, tile)
+
+            if self.rnd.random() < P_AGARI:
+                winner = (seat + self.rnd.randint(1, 3)) % 4
+                return self._agari(winner, seat)
+            if declare:
+                self.reach[seat] = True
+                self.scores[seat] -= 10
+                self.tags.append(f'<REACH who="{seat}" ten="{_tile_attr(self.scores)}" step="2"/>')
+
+            caller, is_kan = self._try_call(seat, tile)
+            if caller is None:
+                seat = (seat + 1) % 4
+                continue
+            seat = caller
+            if is_kan:
+                self._new_dora()
+                drawn = self._draw(seat, rinshan=True)
+                tile = self._choose_discard(seat, drawn)
+                self._discard(seat, tile)
+                seat = (seat + 1) % 4
+            else:
+                # 吃/碰之后直接切牌，不摸牌
+                skip_draw = True
+
+
+def generate_mjlog(seed, num_kyoku=8):
+    """
+    生成一局合成牌谱的 XML 文本
+
+    Args:
+        seed: 随机种子 (相同种子生成完全相同的牌谱)
+        num_kyoku: 场数上限 (东1 ~ 南4 为 8)，连庄的小局不计入
+    """
+    rnd = random.Random(seed)
+    scores = [250, 250, 250, 250]
+    tags = [
+        '<mjloggm ver="2.3">',
+        f'<SHUFFLE seed="mt19937ar-sha512-n288-base64,synthetic{seed}" ref=""/>',
+        '<GO type="169" lobby="0"/>',
+        '<UN n0="%41" n1="%42" n2="%43" n3="%44" dan="16,16,16,16" rate="2100.00,2100.00,2100.00,2100.00" sx="M,M,M,M"/>',
+        '<TAIKYOKU oya="0"/>',
+    ]
+    kyoku_idx, honba = 0, 0
+    while kyoku_idx < num_kyoku:
+        kyoku = _Kyoku(rnd, [kyoku_idx, honba, 0, rnd.randint(0, 5), rnd.randint(0, 5)], kyoku_idx % 4, scores)
+        renchan = kyoku.play() and rnd.random() < P_RENCHAN
+        tags.extend(kyoku.tags)
+        if renchan:
+            honba += 1
+        else:
+            kyoku_idx, honba = kyoku_idx + 1, 0
+    # 最后一个结束标签带上终局信息
+    tags[-1] = tags[-1].replace(" />", f' owari="{_tile_attr(s for p in scores for s in (p, 0))}" />')
+    tags.append("</mjloggm>")
+    return "".join(tags)
+
+
+def write_corpus(out_dir, num_games, seed=0, compress="mixed"):
+    """
+    生成 num_games 个合成牌谱到 out_dir
+
+    Args:
+        compress: "gzip" 全部压缩 / "plain" 全部明文 / "mixed" 交替 (与真实下载结果类似)
+
+    Returns:
+        生成的文件路径列表
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(num_games):
+        data = generate_mjlog(seed * 1_000_003 + i).encode("utf-8")
+        if compress == "gzip" or (compress == "mixed" and i % 2 == 0):
+            data = gzip.compress(data, mtime=0)
+        path = os.path.join(out_dir, f"synthetic{seed:04d}-{i:07d}.mjlog")
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
@@ -0,0 +1,118 @@
+import numpy as np
+
+# 🀄 牌编码工具 (所有模块共用)
+#
+# 三种表示方式:
+#   - 牌ID (id136): 0-135，天凤与 mjx 通用。id // 4 即牌种，每种 4 张
+#   - 牌种 (kind34): 0-33，万 0-8, 筒 9-17, 条 18-26, 字 27-33 (东南西北白发中)
+#   - 牌代码 (code): MJAI 字符串，如 "1m", "5p", "7z"；赤宝牌为 "5mr", "5pr", "5sr"
+# 以及用于显示的中文名 (如 "五万", "赤五筒", "东")。
+#
+# 所有转换都是查表：标量查询用 Python 元组 (比 numpy 标量索引快)，
+# 整手牌 / 整个牌河的批量转换用 numpy 数组。
+
+NUM_IDS = 136
+NUM_KINDS = 34
+
+# 赤宝牌: 天凤 / mjx 中每种 5 的第一张 (5m, 5p, 5s)
+RED_FIVE_IDS = (16, 52, 88)
+
+_SUITS = "mps"
+_NUM_NAMES = ["一", "二", "三", "四", "五", "六", "七", "八", "九"]
+_SUIT_NAMES = {"m": "万", "p": "筒", "s": "条"}
+_HONOR_NAMES = ["东", "南", "西", "北", "白", "发", "中"]
+
+# --- 牌种 (0-33) 为下标的表 ---
+KIND_CODES = tuple([f"{n}{s}" for s in _SUITS for n in range(1, 10)] + [f"{n}z" for n in range(1, 8)])
+KIND_NAMES = tuple([f"{_NUM_NAMES[n]}{_SUIT_NAMES[s]}" for s in _SUITS for n in range(9)] + _HONOR_NAMES)
+
+# --- 牌ID (0-135) 为下标的表 ---
+ID_KINDS = tuple(i // 4 for i in range(NUM_IDS))
+ID_IS_RED = tuple(i in RED_FIVE_IDS for i in range(NUM_IDS))
+ID_CODES = tuple(KIND_CODES[k] for k in ID_KINDS)                                   # 不区分赤牌
+ID_CODES_RED = tuple(c + "r" if red else c for c, red in zip(ID_CODES, ID_IS_RED))  # 区分赤牌
+ID_NAMES = tuple("赤" + KIND_NAMES[k] if red else KIND_NAMES[k] for k, red in zip(ID_KINDS, ID_IS_RED))
+
+# --- 牌代码 -> 牌种 / 显示名 (赤牌代码也能查到) ---
+CODE_KINDS = {c: k for k, c in enumerate(KIND_CODES)}
+CODE_KINDS.update({KIND_CODES[ID_KINDS[i]] + "r": ID_KINDS[i] for i in RED_FIVE_IDS})
+CODE_NAMES = {c: KIND_NAMES[k] for c, k in CODE_KINDS.items()}
+CODE_NAMES.update({KIND_CODES[ID_KINDS[i]] + "r": ID_NAMES[i] for i in RED_FIVE_IDS})
+# 理牌顺序: 万/筒/条/字 及数字，同种牌中赤五排在普通五之前
+CODE_SORT_KEYS = {c: k * 2 + (0 if c.endswith("r") else 1) for c, k in CODE_KINDS.items()}
+
+# --- numpy 版本，用于批量转换 ---
+ID_KINDS_ARRAY = np.array(ID_KINDS, dtype=np.int8)
+ID_IS_RED_ARRAY = np.array(ID_IS_RED, dtype=bool)
+KIND_CODES_ARRAY = np.array(KIND_CODES)
+KIND_NAMES_ARRAY = np.array(KIND_NAMES)
+
+
+def id_to_kind(tile_id):
+    return ID_KINDS[tile_id]
+
+
+def id_to_code(tile_id, red=False):
+    """牌ID -> 牌代码；red=True 时赤五输出为 "5mr" 等"""
+    return ID_CODES_RED[tile_id] if red else ID_CODES[tile_id]
+
+
+def code_to_kind(code):
+    """牌代码 -> 牌种，未知代码返回 -1"""
+    return CODE_KINDS.get(code, -1)
+
+
+def code_name(code):
+    """牌代码 -> 中文名，未知代码原样返回"""
+    return CODE_NAMES.get(code, code)
+
+
+def ids_to_kinds(ids):
+    """批量: 牌ID 序列 -> 牌种数组 (int8)"""
+    return ID_KINDS_ARRAY[np.asarray(ids, dtype=np.intp)]
+
+
+def ids_to_codes(ids, red=False):
+    """批量: 牌ID 序列 -> 牌代码列表"""
+    table = ID_CODES_RED if red else ID_CODES
+    return [table[i] for i in ids]
+
+
+def codes_to_kinds(codes):
+    """批量: 牌代码序列 -> 牌种数组 (int8)，未知代码为 -1"""
+    return np.fromiter((CODE_KINDS.get(c, -1) for c in codes), dtype=np.int8, count=len(codes))
+
+
+def kinds_to_codes(kinds):
+    """批量: 牌种序列 -> 牌代码列表"""
+    return KIND_CODES_ARRAY[np.asarray(kinds, dtype=np.intp)].tolist()
+
+
+def ids_to_counts(ids):
+    """手牌 (牌ID 序列) -> 长度 34 的计数向量"""
+    return np.bincount(ids_to_kinds(ids), minlength=NUM_KINDS).astype(np.int8)
+
+
+def kinds_to_counts(kinds):
+    """手牌 (牌种序列) -> 长度 34 的计数向量"""
+    return np.bincount(np.asarray(kinds, dtype=np.intp), minlength=NUM_KINDS).astype(np.int8)
+
+
+def codes_to_counts(codes):
+    """手牌 (牌代码序列) -> 长度 34 的计数向量"""
+    return kinds_to_counts(codes_to_kinds(codes))
+
+
+def counts_to_kinds(counts):
+    """计数向量 -> 排好序的牌种数组 (理牌)"""
+    return np.repeat(np.arange(NUM_KINDS, dtype=np.int8), np.asarray(counts, dtype=np.intp))
+
+
+def sort_ids(ids):
+    """按牌ID 理牌 (牌ID 顺序即 万/筒/条/字 的显示顺序)"""
+    return np.sort(np.asarray(ids, dtype=np.int16))
+
+
+def sort_codes(codes):
+    """按 CODE_SORT_KEYS 理牌，未知代码排在最后"""
+    return sorted(codes, key=lambda c: CODE_SORT_KEYS.get(c, 2 * NUM_KINDS))
@@ -0,0 +1,420 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import collections
+import concurrent.futures
+import mjx
+from mjx_logger import MjxGameRecorder, MjxToMjaiConverter, MjaiWriter
+from server import HOST, PORT, PROTOCOL, TURN_TIMEOUT, DELTA_TURNS, TurnEncoder, parse_player_id, fallback_action_index
+from protocol import encode, read_message, JSON, BINARY, PROTOCOLS, ProtocolError
+from metrics import LatencyMetrics
+from event_stream import EventHub, SpectatorServer
+
+# 🀄 asyncio 多桌对局服务器
+#
+# 与 server.py 的 MahjongServer (4 个阻塞连接、只打一局) 不同:
+#   - 客户端连接后进入大厅，凑满 4 人自动开一桌 (先到先配)
+#   - 多桌在同一个事件循环里并发进行，env.reset/env.step 放到线程池执行，不阻塞网络 IO
+#   - 一局结束后连接不断开，玩家回到大厅继续匹配下一局
+#   - 同一回合需要决策的玩家同时询问，超过时间预算的玩家使用默认动作 (fallback_action_index)
+#   - 定期打印 tables/s、每回合延迟与玩家思考时间 (p50/p99)
+#   - 每回合各阶段耗时记入 LatencyMetrics (见 metrics.py)，--metrics 指定文件时定期导出；
+#     每桌结束时该桌的分阶段统计随对局记录一起写出 (tableNNNNNN.metrics.json)
+#   - --spectate-port 开启观战: 每桌的 MJAI 事件实时推送给观战连接 (见 event_stream.py)，不影响对局速度
+#
+# 消息格式与 server.py 相同 (json / binary 两种帧格式，见 protocol.py)，另外增加:
+#   {"type": "game_start", "player_id": 座位, "table": 桌号}   每局开始时告知本局座位
+#   {"type": "game_over", "next": true/false}                 next 为 true 表示连接保留、等待下一局
+# 每局开始时重新发送完整手牌，之后的 turn 消息只带手牌变化 (DELTA_TURNS，见 protocol.py)
+#
+# 用法:
+#   python async_server.py                  # 一直运行
+#   python async_server.py --games 1000     # 打完 1000 局后退出
+#   python async_server.py --metrics metrics.prom   # 定期写出 Prometheus 文本格式的耗时直方图
+#   python async_server.py --spectate-port 65500    # 开启观战，python event_stream.py 127.0.0.1:65500 --table 0
+
+# ⚙️ 配置
+ENV_WORKERS = 8             # 执行 env.reset/step 的线程数
+STATS_EVERY = 10.0          # 统计打印间隔 (秒)
+LATENCY_WINDOW = 10000      # 延迟分位数统计使用的最近回合数
+RECORD_DIR = None           # 设置目录后对局中实时写出每局的 mjx 记录与 MJAI 日志，None 表示不保存
+MAX_LINE = 1 << 20          # 单条消息最大长度
+
+
+class Player:
+    """一个客户端连接，跨多局保持"""
+    def __init__(self, pid, reader, writer, mode):
+        self.pid = pid
+        self.mode = mode
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.games = 0
+        self._pending = None        # 未完成的读取任务 (超时后保留，下次继续等待同一条消息)
+
+    async def send(self, msg):
+        self.writer.write(encode(msg, self.mode))
+        await self.writer.drain()
+
+    async def recv(self):
+        msg = await read_message(self.reader, self.mode)
+        if msg is None:
+            raise ConnectionError(f"玩家 {self.pid} 断开连接")
+        return msg
+
+    async def recv_before(self, deadline):
+        """
+        在截止时间 (perf_counter) 前读取一条消息，超时抛出 asyncio.TimeoutError。
+        超时不会取消正在进行的读取，避免一条消息被读了一半而破坏数据流。
+        """
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self.recv())
+            self._pending.add_done_callback(lambda t: t.cancelled() or t.exception())
+        done, _ = await asyncio.wait({self._pending}, timeout=max(0.0, deadline - time.perf_counter()))
+        if not done:
+            raise asyncio.TimeoutError
+        task, self._pending = self._pending, None
+        return task.result()
+
+    def close(self):
+        try: self.writer.close()
+        except: pass
+
+
+class ServerStats:
+    """对局吞吐与回合延迟统计"""
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.perf_counter()
+        self.tables_started = 0
+        self.tables_done = 0
+        self.tables_aborted = 0
+        self.turns = 0
+        self.latencies = collections.deque(maxlen=window)
+        self.think_times = collections.deque(maxlen=window)
+        self.timeouts = 0
+
+    def record_turn(self, seconds):
+        self.turns += 1
+        self.latencies.append(seconds)
+
+    def record_think(self, seconds, timed_out):
+        """一个玩家一次决策的思考时间 (从发出 turn 到收到回复)"""
+        self.think_times.append(seconds)
+        if timed_out:
+            self.timeouts += 1
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        pct = lambda xs, q: round(xs[min(len(xs) - 1, int(q * len(xs)))] * 1000, 3) if xs else None
+        lat, think = sorted(self.latencies), sorted(self.think_times)
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "tables_started": self.tables_started,
+            "tables_done": self.tables_done,
+            "tables_aborted": self.tables_aborted,
+            "tables_per_s": round(self.tables_done / elapsed, 3) if elapsed else 0.0,
+            "turns_per_s": round(self.turns / elapsed, 1) if elapsed else 0.0,
+            "turn_latency_ms": {"p50": pct(lat, 0.5), "p99": pct(lat, 0.99)},
+            "think_ms": {"p50": pct(think, 0.5), "p99": pct(think, 0.99)},
+            "timeouts": self.timeouts,
+        }
+
+
+class Table:
+    """一桌 4 人的一局游戏"""
+    def __init__(self, server, table_id, players):
+        self.server = server
+        self.table_id = table_id
+        self.players = players
+        self.base = os.path.join(server.record_dir, f"table{table_id:06d}") if server.record_dir else None
+        self.events = server.hub.open(table_id) if server.hub else None     # 观战事件流
+        self.converter = MjxToMjaiConverter()
+        self.mjai_writer = MjaiWriter(self.base + ".json", converter=self.converter) if self.base else None
+        self.recorder = None
+        if self.base or self.events:
+            self.recorder = MjxGameRecorder(self.base + ".mjx.jsonl" if self.base else None, sink=self._on_record)
+        self.failed = None          # 导致对局中断的玩家
+        self.encoders = [TurnEncoder(compact=p.mode == BINARY, delta=server.delta) for p in players]
+
+    def _on_record(self, record):
+        """recorder 的 sink: 转换为 MJAI 事件，写入日志并推送给观战者 (publish 不会等待观战者)"""
+        for event in self.converter.feed(record):
+            if self.mjai_writer:
+                self.mjai_writer.write(event)
+            if self.events:
+                self.events.publish(event)
+
+    def save_metrics(self):
+        """取出本桌的分阶段耗时，保存对局记录时一并写出"""
+        summary = self.server.metrics.finish_table(self.table_id)
+        if self.base:
+            with open(self.base + ".metrics.json", "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+    async def play(self):
+        """进行一局，返回是否正常结束 (False 表示有玩家掉线或协议错误)"""
+        loop = asyncio.get_running_loop()
+        env = self.server.acquire_env()
+        try:
+            obs_dict = await loop.run_in_executor(self.server.executor, env.reset)
+            for seat, player in enumerate(self.players):
+                await player.send({"type": "game_start", "player_id": seat, "table": self.table_id})
+
+            metrics = self.server.metrics
+            while obs_dict:
+                turn_start = time.perf_counter()
+                # 同时询问所有需要决策的玩家，共用一个截止时间
+                deadline = turn_start + self.server.turn_timeout
+                asks = [self._ask(player_key, obs, deadline) for player_key, obs in obs_dict.items()]
+                tasks = [asyncio.ensure_future(ask) for ask in asks]
+                try:
+                    answers = await asyncio.gather(*tasks)
+                except BaseException:
+                    # 一家出错时取消其余等待，避免它们继续读取连接
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+
+                action_dict = {}
+                for answer in answers:
+                    if answer is None: continue
+                    player_key, seat, obs, legal_actions, chosen_action, think, timed_out = answer
+                    action_dict[player_key] = chosen_action
+                    self.server.stats.record_think(think, timed_out)
+                    if self.recorder:
+                        with metrics.span("record", self.table_id, seat):
+                            self.recorder.record_turn(seat, obs, legal_actions, chosen_action,
+                                                      think_ms=round(think * 1000, 2))
+
+                if not action_dict:
+                    break
+                # 线程池中执行，包含排队等待空闲线程的时间
+                with metrics.span("step", self.table_id):
+                    obs_dict = await loop.run_in_executor(self.server.executor, env.step, action_dict)
+                turn_time = time.perf_counter() - turn_start
+                self.server.stats.record_turn(turn_time)
+                metrics.observe("turn", turn_time, self.table_id)
+        except (ConnectionError, OSError, ValueError, ProtocolError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError) as e:
+            print(f"[桌 {self.table_id}] 对局中断: {e}")
+            if self.failed:
+                self.failed.close()
+            return False
+        finally:
+            self.server.release_env(env)
+            if self.recorder:
+                self.recorder.close()
+            if self.mjai_writer:
+                self.mjai_writer.close()
+            if self.events:
+                self.server.hub.close(self.table_id)
+        return True
+
+    async def _ask(self, player_key, obs, deadline):
+        """询问一个玩家，返回 (player_key, 座位, obs, 合法动作, 选择的动作, 思考时间, 是否超时)，无需决策时返回 None"""
+        legal_actions = obs.legal_actions()
+        if not legal_actions:
+            return None
+        seat = parse_player_id(player_key)
+        player = self.players[seat]
+        seq = self.server.next_seq()
+        timer = self.server.metrics.timer(self.table_id, seat)
+        payload = self.encoders[seat].build(obs, legal_actions, timer)
+        payload["seq"] = seq
+        start = time.perf_counter()
+        try:
+            with timer("send"):
+                await player.send(payload)
+            while True:
+                resp = await player.recv_before(deadline)
+                # 上一回合超时后才到达的旧回复，丢弃
+                if resp.get("seq", seq) == seq:
+                    break
+            choice_idx = resp.get("act_idx", 0)
+            if not 0 <= choice_idx < len(legal_actions): choice_idx = 0
+            timed_out = False
+        except asyncio.TimeoutError:
+            choice_idx, timed_out = fallback_action_index(legal_actions), True
+        except BaseException:
+            self.failed = player
+            raise
+        think = time.perf_counter() - start
+        self.server.metrics.observe("wait", think, self.table_id, seat)
+        return player_key, seat, obs, legal_actions, legal_actions[choice_idx], think, timed_out
+
+
+class AsyncMahjongServer:
+    def __init__(self, host=HOST, port=PORT, env_workers=ENV_WORKERS, max_games=None,
+                 record_dir=RECORD_DIR, stats_every=STATS_EVERY, protocol=PROTOCOL, turn_timeout=TURN_TIMEOUT,
+                 metrics_path=None, spectate_port=None, delta=DELTA_TURNS):
+        self.host = host
+        self.turn_timeout = turn_timeout
+        self.protocol = protocol
+        self.delta = delta
+        self.port = port
+        self.turn_seq = 0
+        self.max_games = max_games
+        self.record_dir = record_dir
+        self.stats_every = stats_every
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=env_workers)
+        self.stats = ServerStats()
+        self.metrics = LatencyMetrics(export_path=metrics_path, export_every=stats_every)
+        self.spectate_port = spectate_port
+        self.hub = EventHub() if spectate_port else None
+        self.lobby = None           # asyncio.Queue，在事件循环内创建
+        self.tables = set()
+        self.next_pid = 0
+        self._envs = []             # 空闲的 MjxEnv，跨局复用
+        self._finished = None
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+
+    @property
+    def accepting(self):
+        """是否还会开新桌"""
+        return self.max_games is None or self.stats.tables_started < self.max_games
+
+    def acquire_env(self):
+        return self._envs.pop() if self._envs else mjx.MjxEnv()
+
+    def release_env(self, env):
+        self._envs.append(env)
+
+    async def handle_client(self, reader, writer):
+        # hello 总是按行 JSON 发送，之后切换到声明的协议
+        player = Player(self.next_pid, reader, writer, JSON)
+        self.next_pid += 1
+        try:
+            await player.send({"type": "hello", "player_id": player.pid, "protocol": self.protocol,
+                               "delta": self.delta})
+            player.mode = self.protocol
+        except (ConnectionError, OSError):
+            player.close()
+            return
+        print(f"玩家 {player.pid} 已连接: {player.addr}，大厅人数 {self.lobby.qsize() + 1}")
+        await self.lobby.put(player)
+
+    async def matchmaker(self):
+        """从大厅中按到达顺序每 4 人开一桌"""
+        while self.accepting:
+            players = [await self.lobby.get() for _ in range(4)]
+            if not self.accepting:
+                await self._dismiss(players)
+                break
+            table_id = self.stats.tables_started
+            self.stats.tables_started += 1
+            task = asyncio.create_task(self.run_table(table_id, players))
+            self.tables.add(task)
+            task.add_done_callback(self.tables.discard)
+
+    def next_seq(self):
+        """
+        turn 消息序号 (全服务器递增，不随对局重置)
+        玩家超时后未读完的回复会带到下一局，序号不重复才能保证旧回复一定被丢弃；binary 协议中为 u32，回绕时跳过 0
+        """
+        self.turn_seq = self.turn_seq % 0xFFFFFFFF + 1
+        return self.turn_seq
+
+    async def run_table(self, table_id, players):
+        table = Table(self, table_id, players)
+        ok = False
+        try:
+            ok = await table.play()
+        except Exception as e:
+            # mjx 内部错误等意料之外的异常: 本桌按中断处理，其余玩家照常回到大厅
+            print(f"[桌 {table_id}] 对局异常: {type(e).__name__}: {e}")
+            if table.failed:
+                table.failed.close()
+        finally:
+            await self._finish_table(table, ok)
+
+    async def _finish_table(self, table, ok):
+        players = table.players
+        table.save_metrics()
+        if ok:
+            self.stats.tables_done += 1
+        else:
+            self.stats.tables_aborted += 1
+
+        # 玩家回到大厅；导致中断的玩家直接断开
+        for player in players:
+            if not ok and player is table.failed:
+                continue
+            player.games += 1
+            try:
+                await player.send({"type": "game_over", "next": self.accepting, "aborted": not ok})
+            except (ConnectionError, OSError):
+                player.close()
+                continue
+            if self.accepting:
+                await self.lobby.put(player)
+            else:
+                player.close()
+
+        # 其他桌的任务可能已经结束但还没从 self.tables 中移除 (done 回调稍后才执行)，按 done() 判断
+        current = asyncio.current_task()
+        if not self.accepting and all(task is current or task.done() for task in self.tables):
+            self._finished.set()
+
+    async def _dismiss(self, players):
+        for player in players:
+            try: await player.send({"type": "game_over", "next": False})
+            except (ConnectionError, OSError): pass
+            player.close()
+
+    async def report_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_every)
+            print(f"[统计] {json.dumps(self.stats.snapshot(), ensure_ascii=False)}")
+            if self.metrics.export_path:
+                self.metrics.export()
+
+    async def serve(self):
+        self.lobby = asyncio.Queue()
+        self._finished = asyncio.Event()
+        server = await asyncio.start_server(self.handle_client, self.host, self.port, limit=MAX_LINE)
+        print(f"🀄 多桌服务器启动 {self.host}:{self.port}，每凑满 4 名玩家开一桌...")
+        spectate_server = await SpectatorServer(self.hub, self.host, self.spectate_port).start() if self.hub else None
+        matchmaker = asyncio.create_task(self.matchmaker())
+        reporter = asyncio.create_task(self.report_stats())
+        try:
+            async with server:
+                await self._finished.wait()
+        finally:
+            matchmaker.cancel()
+            reporter.cancel()
+            if spectate_server:
+                spectate_server.close()
+            while not self.lobby.empty():
+                self.lobby.get_nowait().close()
+            self.executor.shutdown(wait=False)
+            print(f"[统计] {json.dumps(self.stats.snapshot(), ensure_ascii=False)}")
+            self.metrics.print_summary()
+            if self.metrics.export_path:
+                print(f"[Metrics] 各阶段耗时已保存: {self.metrics.export()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="asyncio 多桌麻将服务器")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--games", type=int, default=None, help="打完多少局后退出 (默认一直运行)")
+    parser.add_argument("--env-workers", type=int, default=ENV_WORKERS)
+    parser.add_argument("--record-dir", default=RECORD_DIR)
+    parser.add_argument("--protocol", choices=PROTOCOLS, default=PROTOCOL, help="通信格式")
+    parser.add_argument("--turn-timeout", type=float, default=TURN_TIMEOUT, help="每回合等待回复的时间预算 (秒)")
+    parser.add_argument("--metrics", default=None, help="定期导出各阶段耗时的文件 (.json 或 .prom)")
+    parser.add_argument("--spectate-port", type=int, default=None, help="观战服务端口 (默认不开启)")
+    args = parser.parse_args()
+
+    server = AsyncMahjongServer(args.host, args.port, args.env_workers, args.games, args.record_dir,
+                                protocol=args.protocol, turn_timeout=args.turn_timeout, metrics_path=args.metrics,
+                                spectate_port=args.spectate_port)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print("服务器已停止")
@@ -1,17 +1,24 @@
 import socket
-import json
 import sys
 import random
 import time
+from protocol import MessageSocket, HandMirror, BINARY, describe_action, hand_codes
 
 HOST = '127.0.0.1'
 PORT = 65432
 
 class MahjongClient:
-    def __init__(self, mode="manual"):
+    def __init__(self, mode="manual", infer_addr=None):
         self.mode = mode
+        # 自动模式下可以接入批量推理服务 (inference_service.py)，否则随机选择
+        self.infer = None
+        if infer_addr:
+            from inference_service import InferenceClient
+            self.infer = InferenceClient(infer_addr)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.player_id = -1
+        self.stream = MessageSocket(self.sock)
+        self.hand = HandMirror()    # 服务器只发送手牌变化时，在本地维护手牌
 
     def connect(self):
         try:
@@ -20,18 +27,17 @@ class MahjongClient:
             data = self.read_json()
             if data and data['type'] == 'hello':
                 self.player_id = data['player_id']
+                # 之后的消息按服务器声明的协议收发
+                self.stream.mode = data.get('protocol', 'json')
                 print(f"✅ 已连接服务器，我是玩家 P{self.player_id}，模式: [{self.mode.upper()}]")
         except ConnectionRefusedError:
             print("❌ 无法连接服务器，请确认 server.py 已启动")
             sys.exit()
 
     def read_json(self):
-        """简单的按行读取 JSON"""
+        """读取下一条消息 (按帧拆分，连续到达或被拆开的消息都能正确处理)"""
         try:
-            data = self.sock.recv(4096).strip()
-            if not data: return None
-            # 处理粘包风险（简单处理：假设每次只有一条json）
-            return json.loads(data.decode())
+            return self.stream.recv()
         except Exception as e:
             return None
 
@@ -53,20 +59,35 @@ class MahjongClient:
             if not msg:
                 break
             
+            if msg['type'] == 'game_start':
+                # 多桌服务器 (async_server.py) 每局重新分配座位
+                self.player_id = msg['player_id']
+                self.hand.reset()
+                print(f"🀄 第 {msg['table']} 桌开局，本局座位 P{self.player_id}")
+                continue
+
             if msg['type'] == 'game_over':
                 print("🏁 对局结束")
+                if msg.get('next'):
+                    continue
                 break
             
             if msg['type'] == 'turn':
                 # 是我的回合
-                hand = msg['hand']
+                hand = list(self.hand.update(msg))
                 actions = msg['actions']
+                if self.mode == "manual":
+                    # binary 协议 / 增量手牌只传牌ID 与动作编号，显示时再转换成文字
+                    if hand and isinstance(hand[0], int):
+                        hand = hand_codes(hand)
+                    if self.stream.mode == BINARY:
+                        actions = [describe_action(t, tile) for t, tile in actions]
                 
                 # === 决策逻辑 ===
                 choice = 0
                 
                 if self.mode == "manual":
-                    self.display_ascii_hand(hand, actions, msg['info'])
+                    self.display_ascii_hand(hand, actions, msg.get('info', 'Playing'))
                     while True:
                         try:
                             user_input = input(f"请输入动作编号 (0-{len(actions)-1}): ")
@@ -77,26 +98,34 @@ class MahjongClient:
                             pass
                 else:
                     # === 自动模式 (AI) ===
-                    # 这里为了演示，我们使用 Random AI
-                    # 如果你想接入你的 AI，就在这里调用你的 model.predict()
-                    # 简单模拟思考时间
+                    # 接入了推理服务时由模型决策，否则使用 Random AI
                     print(f"[Auto] P{self.player_id} 正在思考...", end="\r")
-                    time.sleep(0.1) 
-                    choice = random.randint(0, len(actions) - 1)
+                    if self.infer:
+                        from inference_service import featurize_turn, choose_action
+                        obs, mask, slots = featurize_turn(dict(msg, hand=hand))
+                        choice = choose_action(slots, self.infer.predict(obs, mask))
+                    else:
+                        # 简单模拟思考时间
+                        time.sleep(0.1) 
+                        choice = random.randint(0, len(actions) - 1)
                     # 打印一下机器人的选择
-                    print(f"[Auto] P{self.player_id} 选择了: {actions[choice]}")
+                    chosen = actions[choice]
+                    if self.stream.mode == BINARY:
+                        chosen = describe_action(*chosen)
+                    print(f"[Auto] P{self.player_id} 选择了: {chosen}")
 
                 # 发送响应
-                resp = {"act_idx": choice}
-                self.sock.sendall(json.dumps(resp).encode())
+                resp = {"act_idx": choice, "seq": msg.get("seq", 0)}
+                self.stream.send(resp)
 
         self.sock.close()
 
 if __name__ == "__main__":
-    # 使用方法: python client.py [auto/manual]
+    # 使用方法: python client.py [auto/manual] [推理服务地址 host:port]
     mode = "manual"
     if len(sys.argv) > 1:
         mode = sys.argv[1]
+    infer_addr = sys.argv[2] if len(sys.argv) > 2 else None
     
-    client = MahjongClient(mode=mode)
+    client = MahjongClient(mode=mode, infer_addr=infer_addr)
     client.run()
\ No newline at end of file
@@ -0,0 +1,305 @@
+import sys
+import json
+import asyncio
+import argparse
+import threading
+
+# 👀 观战 / 事件流分发
+#
+# 每桌一个固定容量的环形缓冲区 (EventRing)，对局循环把 MJAI 事件 publish 进去:
+#   - publish 只是写入一个槽位并唤醒等待者，与观战者数量无关，不会等待任何观战者
+#   - 观战者各自持有读位置 (Subscription)，按自己的速度读取
+#   - 读得太慢、被覆盖的观战者跳到当前这一局的开头 (最近的 start_kyoku) 继续，并收到 skip 通知；
+#     跳过次数超过 MAX_SKIPS 或发送缓冲长时间写不出去的网络观战者直接断开
+#   - 中途加入的观战者从最近的 start_kyoku 开始补发，能看到这一局的完整过程
+#
+# 进程内订阅 (解说、日志等):
+#   ring = hub.get(table_id)
+#   sub = Subscription(ring)
+#   async for event in sub: ...               # 对局结束 (ring.close) 后退出
+#   events = sub.poll()                       # 或者非阻塞地取出新事件
+#
+# 网络观战 (每行一个 JSON 事件):
+#   python async_server.py --spectate-port 65500
+#   python event_stream.py 127.0.0.1:65500            # 列出进行中的桌
+#   python event_stream.py 127.0.0.1:65500 --table 3  # 观看第 3 桌
+#
+# 连接后发送一行 {"type": "watch", "table": 桌号}，服务器先回复 {"type": "spectate", ...}，之后逐行推送事件；
+# 发送 {"type": "tables"} 则返回进行中的桌号列表。
+
+# ⚙️ 配置
+RING_CAPACITY = 4096        # 每桌缓冲的事件数 (一局通常几百到一千多个事件)
+READ_BATCH = 256            # 每次最多取出的事件数
+HIGH_WATER = 256 * 1024     # 网络观战者发送缓冲超过该值 (字节) 时等待写出
+SEND_TIMEOUT = 5.0          # 发送缓冲在该时间内写不出去则断开 (秒)
+MAX_SKIPS = 8               # 网络观战者最多被跳过几次，之后断开
+SPECTATE_HOST = '127.0.0.1'
+MAX_LINE = 1 << 16
+
+
+class EventRing:
+    """
+    一桌的事件环形缓冲区
+
+    事件序号从 0 开始递增，序号 i 的事件存放在 buf[i % capacity]；
+    只保留最近 capacity 个事件，更早的被覆盖。
+    publish 可以在任意线程调用 (例如阻塞服务器的主线程)，等待者所在的事件循环会被线程安全地唤醒。
+    """
+    def __init__(self, table, capacity=RING_CAPACITY):
+        self.table = table
+        self.capacity = capacity
+        self.buf = [None] * capacity
+        self.next_seq = 0           # 下一个事件的序号
+        self.kyoku_start = 0        # 最近一个 start_kyoku 的序号
+        self.closed = False
+        self._waiter = None         # 等待新事件的 Future (所有订阅者共用)
+        self._loop = None
+
+    @property
+    def oldest(self):
+        """缓冲区中最早一个事件的序号"""
+        return max(0, self.next_seq - self.capacity)
+
+    def publish(self, event):
+        seq = self.next_seq
+        self.buf[seq % self.capacity] = event
+        if event.get("type") == "start_kyoku":
+            self.kyoku_start = seq
+        self.next_seq = seq + 1
+        if self._waiter is not None:
+            self._wake()
+
+    def close(self):
+        """对局结束: 推送 end_game，订阅者读完剩余事件后结束"""
+        if not self.closed:
+            self.publish({"type": "end_game"})
+            self.closed = True
+            self._wake()
+
+    def catch_up_seq(self):
+        """新订阅者的起点: 最近的 start_kyoku (已被覆盖时为最早的事件)"""
+        return max(self.kyoku_start, self.oldest)
+
+    def read(self, cursor, limit=READ_BATCH):
+        """
+        从 cursor 开始读取至多 limit 个事件
+
+        Returns:
+            (事件列表, 新的 cursor, 跳过的事件数)
+        """
+        skipped = 0
+        if cursor < self.oldest:
+            # 被覆盖了: 跳到当前这一局的开头
+            target = self.catch_up_seq()
+            skipped, cursor = target - cursor, target
+        end = min(self.next_seq, cursor + limit)
+        cap, buf = self.capacity, self.buf
+        events = [buf[i % cap] for i in range(cursor, end)]
+        # 读取期间 publish 可能在另一个线程覆盖了开头的槽位，丢掉这部分
+        lost = self.oldest - cursor
+        if lost > 0:
+            events = events[lost:]
+            skipped += lost
+        return events, end, skipped
+
+    async def wait(self, cursor):
+        """等待序号 cursor 的事件出现 (或缓冲区关闭)"""
+        while cursor >= self.next_seq and not self.closed:
+            if self._waiter is None:
+                self._loop = asyncio.get_running_loop()
+                self._waiter = self._loop.create_future()
+            waiter = self._waiter
+            # 设置 waiter 之后再检查一次，避免另一个线程恰好在这之前 publish 而错过唤醒
+            if cursor < self.next_seq or self.closed:
+                break
+            await asyncio.shield(waiter)
+
+    def _wake(self):
+        waiter, loop = self._waiter, self._loop
+        if waiter is None:
+            return
+        self._waiter = None
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            if not waiter.done():
+                waiter.set_result(None)
+        else:
+            try:
+                loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+            except RuntimeError:
+                pass        # 事件循环已经关闭
+
+
+class Subscription:
+    """一个订阅者在某桌事件流中的读位置"""
+    def __init__(self, ring, from_start=False):
+        self.ring = ring
+        self.cursor = 0 if from_start else ring.catch_up_seq()
+        self.skipped = 0            # 累计跳过的事件数
+        self.skips = 0              # 跳过的次数
+
+    def poll(self, limit=READ_BATCH):
+        """非阻塞地取出新事件"""
+        events, self.cursor, skipped = self.ring.read(self.cursor, limit)
+        if skipped:
+            self.skipped += skipped
+            self.skips += 1
+        return events
+
+    @property
+    def done(self):
+        return self.ring.closed and self.cursor >= self.ring.next_seq
+
+    async def next_batch(self, limit=READ_BATCH):
+        """等待并取出下一批事件，流结束时返回空列表"""
+        while True:
+            events = self.poll(limit)
+            if events or self.done:
+                return events
+            await self.ring.wait(self.cursor)
+
+    async def __aiter__(self):
+        while True:
+            events = await self.next_batch()
+            if not events:
+                return
+            for event in events:
+                yield event
+
+
+class EventHub:
+    """所有进行中对局的事件流，按桌号索引"""
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.rings = {}
+
+    def open(self, table):
+        ring = self.rings[table] = EventRing(table, self.capacity)
+        return ring
+
+    def close(self, table):
+        ring = self.rings.pop(table, None)
+        if ring:
+            ring.close()
+
+    def get(self, table):
+        return self.rings.get(table)
+
+    def tables(self):
+        return sorted(self.rings)
+
+
+# ------------------------------------------------------------
+# 网络观战
+# ------------------------------------------------------------
+class SpectatorServer:
+    """把 EventHub 中的事件流按行 JSON 推送给观战连接"""
+    def __init__(self, hub, host=SPECTATE_HOST, port=None):
+        self.hub = hub
+        self.host = host
+        self.port = port
+        self.watchers = 0
+        self.dropped = 0
+
+    async def start(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_LINE)
+        print(f"👀 观战服务启动 {self.host}:{self.port}")
+        return server
+
+    def start_in_thread(self):
+        """在后台线程的事件循环中运行 (供阻塞的 server.py 使用)"""
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+
+    async def handle(self, reader, writer):
+        try:
+            line = await reader.readline()
+            request = json.loads(line) if line.strip() else {}
+            if request.get("type") != "watch":
+                writer.write(_line({"type": "tables", "tables": self.hub.tables()}))
+                await writer.drain()
+                return
+            ring = self.hub.get(request.get("table"))
+            if ring is None:
+                writer.write(_line({"type": "error", "message": f"没有进行中的第 {request.get('table')} 桌"}))
+                await writer.drain()
+                return
+            await self._stream(Subscription(ring), writer)
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            try: writer.close()
+            except: pass
+
+    async def _stream(self, sub, writer):
+        self.watchers += 1
+        try:
+            writer.write(_line({"type": "spectate", "table": sub.ring.table, "from": sub.cursor}))
+            transport = writer.transport
+            skips = 0
+            while True:
+                events = await sub.next_batch()
+                if not events:
+                    break
+                if sub.skips != skips:
+                    skips = sub.skips
+                    if skips > MAX_SKIPS:
+                        self.dropped += 1
+                        return
+                    writer.write(_line({"type": "skip", "skipped": sub.skipped}))
+                writer.write(b"".join(_line(event) for event in events))
+                # 只在发送缓冲积压时才等待写出；等待期间对局照常进行，落后太多就在下一次读取时跳过
+                if transport.get_write_buffer_size() > HIGH_WATER:
+                    try:
+                        await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        self.dropped += 1
+                        return
+            await writer.drain()
+        finally:
+            self.watchers -= 1
+
+
+def _line(event):
+    return json.dumps(event, ensure_ascii=False, separators=(',', ':')).encode() + b"\n"
+
+
+# ------------------------------------------------------------
+# 命令行观战客户端
+# ------------------------------------------------------------
+async def watch(addr, table=None, out=sys.stdout):
+    host, _, port = addr.rpartition(":")
+    reader, writer = await asyncio.open_connection(host or SPECTATE_HOST, int(port), limit=MAX_LINE)
+    request = {"type": "watch", "table": table} if table is not None else {"type": "tables"}
+    writer.write(_line(request))
+    await writer.drain()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        out.write(line.decode())
+        out.flush()
+    writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="观战: 实时输出某桌的 MJAI 事件")
+    parser.add_argument("addr", help="观战服务地址 host:port")
+    parser.add_argument("--table", type=int, default=None, help="桌号 (不指定时列出进行中的桌)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(watch(args.addr, args.table))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,324 @@
+import os
+import re
+import sys
+import time
+import queue
+import struct
+import asyncio
+import argparse
+import threading
+import collections
+import concurrent.futures
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from protocol import ACTION_TYPE_MAP, ProtocolError, TILE_NAMES, describe_action
+from tile_codec import CODE_KINDS, NUM_KINDS
+
+# 🧠 批量推理服务
+#
+# 多个客户端 (或多个对局线程) 各自提交一个观测，服务把同一时间窗口内到达的请求合并成一批，
+# 只做一次向量化的前向计算，摊薄每次调用的固定开销:
+#   - 批次凑满 max_batch 个请求，或最早的请求已等待 max_wait 秒，就立即执行
+#   - 统计队列深度、批大小分布与请求延迟 p50/p99
+#
+# 进程内使用:
+#   service = InferenceService(StubModel())
+#   choice = service.predict(obs, mask)                 # 阻塞，可在多个线程中同时调用
+#   choice = await service.predict_async(obs, mask)     # asyncio
+#
+# 作为独立进程供 client.py 使用:
+#   python inference_service.py --port 7000
+#   python client.py auto 127.0.0.1:7000
+
+# ⚙️ 配置
+MAX_BATCH = 64              # 每批最多请求数
+MAX_WAIT = 0.002            # 最早的请求最多等待多久 (秒) 就开始执行
+LATENCY_WINDOW = 10000      # 延迟分位数统计使用的最近请求数
+HOST = '127.0.0.1'
+PORT = 7000
+
+# 观测与动作空间 (由 turn 消息构造，见 featurize_turn)
+OBS_CHANNELS = 2            # 0: 手牌张数 / 4   1: 可以打出的牌种
+NUM_ACTIONS = NUM_KINDS + 13  # 0-33: 打出该牌种   34 + 动作类型 (0-11): 其他动作 (立直/吃/碰/杠/和...)
+OTHER_SLOT = NUM_KINDS + 12   # 协议表以外的动作类型 (如 mjx 小局结束时的 DUMMY = 99)
+DISCARD_TYPES = (1, 2)
+
+
+# ------------------------------------------------------------
+# 特征
+# ------------------------------------------------------------
+# JSON 协议中动作是 "[切牌(手切)] 5m" 形式的文字，预先建好反查表
+_DESCRIPTION_TO_ACTION = {}
+for _type in ACTION_TYPE_MAP:
+    for _tile in list(range(136)) + [None]:
+        _DESCRIPTION_TO_ACTION.setdefault(describe_action(_type, _tile), (_type, _tile))
+_TILE_IDS = {name: tile for tile, name in TILE_NAMES.items()}
+_UNKNOWN_DESCRIPTION = re.compile(r"\[(-?\d+)\] (.*)")
+
+
+def parse_action(text):
+    """
+    JSON 协议的动作文字 -> (动作类型, 牌ID)
+    协议表以外的类型由 describe_action 写成 "[99] " 的形式，按数字解析；无法识别的文字直接报错
+    """
+    action = _DESCRIPTION_TO_ACTION.get(text)
+    if action is not None:
+        return action
+    m = _UNKNOWN_DESCRIPTION.fullmatch(text)
+    if m is None:
+        raise ProtocolError(f"无法识别的动作: {text!r}")
+    return int(m.group(1)), _TILE_IDS.get(m.group(2))
+
+
+def action_slot(action_type, tile_id):
+    """(动作类型, 牌ID) -> 动作空间中的位置"""
+    if action_type in DISCARD_TYPES and tile_id is not None:
+        return tile_id // 4
+    if 0 <= action_type < OTHER_SLOT - NUM_KINDS:
+        return NUM_KINDS + action_type
+    return OTHER_SLOT
+
+
+def featurize_turn(msg):
+    """
+    turn 消息 (json 或 binary 协议均可) -> (obs float32 [OBS_CHANNELS, 34], mask bool [NUM_ACTIONS], slots)
+    slots[i] 为第 i 个合法动作在动作空间中的位置，用于把模型的选择映射回动作编号。
+    """
+    obs = np.zeros((OBS_CHANNELS, NUM_KINDS), dtype=np.float32)
+    for tile in msg["hand"]:
+        kind = tile // 4 if isinstance(tile, int) else CODE_KINDS.get(tile, -1)
+        if kind >= 0:
+            obs[0, kind] += 0.25
+    mask = np.zeros(NUM_ACTIONS, dtype=bool)
+    slots = []
+    for act in msg["actions"]:
+        action_type, tile = parse_action(act) if isinstance(act, str) else act
+        slot = action_slot(action_type, tile)
+        slots.append(slot)
+        mask[slot] = True
+        if slot < NUM_KINDS:
+            obs[1, slot] = 1.0
+    return obs, mask, slots
+
+
+def choose_action(slots, slot):
+    """模型选择的位置 -> 动作编号 (第一个落在该位置的合法动作)"""
+    return slots.index(slot) if slot in slots else 0
+
+
+# ------------------------------------------------------------
+# 模型
+# ------------------------------------------------------------
+class StubModel:
+    """
+    NumPy 线性模型，用来测试推理服务 (接口与真实模型相同: predict(obs[B, ...], mask[B, A]) -> 选择[B])
+    """
+    def __init__(self, obs_shape=(OBS_CHANNELS, NUM_KINDS), num_actions=NUM_ACTIONS, seed=0):
+        rng = np.random.default_rng(seed)
+        self.obs_shape = tuple(obs_shape)
+        self.num_actions = num_actions
+        self.weight = rng.standard_normal((int(np.prod(obs_shape)), num_actions)).astype(np.float32) * 0.1
+        self.bias = np.zeros(num_actions, dtype=np.float32)
+
+    def predict(self, obs, mask):
+        logits = obs.reshape(len(obs), -1) @ self.weight + self.bias
+        logits[~mask] = -np.inf
+        return logits.argmax(axis=1)
+
+
+# ------------------------------------------------------------
+# 批处理服务
+# ------------------------------------------------------------
+class _Request:
+    __slots__ = ("obs", "mask", "future", "t")
+
+    def __init__(self, obs, mask):
+        self.obs = obs
+        self.mask = mask
+        self.future = concurrent.futures.Future()
+        self.t = time.perf_counter()
+
+
+class InferenceService:
+    """动态批处理: 一个后台线程从队列中取请求、组批、执行模型并回填结果"""
+    def __init__(self, model, max_batch=MAX_BATCH, max_wait=MAX_WAIT, window=LATENCY_WINDOW):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = collections.Counter()
+        self.queue_depths = collections.deque(maxlen=window)
+        self.latencies = collections.deque(maxlen=window)
+        # 预分配的批数组，每批复用
+        self._obs = np.empty((max_batch,) + model.obs_shape, dtype=np.float32)
+        self._mask = np.empty((max_batch, model.num_actions), dtype=bool)
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, obs, mask):
+        """提交一个观测，返回 concurrent.futures.Future (结果为模型选择的动作位置)"""
+        req = _Request(obs, mask)
+        self.queue.put(req)
+        return req.future
+
+    def predict(self, obs, mask):
+        return self.submit(obs, mask).result()
+
+    async def predict_async(self, obs, mask):
+        return await asyncio.wrap_future(self.submit(obs, mask))
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join(timeout=1)
+
+    def _loop(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            # 以最早的请求为准计算截止时间，保证单个请求的额外等待不超过 max_wait
+            deadline = first.t + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)    # 处理完这一批再退出
+                    break
+                batch.append(item)
+            self.queue_depths.append(self.queue.qsize())
+            self._run(batch)
+
+    def _run(self, batch):
+        n = len(batch)
+        for i, req in enumerate(batch):
+            self._obs[i] = req.obs
+            self._mask[i] = req.mask
+        try:
+            choices = self.model.predict(self._obs[:n], self._mask[:n]).tolist()
+        except Exception as e:
+            for req in batch:
+                req.future.set_exception(e)
+            return
+        now = time.perf_counter()
+        for req, choice in zip(batch, choices):
+            req.future.set_result(choice)
+            self.latencies.append(now - req.t)
+        self.requests += n
+        self.batches += 1
+        self.batch_sizes[n] += 1
+
+    def stats(self):
+        lat = sorted(self.latencies)
+        depths = self.queue_depths
+        pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 3) if lat else None
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch": round(self.requests / self.batches, 2) if self.batches else None,
+            "batch_size_hist": dict(sorted(self.batch_sizes.items())),
+            "queue_depth": {"last": depths[-1] if depths else 0, "max": max(depths) if depths else 0},
+            "latency_ms": {"p50": pct(0.5), "p99": pct(0.99)},
+        }
+
+
+# ------------------------------------------------------------
+# 网络接口: 定长二进制帧
+#   请求: 请求号 (u32) + obs (float32 * obs 元素数) + mask (u8 * 动作数)
+#   回复: 请求号 (u32) + 选择的动作位置 (u16)
+# 同一连接上可以连续发送多个请求，回复按完成顺序返回。
+# ------------------------------------------------------------
+_REQ_HEAD = struct.Struct("<I")
+_REPLY = struct.Struct("<IH")
+
+
+def _request_size(model):
+    return _REQ_HEAD.size + int(np.prod(model.obs_shape)) * 4 + model.num_actions
+
+
+async def _handle_conn(service, reader, writer):
+    obs_bytes = int(np.prod(service.model.obs_shape)) * 4
+    size = _request_size(service.model)
+
+    async def answer(req_id, obs, mask):
+        choice = await service.predict_async(obs, mask)
+        writer.write(_REPLY.pack(req_id, choice))
+
+    pending = set()
+    try:
+        while True:
+            frame = await reader.readexactly(size)
+            req_id = _REQ_HEAD.unpack_from(frame)[0]
+            obs = np.frombuffer(frame, np.float32, obs_bytes // 4, _REQ_HEAD.size).reshape(service.model.obs_shape)
+            mask = np.frombuffer(frame, np.bool_, service.model.num_actions, _REQ_HEAD.size + obs_bytes)
+            # 不等待结果就继续读下一个请求，同一连接的多个请求也能进入同一批
+            task = asyncio.ensure_future(answer(req_id, obs, mask))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        writer.close()
+
+
+async def serve(service, host=HOST, port=PORT, stats_every=10.0):
+    server = await asyncio.start_server(lambda r, w: _handle_conn(service, r, w), host, port)
+    print(f"🧠 推理服务启动 {host}:{port} (max_batch={service.max_batch}, max_wait={service.max_wait * 1000:.1f}ms)")
+    async with server:
+        while True:
+            await asyncio.sleep(stats_every)
+            print(f"[统计] {service.stats()}")
+
+
+class InferenceClient:
+    """推理服务的阻塞客户端 (client.py 自动模式使用)"""
+    def __init__(self, addr, obs_shape=(OBS_CHANNELS, NUM_KINDS), num_actions=NUM_ACTIONS):
+        import socket
+        host, _, port = addr.rpartition(":")
+        self.sock = socket.create_connection((host or HOST, int(port)))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.obs_shape = tuple(obs_shape)
+        self.num_actions = num_actions
+        self.next_id = 0
+
+    def predict(self, obs, mask):
+        self.next_id += 1
+        frame = (_REQ_HEAD.pack(self.next_id) + np.ascontiguousarray(obs, np.float32).tobytes()
+                 + np.ascontiguousarray(mask, np.bool_).tobytes())
+        self.sock.sendall(frame)
+        data = b""
+        while len(data) < _REPLY.size:
+            chunk = self.sock.recv(_REPLY.size - len(data))
+            if not chunk:
+                raise ConnectionError("推理服务断开连接")
+            data += chunk
+        req_id, choice = _REPLY.unpack(data)
+        if req_id != self.next_id:
+            raise ProtocolError(f"推理服务回复的请求编号 {req_id} 与请求 {self.next_id} 不一致")
+        return choice
+
+    def close(self):
+        self.sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量推理服务 (NumPy 测试模型)")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000)
+    args = parser.parse_args()
+
+    service = InferenceService(StubModel(), args.max_batch, args.max_wait_ms / 1000)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        print(f"[统计] {service.stats()}")
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import bisect
+
+# 📊 回合耗时打点与指标导出
+#
+# 在服务器的对局循环里给每个阶段包一个计时 span，结果累计到直方图中，用来找出一回合的时间花在哪里:
+#   actions   合法动作 -> 描述文字 / [动作类型, 牌ID]
+#   hand      取手牌并排序
+#   send      发送 turn 消息 (sendall / writer.drain)
+#   recv      读取并解码回复 (只计 socket 读取与解码，不含等待)
+#   wait      从发出 turn 到收到回复 (包含玩家思考时间)
+#   record    recorder.record_turn (观测序列化 + 写出)
+#   step      env.step
+#   turn      一整回合
+#
+# 直方图按 (阶段, 桌号, 座位) 分开统计；与座位无关的阶段 (step / turn) 座位为 None。
+# 同时按 (阶段, 座位) 累计所有桌的总计，一桌结束后调用 finish_table 取出该桌的结果并释放。
+#
+# 用法:
+#   metrics = LatencyMetrics(export_path="metrics.json", export_every=10)
+#   with metrics.span("step", table=0):
+#       env.step(...)
+#   span = metrics.timer(table=0, seat=2)       # 绑定桌号/座位，span("send") 即可
+#   metrics.maybe_export()                      # 距上次导出超过 export_every 秒时写出快照
+#   metrics.export("metrics.prom")              # 扩展名为 .prom 时输出 Prometheus 文本格式
+
+# ⚙️ 配置
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))  # 直方图桶上界 (秒): 1us, 2us, ... 约 16.8s
+EXPORT_EVERY = 10.0         # 定期导出间隔 (秒)
+METRIC_NAME = "ron_turn_stage_seconds"                 # 进行中各桌 (标签带 table)
+TOTAL_METRIC_NAME = "ron_turn_stage_cumulative_seconds"  # 进程启动以来所有桌的总计 (含已结束的桌，不带 table 标签)
+STAGES = ("actions", "hand", "send", "recv", "wait", "record", "step", "turn")
+
+
+class Histogram:
+    """固定对数桶的直方图 (桶 i 统计 <= BUCKETS[i] 的值，最后一个桶为 +Inf)"""
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """按桶估计分位数 (返回所在桶的上界，不超过最大值)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target and c:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self):
+        ms = lambda s: round(s * 1000, 4) if s is not None else None
+        return {
+            "count": self.count,
+            "sum_ms": ms(self.sum),
+            "mean_ms": ms(self.sum / self.count) if self.count else None,
+            "p50_ms": ms(self.quantile(0.5)),
+            "p99_ms": ms(self.quantile(0.99)),
+            "max_ms": ms(self.max),
+        }
+
+
+class _Span:
+    """with 语句计时，退出时记录到直方图"""
+    __slots__ = ("metrics", "key", "start")
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def NO_TIMER(stage):
+    """不计时的 timer (build_turn_payload 等未传入 timer 时使用)"""
+    return NULL_SPAN
+
+
+class LatencyMetrics:
+    """
+    各阶段耗时直方图
+
+    Args:
+        export_path: maybe_export 定期写出的文件 (.json 或 .prom)，None 表示不定期导出
+        export_every: 定期导出间隔 (秒)
+        enabled: False 时所有打点都不做任何事
+    """
+    def __init__(self, export_path=None, export_every=EXPORT_EVERY, enabled=True):
+        self.export_path = export_path
+        self.export_every = export_every
+        self.enabled = enabled
+        self.tables = {}        # 桌号 -> {(阶段, 座位): Histogram}
+        self.totals = {}        # (阶段, 座位) -> Histogram，所有桌累计
+        self.tables_finished = 0
+        self._last_export = time.perf_counter()
+
+    # --- 打点 ---
+    def observe(self, stage, seconds, table=0, seat=None):
+        if self.enabled:
+            self._observe((stage, table, seat), seconds)
+
+    def _observe(self, key, seconds):
+        stage, table, seat = key
+        series = self.tables.get(table)
+        if series is None:
+            series = self.tables[table] = {}
+        hist = series.get((stage, seat))
+        if hist is None:
+            hist = series[(stage, seat)] = Histogram()
+        hist.observe(seconds)
+        hist = self.totals.get((stage, seat))
+        if hist is None:
+            hist = self.totals[(stage, seat)] = Histogram()
+        hist.observe(seconds)
+
+    def span(self, stage, table=0, seat=None):
+        return _Span(self, (stage, table, seat)) if self.enabled else NULL_SPAN
+
+    def timer(self, table=0, seat=None):
+        """绑定桌号与座位，返回 stage -> span 的函数"""
+        if not self.enabled:
+            return NO_TIMER
+        return lambda stage: _Span(self, (stage, table, seat))
+
+    # --- 汇总 ---
+    def finish_table(self, table):
+        """一桌结束: 返回该桌的快照并释放其直方图 (总计中保留)"""
+        series = self.tables.pop(table, {})
+        self.tables_finished += 1
+        return {"table": table, **_summarize(series)}
+
+    def snapshot(self):
+        """JSON 快照: 所有桌的总计 (按阶段 / 按座位) + 进行中各桌的按阶段统计"""
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "tables_finished": self.tables_finished,
+            **_summarize(self.totals),
+            "tables": {str(table): _summarize(series)["stages"] for table, series in self.tables.items()},
+        }
+
+    def to_prometheus(self):
+        """
+        Prometheus 文本格式: 总计与进行中各桌的直方图
+        总计用单独的指标名导出，对 METRIC_NAME 按桌求和时不会把总计重复算进去
+        """
+        lines = [
+            f"# HELP {TOTAL_METRIC_NAME} Time spent in each stage of a game turn, all tables since start.",
+            f"# TYPE {TOTAL_METRIC_NAME} histogram",
+        ]
+        for (stage, seat), hist in sorted(self.totals.items(), key=_series_order):
+            _prometheus_lines(lines, TOTAL_METRIC_NAME, hist, _labels(stage, seat))
+        lines += [
+            f"# HELP {METRIC_NAME} Time spent in each stage of a game turn, per running table.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for table, series in sorted(self.tables.items()):
+            for (stage, seat), hist in sorted(series.items(), key=_series_order):
+                _prometheus_lines(lines, METRIC_NAME, hist, _labels(stage, seat, table))
+        return "\n".join(lines) + "\n"
+
+    # --- 导出 ---
+    def export(self, path=None):
+        """写出快照 (先写临时文件再替换，读取方不会读到一半的文件)"""
+        path = path or self.export_path
+        if path.endswith(".prom"):
+            text = self.to_prometheus()
+        else:
+            text = json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+        self._last_export = time.perf_counter()
+        return path
+
+    def maybe_export(self):
+        if self.export_path and time.perf_counter() - self._last_export >= self.export_every:
+            self.export()
+
+    def print_summary(self, title="各阶段耗时"):
+        stages = _summarize(self.totals)["stages"]
+        if not stages:
+            return
+        print(f"{title} (ms):")
+        # 中文表头每个字占两格宽
+        print(f"  {'阶段':<8}{'次数':>6}{'平均':>8}{'p50':>10}{'p99':>10}{'最长':>8}{'合计':>10}")
+        for stage, s in stages.items():
+            print(f"  {stage:<10}{s['count']:>8}{s['mean_ms']:>10.3f}{s['p50_ms']:>10.3f}"
+                  f"{s['p99_ms']:>10.3f}{s['max_ms']:>10.3f}{s['sum_ms']:>12.1f}")
+
+
+def _series_order(item):
+    (stage, seat), _ = item
+    return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage, -1 if seat is None else seat)
+
+
+def _summarize(series):
+    """{(阶段, 座位): Histogram} -> {"stages": 按阶段合并, "seats": 按座位分开}"""
+    stages, seats = {}, {}
+    for (stage, seat), hist in sorted(series.items(), key=_series_order):
+        merged = stages.get(stage)
+        if merged is None:
+            merged = stages[stage] = Histogram()
+        merged.merge(hist)
+        if seat is not None:
+            seats.setdefault(str(seat), {})[stage] = hist.to_dict()
+    return {"stages": {stage: hist.to_dict() for stage, hist in stages.items()}, "seats": seats}
+
+
+def _labels(stage, seat, table=None):
+    labels = f'stage="{stage}"'
+    if table is not None:
+        labels += f',table="{table}"'
+    return labels + (f',seat="{seat}"' if seat is not None else "")
+
+
+def _prometheus_lines(lines, name, hist, labels):
+    cumulative = 0
+    for bound, count in zip(BUCKETS, hist.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+    lines.append(f"{name}_sum{{{labels}}} {hist.sum:.9f}")
+    lines.append(f"{name}_count{{{labels}}} {hist.count}")
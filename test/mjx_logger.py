@@ -1,15 +1,87 @@
+import os
+import sys
 import json
 
+# 牌编码表与 data/ 下的转换脚本共用
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from tile_codec import ID_CODES_RED
+
+# 流式记录的配置
+FLUSH_EVERY = 32            # 每累计多少条记录写一次文件
+KEYFRAME_EVERY = 64         # 每个座位每隔多少条记录保存一次完整观测 (其余为增量)
+
+
+# ------------------------------------------------------------
+# 观测增量编码
+# ------------------------------------------------------------
+# 同一座位相邻两次的观测 (obs.to_json() 的结果) 绝大部分相同，事件列表只是在末尾追加。
+# 增量 (patch) 是一个字典，只包含非空的部分:
+#   "s": {键: 新值}        新增或被替换的字段
+#   "d": [键, ...]         被删除的字段
+#   "p": {键: 子增量}      两边都是字典的字段，递归编码
+#   "a": {键: [元素, ...]} 两边都是列表且旧列表是新列表前缀的字段，只记录追加的元素
+def diff_state(old, new):
+    patch = {}
+    for key, value in new.items():
+        if key not in old:
+            patch.setdefault("s", {})[key] = value
+            continue
+        prev = old[key]
+        if prev == value:
+            continue
+        if isinstance(prev, dict) and isinstance(value, dict):
+            patch.setdefault("p", {})[key] = diff_state(prev, value)
+        elif isinstance(prev, list) and isinstance(value, list) and len(prev) < len(value) \
+                and value[:len(prev)] == prev:
+            patch.setdefault("a", {})[key] = value[len(prev):]
+        else:
+            patch.setdefault("s", {})[key] = value
+    removed = [key for key in old if key not in new]
+    if removed:
+        patch["d"] = removed
+    return patch
+
+
+def apply_patch(old, patch):
+    """返回应用增量后的新字典 (写时复制，不修改 old，未变化的子结构与 old 共享)"""
+    new = dict(old)
+    for key in patch.get("d", ()):
+        new.pop(key, None)
+    for key, sub in patch.get("p", {}).items():
+        new[key] = apply_patch(old[key], sub)
+    for key, items in patch.get("a", {}).items():
+        new[key] = old[key] + items
+    new.update(patch.get("s", {}))
+    return new
+
+
 class MjxGameRecorder:
     """
     负责收集 mjx 的原始数据，不进行任何格式转换。
+
+    指定 path 时为流式模式: 每回合的记录追加写入 JSONL 文件 (每 flush_every 条写一次)，
+    观测按座位做增量编码，内存中只保留每个座位的上一次观测；程序崩溃时最多丢失最后一批记录。
+    用 MjxRecordReader 读回完整的观测。
+    不指定 path 时与以前一样把完整记录保存在 self.history 中，最后用 save_mjx 一次写出。
+
+    sink: 可选的回调，每条完整记录产生时立即调用 (例如 MjaiWriter.feed，对局中实时写出 MJAI 日志)；
+    指定了 sink 且没有 path 时不再保留 self.history。
     """
-    def __init__(self):
+    def __init__(self, path=None, flush_every=FLUSH_EVERY, keyframe_every=KEYFRAME_EVERY, sink=None):
         self.history = []
+        self.path = path
+        self.sink = sink
+        self.flush_every = flush_every
+        self.keyframe_every = keyframe_every
+        self.count = 0
+        self._pending = []
+        self._last_state = {}       # 座位 -> 上一次的完整观测
+        self._since_key = {}        # 座位 -> 距上一个完整观测的记录数
+        self._file = open(path, "w", encoding="utf-8") if path else None
 
-    def record_turn(self, player_id, obs, legal_actions, chosen_action):
+    def record_turn(self, player_id, obs, legal_actions, chosen_action, think_ms=None):
         """
-        记录一个回合的原始信息
+        记录一个回合的原始信息 (think_ms: 玩家的思考时间，供分析用)
         """
         # 1. 获取刚摸到的牌 (用于后续恢复 tsumo 事件)
         draw_tile_id = None
@@ -51,7 +123,43 @@ class MjxGameRecorder:
             "chosen_action": chosen_data,
             "state": state_json
         }
-        self.history.append(record_entry)
+        if think_ms is not None:
+            record_entry["think_ms"] = think_ms
+        self.count += 1
+        if self.sink:
+            self.sink(record_entry)
+        if self._file is None:
+            if self.sink is None:
+                self.history.append(record_entry)
+            return
+
+        # 流式模式: 与该座位上一次的观测做增量
+        prev = self._last_state.get(player_id)
+        since = self._since_key.get(player_id, 0)
+        if prev is not None and since < self.keyframe_every:
+            del record_entry["state"]
+            record_entry["state_delta"] = diff_state(prev, state_json)
+            self._since_key[player_id] = since + 1
+        else:
+            self._since_key[player_id] = 1
+        self._last_state[player_id] = state_json
+        self._pending.append(json.dumps(record_entry, separators=(',', ':')))
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._file and self._pending:
+            self._file.write("\n".join(self._pending) + "\n")
+            self._file.flush()
+            self._pending = []
+
+    def close(self):
+        """流式模式下写出剩余记录并关闭文件"""
+        if self._file:
+            self.flush()
+            self._file.close()
+            self._file = None
+            print(f"[Recorder] Mjx 流式记录已保存: {self.path} ({self.count} 条)")
 
     def _obj_to_id(self, obj):
         if obj is None: return None
@@ -61,77 +169,164 @@ class MjxGameRecorder:
         except: return None
 
     def save_mjx(self, filename="mjx_record.json"):
-        """保存 mjx 原生记录"""
+        """保存 mjx 原生记录 (流式模式下只需 close，数据已经在 path 中)"""
+        if self.path:
+            self.close()
+            return
         with open(filename, "w", encoding="utf-8") as f:
             json.dump(self.history, f, separators=(',', ':'))
         print(f"[Recorder] Mjx 原生记录已保存: {filename}")
 
 
+class MjxRecordReader:
+    """
+    读取 MjxGameRecorder 的流式记录 (JSONL)，按需还原完整观测
+
+    用法:
+        reader = MjxRecordReader("mjx_record.jsonl")
+        for record in reader:          # 顺序读取，每条记录的 "state" 为完整观测
+            ...
+        record = reader[120]           # 随机访问: 从该座位最近的完整观测开始还原
+    """
+    def __init__(self, path):
+        self.path = path
+        self.offsets = []           # 每条记录在文件中的偏移
+        self.seats = []             # 每条记录的座位
+        self.keyframes = []         # 每条记录是否为完整观测
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break           # 崩溃时写了一半的最后一行
+                self.offsets.append(offset)
+                offset += len(line)
+                head = json.loads(line)
+                self.seats.append(head.get("player_id"))
+                self.keyframes.append("state" in head)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        last_state = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for _ in range(len(self.offsets)):
+                yield self._expand(json.loads(f.readline()), last_state)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        seat = self.seats[i]
+        # 找到该座位不晚于 i 的最近一个完整观测
+        start = i
+        while not (self.seats[start] == seat and self.keyframes[start]):
+            start -= 1
+        last_state = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            f.seek(self.offsets[start])
+            for j in range(start, i + 1):
+                line = f.readline()
+                if self.seats[j] == seat:
+                    record = self._expand(json.loads(line), last_state)
+        return record
+
+    @staticmethod
+    def _expand(record, last_state):
+        seat = record.get("player_id")
+        if "state_delta" in record:
+            record["state"] = apply_patch(last_state[seat], record.pop("state_delta"))
+        last_state[seat] = record["state"]
+        return record
+
+
+def iter_mjx_records(path):
+    """逐条读取 mjx 记录: .jsonl 为流式记录 (还原完整观测)，否则为 save_mjx 写出的 JSON 数组"""
+    if path.endswith(".jsonl"):
+        return iter(MjxRecordReader(path))
+    with open(path, "r", encoding="utf-8") as f:
+        return iter(json.load(f))
+
+
+def load_mjx_records(path):
+    return list(iter_mjx_records(path))
+
+
 class MjxToMjaiConverter:
     """
     负责将 mjx 原生记录转换为 MJAI 格式
     """
     def __init__(self):
         self.events = []
-        # 初始化牌 ID 缓存 (0-135 -> 1m, 2m...)
-        self.tile_cache = {i: self._id_to_mjai(i) for i in range(136)}
+        # 牌 ID 缓存 (0-135 -> 1m, 2m...)，mjx 与天凤的牌 ID 编码相同，
+        # 赤五按 MJAI 规范输出为 5mr/5pr/5sr
+        self.tile_cache = dict(enumerate(ID_CODES_RED))
         self.current_round = -1
 
     def _id_to_mjai(self, tile_id):
         if tile_id is None: return "??"
-        type_idx = tile_id // 36
-        num_idx = (tile_id % 36) // 4
-        suffixes = ['m', 'p', 's', 'z']
-        if type_idx > 3: return "5z" 
-        return f"{num_idx + 1}{suffixes[type_idx]}"
+        return self.tile_cache.get(tile_id, "??")
 
-    def convert(self, mjx_record_path, output_path):
-        print(f"[Converter] 正在转换 {mjx_record_path} -> {output_path} ...")
+    def reset(self):
+        """开始转换新的一局"""
         self.events = []
         self.current_round = -1
+
+    def feed(self, step):
+        """
+        转换一条记录，返回由它产生的 MJAI 事件列表 (可能为空)。
+        转换是有状态的 (需要判断是否切局)，同一局的记录必须按顺序传入，换局前调用 reset()。
+        """
+        self.events = []
+        state = step.get("state", {})
+        player_id = step.get("player_id")
+        draw_tile_id = step.get("draw_tile")
+        legal_actions = step.get("legal_actions", [])
+        chosen_action = step.get("chosen_action", {})
+
+        # 1. 检查是否切局 (New Round)，第一条记录总会产生 start_kyoku
+        self._check_new_round(state)
+
+        # 2. 摸牌检测 logic (Tsumo)
+        # 如果可以切牌(1,2)或暗杠(6)或自摸(10)或立直(3)，说明刚摸了牌
+        can_act_on_draw = False
+        for act in legal_actions:
+            atype = act.get("type")
+            if atype in [1, 2, 3, 6, 10]:
+                can_act_on_draw = True
+                break
         
-        with open(mjx_record_path, "r", encoding="utf-8") as f:
-            history = json.load(f)
+        if can_act_on_draw and draw_tile_id is not None:
+            self.events.append({
+                "type": "tsumo",
+                "actor": player_id,
+                "pai": self.tile_cache.get(draw_tile_id, "?")
+            })
+
+        # 3. 记录动作 (Action)
+        self._log_action(chosen_action)
+        return self.events
+
+    def iter_events(self, records):
+        """把一局的记录 (任意可迭代对象，例如 recorder.history 或 MjxRecordReader) 逐个转换为 MJAI 事件"""
+        self.reset()
+        for step in records:
+            yield from self.feed(step)
+
+    def convert_records(self, records, output_path):
+        """直接从内存中的记录转换并写出，不经过中间文件"""
+        with MjaiWriter(output_path, converter=self) as writer:
+            self.reset()
+            for step in records:
+                writer.feed(step)
+        return writer.count
 
-        if not history:
+    def convert(self, mjx_record_path, output_path):
+        """从 save_mjx / 流式记录文件转换 (逐条读取、逐条写出)"""
+        print(f"[Converter] 正在转换 {mjx_record_path} -> {output_path} ...")
+        count = self.convert_records(iter_mjx_records(mjx_record_path), output_path)
+        if not count:
             print("[Converter] 记录为空")
             return
-
-        # 处理第一局的开始
-        first_state = history[0].get("state", {})
-        self._record_new_round(first_state)
-
-        for step in history:
-            state = step.get("state", {})
-            player_id = step.get("player_id")
-            draw_tile_id = step.get("draw_tile")
-            legal_actions = step.get("legal_actions", [])
-            chosen_action = step.get("chosen_action", {})
-
-            # 1. 检查是否切局 (New Round)
-            self._check_new_round(state)
-
-            # 2. 摸牌检测 logic (Tsumo)
-            # 如果可以切牌(1,2)或暗杠(6)或自摸(10)或立直(3)，说明刚摸了牌
-            can_act_on_draw = False
-            for act in legal_actions:
-                atype = act.get("type")
-                if atype in [1, 2, 3, 6, 10]:
-                    can_act_on_draw = True
-                    break
-            
-            if can_act_on_draw and draw_tile_id is not None:
-                self.events.append({
-                    "type": "tsumo",
-                    "actor": player_id,
-                    "pai": self.tile_cache.get(draw_tile_id, "?")
-                })
-
-            # 3. 记录动作 (Action)
-            self._log_action(chosen_action)
-
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(self.events, f, separators=(',', ':'))
         print(f"[Converter] MJAI 转换完成: {output_path}")
 
     def _check_new_round(self, state_meta):
@@ -205,4 +400,103 @@ class MjxToMjaiConverter:
             mjai_event = {"type": "ryukyoku"}
 
         if mjai_event["type"] != "none":
-            self.events.append(mjai_event)
\ No newline at end of file
+            self.events.append(mjai_event)
+
+
+class MjaiWriter:
+    """
+    增量写出 MJAI 事件: 路径以 .jsonl 结尾时每行一个事件，否则写成 JSON 数组 (close 时补上结尾的 "]")。
+    每 flush_every 个事件写一次文件，对局进行中其他程序也能读到已经发生的部分。
+
+    用法 (对局中实时转换，不经过中间文件):
+        writer = MjaiWriter("game_log.json")
+        recorder = MjxGameRecorder(sink=writer.feed)
+        ...
+        writer.close()
+    """
+    def __init__(self, path, converter=None, flush_every=FLUSH_EVERY):
+        self.path = path
+        self.converter = converter or MjxToMjaiConverter()
+        self.flush_every = flush_every
+        self.lines = path.endswith(".jsonl")
+        self.count = 0
+        self._pending = []
+        self._file = open(path, "w", encoding="utf-8")
+        if not self.lines:
+            self._file.write("[")
+
+    def feed(self, record):
+        """转换一条 mjx 记录并写出产生的事件"""
+        for event in self.converter.feed(record):
+            self.write(event)
+
+    def write(self, event):
+        self._pending.append(json.dumps(event, separators=(',', ':')))
+        self.count += 1
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        if self.lines:
+            self._file.write("\n".join(self._pending) + "\n")
+        else:
+            prefix = "," if self.count > len(self._pending) else ""
+            self._file.write(prefix + ",".join(self._pending))
+        self._file.flush()
+        self._pending = []
+
+    def close(self):
+        if self._file:
+            self.flush()
+            if not self.lines:
+                self._file.write("]")
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _convert_job(job):
+    src, dst = job
+    try:
+        return src, MjxToMjaiConverter().convert_records(iter_mjx_records(src), dst), None
+    except Exception as e:
+        return src, 0, f"{type(e).__name__}: {e}"
+
+
+def convert_many(jobs, num_workers=None):
+    """
+    并行转换多局记录
+
+    Args:
+        jobs: [(mjx 记录路径, MJAI 输出路径), ...]
+    Returns:
+        [(记录路径, 事件数, 错误信息或 None), ...]
+    """
+    import multiprocessing
+    with multiprocessing.Pool(num_workers) as pool:
+        return list(pool.imap_unordered(_convert_job, jobs, chunksize=8))
+
+
+if __name__ == "__main__":
+    # 使用方法: python mjx_logger.py <记录目录> [输出目录]
+    # 把目录下所有 *.mjx.jsonl / *.mjx.json 并行转换为同名的 MJAI .json
+    import glob
+    src_dir = sys.argv[1] if len(sys.argv) > 1 else "."
+    dst_dir = sys.argv[2] if len(sys.argv) > 2 else src_dir
+    os.makedirs(dst_dir, exist_ok=True)
+    jobs = []
+    for path in sorted(glob.glob(os.path.join(src_dir, "*.mjx.json*"))):
+        name = os.path.basename(path).split(".mjx.")[0]
+        jobs.append((path, os.path.join(dst_dir, name + ".json")))
+    results = convert_many(jobs)
+    failed = [r for r in results if r[2]]
+    for src, _, error in failed:
+        print(f"[错误] {src}: {error}")
+    print(f"转换完成: {len(results) - len(failed)}/{len(results)} 局，共 {sum(r[1] for r in results)} 个事件")
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import struct
+import asyncio
+import bisect
+
+# 牌编码表与 data/ 下的转换脚本共用
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from tile_codec import ID_CODES_RED
+
+# 📡 服务器 / 客户端通信协议
+#
+# 两种帧格式，由服务器在 hello 消息中声明 ("protocol" 字段)，之后双方都按该格式收发:
+#
+#   json:   每条消息是一行紧凑 JSON，以 \n 结尾 (与最初的协议兼容，便于调试)
+#   binary: 4 字节小端长度 + 载荷；载荷第一个字节是消息类型，其余为定长整数字段:
+#             TURN        序号 (u32) + 手牌数 n (u8) + n 个牌ID (u8) + 动作数 k (u8) + k 组 (动作类型 u8, 牌ID u8)
+#             TURN_DELTA  序号 (u32) + 新增数 a (u8) + a 个牌ID + 移除数 r (u8) + r 个牌ID + 动作 (同 TURN)
+#             ACTION      序号 (u32) + 动作编号 (u16)
+#             GAME_START  座位 (u8) + 桌号 (u32)
+#             GAME_OVER   标志位 (u8): bit0 = next, bit1 = aborted
+#           牌ID 为 0-135 (与天凤/mjx 相同)，NO_TILE (255) 表示没有牌；
+#           不在上表中的消息 (例如 hello) 以 JSON 载荷发送，类型字节为 MSG_JSON。
+#
+# binary 模式下 turn 消息的 hand / actions 是整数 (牌ID、[动作类型, 牌ID])，
+# 需要显示时用 describe_action / hand_codes 转换成文字。
+#
+# turn 消息带有序号 seq，客户端在回复中原样带回；服务器据此丢弃超时之后才到达的旧回复。
+#
+# hello 消息总是以 json 格式发送，客户端读到之后再切换到声明的格式。
+#
+# hello 中 "delta": true 时，turn 消息只带手牌相对该座位上一条 turn 消息的变化:
+#   {"type": "turn", "seq": ..., "add": [牌ID...], "remove": [牌ID...], "actions": [...]}
+# 每局第一条 (或变化比整手牌还多时) 仍带完整的 "hand" (排好序的牌ID)。副露的牌从手牌中移除，也体现在 remove 中。
+# 客户端用 HandMirror 维护手牌镜像。
+
+JSON = "json"
+BINARY = "binary"
+PROTOCOLS = (JSON, BINARY)
+
+MSG_JSON = 0
+MSG_TURN = 1
+MSG_ACTION = 2
+MSG_GAME_START = 3
+MSG_GAME_OVER = 4
+MSG_TURN_DELTA = 5
+
+NO_TILE = 255
+MAX_FRAME = 1 << 20          # 单帧最大长度，超过视为协议错误
+RECV_SIZE = 65536
+
+_LEN = struct.Struct("<I")
+_U8 = struct.Struct("<B")
+_TURN_HEAD = struct.Struct("<BIB")
+_ACTION = struct.Struct("<BIH")
+_GAME_START = struct.Struct("<BBI")
+_GAME_OVER = struct.Struct("<BB")
+
+ACTION_TYPE_MAP = {
+    1: "切牌(手切)", 2: "切牌(摸切)", 3: "立直",
+    4: "吃", 5: "碰", 6: "暗杠", 7: "明杠", 8: "加杠",
+    9: "荣", 10: "自摸", 11: "流局"
+}
+TILE_NAMES = dict(enumerate(ID_CODES_RED))
+
+# 预先生成的动作文字表: ACTION_TEXT[动作类型][牌ID]，没有牌时用下标 NO_TILE_INDEX
+NO_TILE_INDEX = 136
+ACTION_TEXT = {
+    action_type: tuple(f"[{type_str}] {TILE_NAMES.get(tile, '')}" for tile in range(NO_TILE_INDEX + 1))
+    for action_type, type_str in ACTION_TYPE_MAP.items()
+}
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def describe_action(action_type, tile_id):
+    """(动作类型, 牌ID) -> "[切牌(手切)] 5m" 形式的文字 (查表)"""
+    texts = ACTION_TEXT.get(action_type)
+    if texts is None:
+        return f"[{action_type}] {TILE_NAMES.get(tile_id, '')}"
+    return texts[NO_TILE_INDEX if tile_id is None or not 0 <= tile_id < NO_TILE_INDEX else tile_id]
+
+
+def hand_codes(tile_ids):
+    return [TILE_NAMES[t] for t in tile_ids]
+
+
+class HandMirror:
+    """客户端的手牌镜像: 收到完整 hand 时替换，收到 add / remove 时增量更新，始终保持有序"""
+    def __init__(self):
+        self.tiles = []
+
+    def reset(self):
+        self.tiles = []
+
+    def update(self, msg):
+        """用一条 turn 消息更新手牌，返回当前手牌"""
+        if "hand" in msg:
+            self.tiles = list(msg["hand"])
+            return self.tiles
+        tiles = self.tiles
+        for tile in msg.get("remove", ()):
+            try:
+                tiles.remove(tile)
+            except ValueError:
+                raise ProtocolError(f"手牌中没有要移除的牌: {tile}")
+        for tile in msg.get("add", ()):
+            bisect.insort(tiles, tile)
+        return tiles
+
+
+# ------------------------------------------------------------
+# 编码
+# ------------------------------------------------------------
+def _is_compact_turn(msg):
+    """整数形式的 turn 消息 (compact=True) 才能用定长编码"""
+    tiles = msg["hand"] if "hand" in msg else list(msg.get("add", ())) + list(msg.get("remove", ()))
+    return (all(isinstance(t, int) for t in tiles)
+            and all(not isinstance(a, str) and len(a) == 2 for a in msg["actions"]))
+
+
+def _encode_payload(msg):
+    mtype = msg.get("type")
+    if mtype == "turn" and _is_compact_turn(msg):
+        actions = msg["actions"]
+        if "hand" in msg:
+            hand = msg["hand"]
+            buf = bytearray(_TURN_HEAD.pack(MSG_TURN, msg.get("seq", 0), len(hand)))
+            buf += bytes(hand)
+        else:
+            add, remove = msg.get("add", ()), msg.get("remove", ())
+            buf = bytearray(_TURN_HEAD.pack(MSG_TURN_DELTA, msg.get("seq", 0), len(add)))
+            buf += bytes(add)
+            buf.append(len(remove))
+            buf += bytes(remove)
+        buf.append(len(actions))
+        for action_type, tile in actions:
+            buf += bytes((action_type, NO_TILE if tile is None else tile))
+        return bytes(buf)
+    if mtype == "action" or (mtype is None and "act_idx" in msg):
+        return _ACTION.pack(MSG_ACTION, msg.get("seq", 0), msg["act_idx"])
+    if mtype == "game_start":
+        return _GAME_START.pack(MSG_GAME_START, msg["player_id"], msg["table"])
+    if mtype == "game_over" and set(msg) <= {"type", "next", "aborted"}:
+        return _GAME_OVER.pack(MSG_GAME_OVER, bool(msg.get("next")) | bool(msg.get("aborted")) << 1)
+    return _U8.pack(MSG_JSON) + json.dumps(msg, separators=(',', ':')).encode()
+
+
+def encode(msg, mode=JSON):
+    """把一条消息编码为一帧 (bytes)"""
+    if mode == JSON:
+        return json.dumps(msg, separators=(',', ':')).encode() + b'\n'
+    payload = _encode_payload(msg)
+    return _LEN.pack(len(payload)) + payload
+
+
+# ------------------------------------------------------------
+# 解码
+# ------------------------------------------------------------
+def decode_payload(payload):
+    """解码 binary 模式的一帧载荷"""
+    try:
+        return _decode_payload(payload)
+    except (IndexError, struct.error) as e:
+        raise ProtocolError(f"帧内容不完整: {e}")
+
+
+def _decode_actions(payload, pos):
+    k = payload[pos]
+    raw = payload[pos + 1:pos + 1 + 2 * k]
+    if len(raw) < 2 * k:
+        raise IndexError("动作列表不完整")
+    return [[raw[i], None if raw[i + 1] == NO_TILE else raw[i + 1]] for i in range(0, 2 * k, 2)]
+
+
+def _decode_payload(payload):
+    mtype = payload[0]
+    if mtype == MSG_TURN:
+        _, seq, n = _TURN_HEAD.unpack_from(payload)
+        pos = _TURN_HEAD.size
+        hand = list(payload[pos:pos + n])
+        return {"type": "turn", "seq": seq, "hand": hand, "actions": _decode_actions(payload, pos + n)}
+    if mtype == MSG_TURN_DELTA:
+        _, seq, a = _TURN_HEAD.unpack_from(payload)
+        pos = _TURN_HEAD.size
+        add = list(payload[pos:pos + a])
+        r = payload[pos + a]
+        remove = list(payload[pos + a + 1:pos + a + 1 + r])
+        actions = _decode_actions(payload, pos + a + 1 + r)
+        return {"type": "turn", "seq": seq, "add": add, "remove": remove, "actions": actions}
+    if mtype == MSG_ACTION:
+        _, seq, act_idx = _ACTION.unpack(payload)
+        return {"type": "action", "seq": seq, "act_idx": act_idx}
+    if mtype == MSG_GAME_START:
+        _, seat, table = _GAME_START.unpack(payload)
+        return {"type": "game_start", "player_id": seat, "table": table}
+    if mtype == MSG_GAME_OVER:
+        flags = _GAME_OVER.unpack(payload)[1]
+        return {"type": "game_over", "next": bool(flags & 1), "aborted": bool(flags & 2)}
+    if mtype == MSG_JSON:
+        return json.loads(payload[1:])
+    raise ProtocolError(f"未知的消息类型: {mtype}")
+
+
+class FrameDecoder:
+    """
+    增量解码器: feed() 喂入任意切分的字节流，next() 每次取出一条完整消息 (不完整时返回 None)。
+    每次只解析一帧，因此可以在两条消息之间切换 mode (例如读到 hello 之后)。
+    """
+    def __init__(self, mode=JSON):
+        self.mode = mode
+        self.buf = bytearray()
+        self.pos = 0
+
+    def feed(self, data):
+        if self.pos:
+            # 丢掉已经解析过的部分，避免缓冲区无限增长
+            del self.buf[:self.pos]
+            self.pos = 0
+        self.buf += data
+
+    def next(self):
+        buf, pos = self.buf, self.pos
+        if self.mode == JSON:
+            end = buf.find(b'\n', pos)
+            if end < 0:
+                if len(buf) - pos > MAX_FRAME:
+                    raise ProtocolError("消息过长")
+                return None
+            self.pos = end + 1
+            line = bytes(buf[pos:end]).strip()
+            return json.loads(line) if line else self.next()
+        if len(buf) - pos < 4:
+            return None
+        size = _LEN.unpack_from(buf, pos)[0]
+        if size == 0 or size > MAX_FRAME:
+            raise ProtocolError(f"非法帧长度: {size}")
+        if len(buf) - pos - 4 < size:
+            return None
+        self.pos = pos + 4 + size
+        return decode_payload(bytes(buf[pos + 4:pos + 4 + size]))
+
+
+class MessageSocket:
+    """
+    阻塞 socket 的消息收发封装 (server.py / client.py 使用)
+
+    recv() 一次读入尽可能多的数据，连续到达的多条消息只需一次系统调用；
+    消息被拆成多次到达时也能正确拼接。
+    """
+    def __init__(self, sock, mode=JSON):
+        self.sock = sock
+        self.decoder = FrameDecoder(mode)
+
+    @property
+    def mode(self):
+        return self.decoder.mode
+
+    @mode.setter
+    def mode(self, mode):
+        if mode not in PROTOCOLS:
+            raise ProtocolError(f"不支持的协议: {mode}")
+        self.decoder.mode = mode
+
+    def send(self, msg):
+        self.sock.sendall(encode(msg, self.decoder.mode))
+
+    def next_buffered(self):
+        """取出缓冲区中的下一条完整消息，没有时返回 None (不读 socket，不会阻塞)"""
+        return self.decoder.next()
+
+    def fill(self):
+        """从 socket 读一次数据到缓冲区 (应在 socket 可读时调用，例如 selectors 通知之后)，连接关闭时抛出 ConnectionError"""
+        data = self.sock.recv(RECV_SIZE)
+        if not data:
+            raise ConnectionError("连接已关闭")
+        self.decoder.feed(data)
+
+    def recv(self):
+        """读取下一条消息，连接关闭时返回 None"""
+        while True:
+            msg = self.decoder.next()
+            if msg is not None:
+                return msg
+            data = self.sock.recv(RECV_SIZE)
+            if not data:
+                return None
+            self.decoder.feed(data)
+
+    def close(self):
+        try: self.sock.close()
+        except: pass
+
+
+async def read_message(reader, mode=JSON):
+    """从 asyncio.StreamReader 读取一条消息 (async_server.py 使用)，连接关闭时返回 None"""
+    if mode == JSON:
+        line = await reader.readline()
+        return json.loads(line) if line else None
+    try:
+        header = await reader.readexactly(4)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    size = _LEN.unpack(header)[0]
+    if size == 0 or size > MAX_FRAME:
+        raise ProtocolError(f"非法帧长度: {size}")
+    return decode_payload(await reader.readexactly(size))
+
@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import random
+import inspect
+import argparse
+import importlib
+import multiprocessing
+import mjx
+from mjx_logger import MjxGameRecorder, MjaiWriter
+from server import parse_player_id, obj_to_id
+
+# 🤖 无网络自我对局 (self-play)
+#
+# 与 server.py 的 run_game 相同的对局循环，但 4 个座位都是进程内的 Python 函数，
+# 没有 socket 往返，也没有 client.py 自动模式里的 sleep。多局分配到进程池并行执行，
+# 每个 worker 进程只创建一次 MjxEnv 并反复使用；结果 (顺位/得分) 汇总到主进程。
+#
+# 智能体 (agent) 的约定与客户端相同: agent(obs, legal_actions) -> 动作编号 (legal_actions 的下标)
+# 可以用名字指定内置智能体 (见 AGENTS)，也可以用 "模块:函数" 指定自己的实现。
+#
+# 用法:
+#   python selfplay.py --games 1000 --workers 8 --agents random,random,tsumogiri,tsumogiri
+#   python selfplay.py --games 100 --log-dir ./selfplay_logs     # 同时保存每局的 MJAI 日志
+
+# ⚙️ 配置
+NUM_GAMES = 100
+NUM_WORKERS = os.cpu_count()
+CHUNK_SIZE = 4
+AGENT_SPECS = ["random", "random", "random", "random"]
+PROGRESS_EVERY = 100
+
+
+# ------------------------------------------------------------
+# 内置智能体
+# ------------------------------------------------------------
+def random_agent(obs, legal_actions):
+    return random.randrange(len(legal_actions))
+
+
+def tsumogiri_agent(obs, legal_actions):
+    """能和就和，否则摸切，都不行就选第一个动作"""
+    types = [obj_to_id(act.type()) for act in legal_actions]
+    for wanted in (10, 9, 2):       # 自摸 / 荣 / 摸切
+        if wanted in types:
+            return types.index(wanted)
+    return 0
+
+
+AGENTS = {
+    "random": random_agent,
+    "tsumogiri": tsumogiri_agent,
+}
+
+
+def resolve_agent(spec):
+    """名字 / "模块:函数" / 可调用对象 -> 可调用对象"""
+    if callable(spec):
+        return spec
+    if spec in AGENTS:
+        return AGENTS[spec]
+    module, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"未知的智能体: {spec}")
+    return getattr(importlib.import_module(module), attr)
+
+
+def agent_name(spec):
+    return spec if isinstance(spec, str) else getattr(spec, "__name__", repr(spec))
+
+
+# ------------------------------------------------------------
+# 单局
+# ------------------------------------------------------------
+def _reset_takes_seed(env):
+    """env.reset 能否传入种子 (不同版本的 mjx 不同)；取不到签名时按可以处理"""
+    try:
+        params = inspect.signature(env.reset).parameters.values()
+    except (TypeError, ValueError):
+        return True
+    return any(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD, p.VAR_POSITIONAL) for p in params)
+
+
+def play_game(env, agents, seed=None, recorder=None):
+    """
+    用给定的 env 进行一局
+
+    Args:
+        agents: 4 个智能体，下标为座位
+        recorder: 可选的 MjxGameRecorder
+
+    Returns:
+        (回合数, 各座位得分列表 或 None)
+    """
+    random.seed(seed)
+    # 按签名决定调用方式，而不是捕获 TypeError (那样会吞掉 reset 内部抛出的 TypeError)
+    obs_dict = env.reset(seed) if seed is not None and _reset_takes_seed(env) else env.reset()
+
+    turns = 0
+    while obs_dict:
+        action_dict = {}
+        for player_key, obs in obs_dict.items():
+            legal_actions = obs.legal_actions()
+            if not legal_actions: continue
+            seat = parse_player_id(player_key)
+            choice_idx = agents[seat](obs, legal_actions)
+            if not 0 <= choice_idx < len(legal_actions): choice_idx = 0
+            chosen_action = legal_actions[choice_idx]
+            action_dict[player_key] = chosen_action
+            if recorder:
+                recorder.record_turn(seat, obs, legal_actions, chosen_action)
+        if not action_dict:
+            break
+        obs_dict = env.step(action_dict)
+        turns += 1
+
+    return turns, _final_rewards(env)
+
+
+def _final_rewards(env):
+    """终局得分 (mjx 的 rewards，按座位排列)，取不到时返回 None"""
+    try:
+        rewards = env.rewards()
+    except Exception:
+        return None
+    if not rewards:
+        return None
+    return [rewards.get(f"player_{seat}", 0) for seat in range(4)]
+
+
+def ranks_of(rewards):
+    """得分 -> 顺位 (1-4)，同分时座位靠前的在前"""
+    order = sorted(range(4), key=lambda s: (-rewards[s], s))
+    ranks = [0] * 4
+    for rank, seat in enumerate(order, 1):
+        ranks[seat] = rank
+    return ranks
+
+
+# ------------------------------------------------------------
+# worker 进程
+# ------------------------------------------------------------
+_env = None
+_agents = None
+_log_dir = None
+
+
+def _init_worker(agent_specs, log_dir):
+    global _env, _agents, _log_dir
+    _env = mjx.MjxEnv()
+    _agents = [resolve_agent(spec) for spec in agent_specs]
+    _log_dir = log_dir
+
+
+def run_one(task):
+    """worker 内执行一局: task = (局序号, 随机种子)"""
+    game_idx, seed = task
+    # 座位轮换: 第 g 局中座位 s 由第 (s + g) % 4 个智能体担任，消除座位带来的偏差
+    slots = [(seat + game_idx) % 4 for seat in range(4)]
+    seat_agents = [_agents[slot] for slot in slots]
+    # 保存日志时每条记录直接转换为 MJAI 写出，不保留 mjx 原始记录
+    log_path = os.path.join(_log_dir, f"game{game_idx:07d}.json") if _log_dir else None
+    writer = MjaiWriter(log_path) if log_path else None
+    recorder = MjxGameRecorder(sink=writer.feed) if writer else None
+
+    start = time.perf_counter()
+    try:
+        turns, rewards = play_game(_env, seat_agents, seed, recorder)
+    except Exception as e:
+        return {"game": game_idx, "seed": seed, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        if writer:
+            writer.close()
+    result = {
+        "game": game_idx,
+        "seed": seed,
+        "slots": slots,
+        "turns": turns,
+        "rewards": rewards,
+        "ranks": ranks_of(rewards) if rewards else None,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+    if log_path:
+        result["log"] = log_path
+    return result
+
+
+# ------------------------------------------------------------
+# 主进程: 分发与汇总
+# ------------------------------------------------------------
+class SelfPlayStats:
+    """按智能体 (AGENT_SPECS 中的位置) 汇总顺位与得分"""
+    def __init__(self, names):
+        self.names = names
+        self.games = 0
+        self.errors = 0
+        self.turns = 0
+        self.rank_counts = [[0] * 4 for _ in names]
+        self.reward_sum = [0.0] * len(names)
+
+    def add(self, result):
+        if "error" in result:
+            self.errors += 1
+            return
+        self.games += 1
+        self.turns += result["turns"]
+        if result["ranks"] is None:
+            return
+        for seat, slot in enumerate(result["slots"]):
+            self.rank_counts[slot][result["ranks"][seat] - 1] += 1
+            self.reward_sum[slot] += result["rewards"][seat]
+
+    def summary(self):
+        agents = []
+        for slot, name in enumerate(self.names):
+            n = sum(self.rank_counts[slot])
+            agents.append({
+                "slot": slot,
+                "agent": name,
+                "games": n,
+                "avg_rank": round(sum((r + 1) * c for r, c in enumerate(self.rank_counts[slot])) / n, 3) if n else None,
+                "rank_dist": self.rank_counts[slot],
+                "avg_reward": round(self.reward_sum[slot] / n, 3) if n else None,
+            })
+        return {"games": self.games, "errors": self.errors, "turns": self.turns, "agents": agents}
+
+
+def run_selfplay(num_games=NUM_GAMES, agent_specs=AGENT_SPECS, num_workers=NUM_WORKERS,
+                 chunk_size=CHUNK_SIZE, seed=0, log_dir=None, results_path=None):
+    """
+    并行进行 num_games 局自我对局，返回汇总结果
+
+    Args:
+        agent_specs: 4 个智能体 (名字 / "模块:函数" / 模块级函数)
+        log_dir: 保存每局 MJAI 日志的目录，None 表示不保存
+        results_path: 每局结果逐行写入的 JSONL 文件
+    """
+    if len(agent_specs) != 4:
+        raise ValueError("需要指定 4 个智能体")
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    stats = SelfPlayStats([agent_name(spec) for spec in agent_specs])
+    tasks = [(i, seed * 1_000_003 + i) for i in range(num_games)]
+    out = open(results_path, "w", encoding="utf-8") if results_path else None
+
+    start = time.perf_counter()
+    try:
+        if num_workers and num_workers > 1:
+            with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(agent_specs, log_dir)) as pool:
+                results = pool.imap_unordered(run_one, tasks, chunksize=chunk_size)
+                _collect(results, stats, out, start)
+        else:
+            _init_worker(agent_specs, log_dir)
+            _collect(map(run_one, tasks), stats, out, start)
+    finally:
+        if out:
+            out.close()
+
+    summary = stats.summary()
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    summary["games_per_s"] = round(stats.games / summary["seconds"], 2) if summary["seconds"] else None
+    return summary
+
+
+def _collect(results, stats, out, start):
+    for done, result in enumerate(results, 1):
+        stats.add(result)
+        if out:
+            out.write(json.dumps(result, separators=(',', ':')) + "\n")
+        if "error" in result:
+            print(f"[错误] 第 {result['game']} 局: {result['error']}")
+        if done % PROGRESS_EVERY == 0:
+            elapsed = time.perf_counter() - start
+            print(f"已完成 {done} 局 ({done / elapsed:.1f} 局/秒)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="无网络自我对局")
+    parser.add_argument("--games", type=int, default=NUM_GAMES)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--agents", default=",".join(AGENT_SPECS), help="4 个智能体，逗号分隔")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-dir", default=None, help="保存每局 MJAI 日志的目录")
+    parser.add_argument("--results", default=None, help="每局结果 JSONL 输出路径")
+    args = parser.parse_args()
+
+    summary = run_selfplay(args.games, args.agents.split(","), args.workers, CHUNK_SIZE,
+                           args.seed, args.log_dir, args.results)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
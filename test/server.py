@@ -1,14 +1,112 @@
+import sys
 import socket
-import json
+import selectors
 import mjx
 import time
-from mjx_logger import MjxGameRecorder, MjxToMjaiConverter # 引用新类
+from mjx_logger import MjxGameRecorder, MjxToMjaiConverter, MjaiWriter # 引用新类
+from protocol import MessageSocket, JSON, BINARY, describe_action, hand_codes
+from metrics import LatencyMetrics, NO_TIMER
+from event_stream import EventHub, SpectatorServer
 
 HOST = '127.0.0.1'
 PORT = 65432
+PROTOCOL = JSON     # 通信格式: json (按行) / binary (长度前缀 + 整数字段)，见 protocol.py
+TURN_TIMEOUT = 30.0 # 每回合等待玩家回复的时间预算 (秒)，超时使用默认动作
+FALLBACK_TYPES = (2,)   # 超时时优先选择的动作类型 (摸切)，都不合法时选第一个动作
+METRICS_PATH = "metrics.json"  # 各阶段耗时快照 (定期写出，对局结束时再写一次)；.prom 后缀输出 Prometheus 文本格式
+METRICS_EVERY = 10.0    # 定期写出间隔 (秒)
+SPECTATE_PORT = None    # 观战服务端口 (见 event_stream.py)，None 表示不开启
+DELTA_TURNS = True      # turn 消息只发送手牌的变化 (客户端用 protocol.HandMirror 还原)
+
+
+def obj_to_id(obj):
+    if obj is None: return None
+    if hasattr(obj, 'id'): return obj.id()
+    if hasattr(obj, 'value'): return obj.value
+    try: return int(obj)
+    except: return None
+
+
+def fallback_action_index(legal_actions):
+    """玩家超时时使用的默认动作"""
+    for i, act in enumerate(legal_actions):
+        if obj_to_id(act.type()) in FALLBACK_TYPES:
+            return i
+    return 0
+
+
+def parse_player_id(player_key):
+    try: return int(player_key.split('_')[-1])
+    except: return 0
+
+
+class TurnEncoder:
+    """
+    构建发给某个座位的 turn 消息，阻塞服务器与 async_server 共用 (每局每个座位一个)
+
+    compact=True 时 actions 为 [动作类型, 牌ID] (binary 协议)，否则为查表得到的描述文字；
+    delta=True 时记住上次发给该座位的手牌，之后只发送 add / remove (见 protocol.py)，
+    否则每次都发送完整手牌 (compact 时为排好序的牌ID，否则为牌代码)。
+    """
+    def __init__(self, compact=False, delta=DELTA_TURNS):
+        self.compact = compact
+        self.delta = delta
+        self.hand = None            # 上次发送的手牌 (牌ID 集合)
+
+    def reset(self):
+        self.hand = None
+
+    def build(self, obs, legal_actions, timer=NO_TIMER):
+        """timer: LatencyMetrics.timer() 返回的函数，分别记录 actions / hand 两个阶段的耗时"""
+        with timer("actions"):
+            if self.compact:
+                actions = [[obj_to_id(act.type()), obj_to_id(act.tile())] for act in legal_actions]
+            else:
+                actions = [describe_action(obj_to_id(act.type()), obj_to_id(act.tile())) for act in legal_actions]
+
+        with timer("hand"):
+            hand = set()
+            try:
+                hand = {tid for tid in map(obj_to_id, obs.curr_hand().closed_tiles()) if tid is not None}
+            except: pass
+            payload = {"type": "turn"}
+            last = self.hand
+            if self.delta:
+                self.hand = hand
+                if last is not None:
+                    add, remove = hand - last, last - hand
+                    # 换局等变化比整手牌还多时直接发送完整手牌
+                    if len(add) + len(remove) < len(hand):
+                        payload["add"] = sorted(add)
+                        payload["remove"] = sorted(remove)
+                        last = hand
+                if last is not hand:
+                    payload["hand"] = sorted(hand)
+            elif self.compact:
+                payload["hand"] = sorted(hand)
+            else:
+                # 手牌显示 (仅视觉)
+                payload["hand"] = hand_codes(sorted(hand))
+                payload["info"] = "Playing"
+        payload["actions"] = actions
+        return payload
+
+
+def build_turn_payload(obs, legal_actions, compact=False, timer=NO_TIMER):
+    """构建完整 (不带增量) 的 turn 消息"""
+    return TurnEncoder(compact, delta=False).build(obs, legal_actions, timer)
 
 class MahjongServer:
-    def __init__(self):
+    def __init__(self, protocol=PROTOCOL, turn_timeout=TURN_TIMEOUT, metrics_path=METRICS_PATH,
+                 spectate_port=SPECTATE_PORT, delta=DELTA_TURNS):
+        self.protocol = protocol
+        self.delta = delta
+        self.turn_timeout = turn_timeout
+        self.seq = 0
+        self.think_times = [[], [], [], []]   # 每个座位每次决策的思考时间 (秒)
+        self.timeouts = [0, 0, 0, 0]
+        # 每回合各阶段耗时 (只有一桌，桌号固定为 0)
+        self.metrics = LatencyMetrics(export_path=metrics_path, export_every=METRICS_EVERY)
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server_socket.bind((HOST, PORT))
@@ -16,118 +114,183 @@ class MahjongServer:
         self.clients = [] 
         
         # 实例化记录器和转换器
-        self.recorder = MjxGameRecorder()
+        # 对局中每条记录同时转换为 MJAI 并写入 game_log.json，结束后不需要再读回记录文件转换
         self.converter = MjxToMjaiConverter()
-        self.tile_converter = self.converter.tile_cache 
-        
-        self.action_type_map = {
-            1: "切牌(手切)", 2: "切牌(摸切)", 3: "立直", 
-            4: "吃", 5: "碰", 6: "暗杠", 7: "明杠", 8: "加杠", 
-            9: "荣", 10: "自摸", 11: "流局"
-        }
+        self.mjai_writer = MjaiWriter("game_log.json", converter=self.converter)
+        self.recorder = MjxGameRecorder("mjx_record.jsonl", sink=self._on_record)
+        # 观战: MJAI 事件同时推送到事件流，观战服务在后台线程中运行
+        self.hub = None
+        if spectate_port:
+            self.hub = EventHub()
+            self.events = self.hub.open(0)
+            SpectatorServer(self.hub, HOST, spectate_port).start_in_thread()
+
+    def _on_record(self, record):
+        """recorder 的 sink: 转换为 MJAI 事件，写入 game_log.json 并推送给观战者"""
+        for event in self.converter.feed(record):
+            self.mjai_writer.write(event)
+            if self.hub:
+                self.events.publish(event)
 
     def wait_for_players(self):
         print(f"🀄 服务器启动 {HOST}:{PORT}，等待 4 名玩家加入...")
         while len(self.clients) < 4:
             conn, addr = self.server_socket.accept()
             print(f"玩家 {len(self.clients)} 已连接: {addr}")
-            conn.sendall(json.dumps({"type": "hello", "player_id": len(self.clients)}).encode() + b'\n')
-            self.clients.append(conn)
+            # hello 总是按行 JSON 发送，之后切换到声明的协议
+            stream = MessageSocket(conn)
+            stream.send({"type": "hello", "player_id": len(self.clients), "protocol": self.protocol,
+                         "delta": self.delta})
+            stream.mode = self.protocol
+            self.clients.append(stream)
         print(">>> 4人集结完毕，对局开始！ <<<")
 
     def _parse_player_id(self, player_key):
-        try: return int(player_key.split('_')[-1])
-        except: return 0
+        return parse_player_id(player_key)
+
+    def collect_actions(self, requests, timeout):
+        """
+        并发等待多个玩家的回复
+
+        Args:
+            requests: {座位: (player_key, obs, legal_actions, seq)}，turn 消息已经发出
+            timeout: 本回合的时间预算 (秒)，所有座位共用同一个截止时间
+        Returns:
+            {座位: (动作编号, 思考时间秒, 是否超时)}
+        """
+        start = time.perf_counter()
+        deadline = start + timeout
+        results = {}
+        pending = set(requests)
+        sel = selectors.DefaultSelector()
+        for seat in pending:
+            sel.register(self.clients[seat].sock, selectors.EVENT_READ, seat)
+        try:
+            while pending:
+                # 先取出缓冲区中已有的消息 (一次 recv 可能读到多条)
+                for seat in list(pending):
+                    stream = self.clients[seat]
+                    while seat in pending:
+                        resp = stream.next_buffered()
+                        if resp is None:
+                            break
+                        # 上一回合超时后才到达的旧回复，丢弃
+                        if resp.get("seq", requests[seat][3]) != requests[seat][3]:
+                            continue
+                        legal_actions = requests[seat][2]
+                        choice_idx = resp.get("act_idx", 0)
+                        if not 0 <= choice_idx < len(legal_actions): choice_idx = 0
+                        results[seat] = (choice_idx, time.perf_counter() - start, False)
+                        self.metrics.observe("wait", results[seat][1], seat=seat)
+                        pending.discard(seat)
+                        sel.unregister(stream.sock)
+                if not pending:
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                for key, _ in sel.select(remaining):
+                    with self.metrics.span("recv", seat=key.data):
+                        self.clients[key.data].fill()
+        finally:
+            sel.close()
+
+        for seat in pending:
+            results[seat] = (fallback_action_index(requests[seat][2]), timeout, True)
+            self.metrics.observe("wait", timeout, seat=seat)
+        return results
 
     def _obj_to_id(self, obj):
-        if obj is None: return None
-        if hasattr(obj, 'id'): return obj.id()
-        if hasattr(obj, 'value'): return obj.value
-        try: return int(obj)
-        except: return None
+        return obj_to_id(obj)
 
     def run_game(self):
         print(f"正在初始化 MjxEnv 环境...")
         env = mjx.MjxEnv()
         obs_dict = env.reset()
+        # 每个座位一个 turn 消息编码器 (记住上次发送的手牌)
+        encoders = [TurnEncoder(compact=self.protocol == BINARY, delta=self.delta) for _ in range(4)]
 
         print("游戏开始！")
 
         # 循环条件：只要有 obs 返回，说明游戏还在进行
         while obs_dict:
-            action_dict = {}
-
-            for player_key, obs in obs_dict.items():
-                player_id = self._parse_player_id(player_key)
-                legal_actions = obs.legal_actions()
-                
-                if not legal_actions: continue
-                
-                # --- 通信逻辑 ---
-                # 构建 actions 描述
-                action_descriptions = []
-                for act in legal_actions:
-                    raw_type = self._obj_to_id(act.type())
-                    type_str = self.action_type_map.get(raw_type, str(raw_type))
-                    tile_str = self.tile_converter.get(self._obj_to_id(act.tile()), "")
-                    action_descriptions.append(f"[{type_str}] {tile_str}")
-
-                # 手牌显示 (仅视觉)
-                hand_str = []
-                try:
-                    curr_hand = obs.curr_hand()
-                    closed = curr_hand.closed_tiles()
-                    tids = sorted([self._obj_to_id(t) for t in closed if self._obj_to_id(t) is not None])
-                    hand_str = [self.tile_converter.get(t, "??") for t in tids]
-                except: pass
-
-                # 发送给 Client
-                payload = {
-                    "type": "turn",
-                    "hand": hand_str,
-                    "actions": action_descriptions,
-                    "info": "Playing" 
-                }
-                conn = self.clients[player_id]
-                try:
-                    conn.sendall(json.dumps(payload).encode() + b'\n')
-                    data = conn.recv(1024).strip()
-                    if not data: return
-
-                    resp = json.loads(data.decode())
-                    choice_idx = resp.get("act_idx", 0)
-                    if choice_idx >= len(legal_actions): choice_idx = 0
+            turn_start = time.perf_counter()
+            # --- 通信逻辑 ---
+            # 1. 先把 turn 消息发给所有需要决策的玩家 (例如同时可以荣/碰/吃的几家)
+            requests = {}
+            try:
+                for player_key, obs in obs_dict.items():
+                    player_id = self._parse_player_id(player_key)
+                    legal_actions = obs.legal_actions()
                     
-                    chosen_action = legal_actions[choice_idx]
-                    action_dict[player_key] = chosen_action
+                    if not legal_actions: continue
+                    
+                    # 构建 actions 描述与手牌，发送给 Client
+                    self.seq += 1
+                    timer = self.metrics.timer(seat=player_id)
+                    payload = encoders[player_id].build(obs, legal_actions, timer)
+                    payload["seq"] = self.seq
+                    with timer("send"):
+                        self.clients[player_id].send(payload)
+                    requests[player_id] = (player_key, obs, legal_actions, self.seq)
+
+                # 2. 同时等待所有玩家回复，超时的玩家使用默认动作
+                choices = self.collect_actions(requests, self.turn_timeout)
+            except (ConnectionError, OSError) as e:
+                print(f"Error: {e}")
+                break
 
-                    # === 核心修改：记录原生数据 ===
-                    # 在这里我们不转换 MJAI，只存 mjx 对象的信息
-                    self.recorder.record_turn(player_id, obs, legal_actions, chosen_action)
+            action_dict = {}
+            for player_id, (player_key, obs, legal_actions, _) in requests.items():
+                choice_idx, think, timed_out = choices[player_id]
+                chosen_action = legal_actions[choice_idx]
+                action_dict[player_key] = chosen_action
+                self.think_times[player_id].append(think)
+                if timed_out:
+                    self.timeouts[player_id] += 1
+                    print(f"[超时] P{player_id} 未在 {self.turn_timeout}s 内回复，使用默认动作")
 
-                except Exception as e:
-                    print(f"Error P{player_id}: {e}")
-                    break
+                # === 核心修改：记录原生数据 ===
+                # 在这里我们不转换 MJAI，只存 mjx 对象的信息
+                with self.metrics.span("record", seat=player_id):
+                    self.recorder.record_turn(player_id, obs, legal_actions, chosen_action,
+                                              think_ms=round(think * 1000, 2))
 
             if action_dict:
-                obs_dict = env.step(action_dict)
+                with self.metrics.span("step"):
+                    obs_dict = env.step(action_dict)
             else:
                 break
+            self.metrics.observe("turn", time.perf_counter() - turn_start)
+            self.metrics.maybe_export()
 
         print("游戏结束！")
+        for player_id, times in enumerate(self.think_times):
+            if times:
+                print(f"P{player_id} 思考时间: 平均 {sum(times) / len(times) * 1000:.1f}ms，"
+                      f"最长 {max(times) * 1000:.1f}ms，超时 {self.timeouts[player_id]} 次")
+        self.metrics.print_summary()
+        if self.metrics.export_path:
+            print(f"[Metrics] 各阶段耗时已保存: {self.metrics.export()}")
         
-        # === 核心修改：两步走保存 ===
-        # 1. 保存 mjx 原生记录
-        self.recorder.save_mjx("mjx_record.json")
-        
-        # 2. 转换为 MJAI 格式
-        self.converter.convert("mjx_record.json", "game_log.json")
+        # === 保存 ===
+        # mjx 原生记录与 MJAI 日志在对局中都已流式写入，这里写出最后一批
+        self.recorder.close()
+        self.mjai_writer.close()
+        print("[Converter] MJAI 日志已保存: game_log.json")
+        if self.hub:
+            self.hub.close(0)
 
-        for conn in self.clients:
-            try: conn.close()
+        for stream in self.clients:
+            try: stream.send({"type": "game_over", "next": False})
             except: pass
+            stream.close()
 
 if __name__ == "__main__":
-    server = MahjongServer()
+    # 使用方法: python server.py [json/binary] [metrics.json / metrics.prom] [观战端口]
+    protocol = sys.argv[1] if len(sys.argv) > 1 else PROTOCOL
+    metrics_path = sys.argv[2] if len(sys.argv) > 2 else METRICS_PATH
+    spectate_port = int(sys.argv[3]) if len(sys.argv) > 3 else SPECTATE_PORT
+    server = MahjongServer(protocol=protocol, metrics_path=metrics_path, spectate_port=spectate_port)
     server.wait_for_players()
     server.run_game()
\ No newline at end of file